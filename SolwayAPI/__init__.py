@@ -1,12 +1,30 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from SolwayAPI.api.v1.api import api_router
 from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.core.clients import close_clients
+from SolwayAPI.api.v1.resources.jobs import start_job_workers, stop_job_workers
+
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    """ 
+    starts the background pipeline job workers, 
+    and releases them and the shared, pooled clients when the worker shuts down 
+    """
+    await start_job_workers()
+    yield
+    await stop_job_workers()
+    await close_clients()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.PROJECT_VERSION,
-    tags=['main']
+    tags=['main'],
+    lifespan=lifespan
 )
 
 app.include_router(api_router)
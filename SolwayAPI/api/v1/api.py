@@ -2,6 +2,7 @@ from fastapi import APIRouter
 
 from SolwayAPI.api.v1.resources import(
     pipe,
+    jobs,
     artifacts,
     skillchain,
     blobstorage,
@@ -19,6 +20,13 @@ api_router.include_router(
 )
 
 
+api_router.include_router(
+    jobs.router, 
+    prefix="/pipeline/jobs", 
+    tags=["pipeline-jobs"]
+)
+
+
 api_router.include_router(
     artifacts.router, 
     prefix="/artifacts", 
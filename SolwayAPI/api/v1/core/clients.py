@@ -1,23 +1,123 @@
 # import dropbox
 
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
 import voyageai
 from openai import AsyncOpenAI
 
-from azure.storage.blob import BlobServiceClient
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob.aio import BlobServiceClient
 
 from .config import settings
+from .utils.notion_api_helpers import NotionClient, NOTION_RETRYABLE_ERRORS
+from .utils.retry_helpers import RetryPolicy
+from .utils.rate_limit_helpers import (
+    AIMDConcurrencyLimiter,
+    OpenAIRateLimiter
+)
+
+
+_blob_service_client = None
+_process_pool = None
+_openai_rate_limiter = None
+_notion_client = None
+
 
 def get_openai_client():
+    # retries are handled by retry_helpers, so the sdk's own retries are turned off
     return AsyncOpenAI(
-        api_key=settings.OPENAI_API_KEY
+        api_key=settings.OPENAI_API_KEY,
+        max_retries=0
     )
 
+def get_openai_rate_limiter():
+    """ the limiter every OpenAI request in the process goes through """
+    global _openai_rate_limiter
+    if _openai_rate_limiter is None:
+        _openai_rate_limiter = OpenAIRateLimiter(
+            requests_per_minute=settings.OPENAI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.OPENAI_TOKENS_PER_MINUTE,
+            concurrency=AIMDConcurrencyLimiter(
+                initial=settings.OPENAI_INITIAL_CONCURRENCY,
+                maximum=settings.OPENAI_MAX_CONCURRENCY
+            )
+        )
+    return _openai_rate_limiter
+
+def get_notion_client():
+    """ the process wide notion client, its connection pool and rate limit are shared by every request """
+    global _notion_client
+    if _notion_client is None:
+        _notion_client = NotionClient(
+            api_key=settings.NOTION_API_KEY,
+            base_url=settings.NOTION_API_URL,
+            version=settings.NOTION_VERSION,
+            requests_per_second=settings.NOTION_REQUESTS_PER_SECOND,
+            max_connections=settings.NOTION_MAX_CONNECTIONS,
+            timeout=settings.NOTION_TIMEOUT,
+            retry_policy=RetryPolicy(
+                max_attempts=settings.NOTION_MAX_ATTEMPTS,
+                attempt_timeout=settings.NOTION_TIMEOUT,
+                deadline=None,
+                retry_on=NOTION_RETRYABLE_ERRORS
+            )
+        )
+    return _notion_client
+
 def get_voyage_client():
     return voyageai.Client(api_key=settings.VOYAGE_API_KEY)
 
 
-def get_blob_storage_client():
-    return BlobServiceClient.from_connection_string(settings.BLOB_STORAGE_CONN_STRING)
+async def get_blob_storage_client():
+    """
+    returns the process wide async blob service client,
+    every request shares its pooled aiohttp connections
+    """
+    global _blob_service_client
+    if _blob_service_client is None:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.BLOB_CONNECTION_POOL_SIZE)
+        )
+        _blob_service_client = BlobServiceClient.from_connection_string(
+            settings.BLOB_STORAGE_CONN_STRING,
+            transport=AioHttpTransport(session=session),
+            max_single_get_size=settings.BLOB_MAX_SINGLE_GET_SIZE,
+            max_chunk_get_size=settings.BLOB_MAX_CHUNK_GET_SIZE,
+        )
+    return _blob_service_client
+
+
+def get_process_pool():
+    """
+    returns the process pool used for cpu bound work such as pdf extraction,
+    workers are spawned rather than forked so they do not inherit the event loop
+    """
+    global _process_pool
+    if _process_pool is None and settings.PDF_PARSE_WORKERS > 1:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _process_pool
+
+
+async def close_clients():
+    """ closes the shared clients, called when the app shuts down """
+    global _blob_service_client, _process_pool, _notion_client
+    if _blob_service_client is not None:
+        await _blob_service_client.close()
+        _blob_service_client = None
+
+    if _notion_client is not None:
+        await _notion_client.aclose()
+        _notion_client = None
+
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
 
 
 # def get_dropbox_client():
@@ -27,10 +27,85 @@ class Settings:
     BLOB_STORAGE_CONN_STRING = os.getenv("BLOB_STORAGE_STRING")
     BLOB_STORAGE_CONTAINER_NAME = os.getenv("BLOB_STORAGE_CONTAINER_NAME")
 
+    # OpenAI Rate Limits
+    OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500))
+    OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 800000))
+    OPENAI_INITIAL_CONCURRENCY = int(os.getenv("OPENAI_INITIAL_CONCURRENCY", 8))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 64))
+    OPENAI_EXPECTED_OUTPUT_TOKENS = 2048
+
+    # LLM Retries
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 6))
+    LLM_BACKOFF_BASE = 1.0
+    LLM_BACKOFF_MAX = 60.0
+    LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", 300))
+    LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", 900))
+
+    # Blob Transfers
+    BLOB_CONNECTION_POOL_SIZE = int(os.getenv("BLOB_CONNECTION_POOL_SIZE", 100))
+    BLOB_MAX_CONCURRENCY = int(os.getenv("BLOB_MAX_CONCURRENCY", 4))
+    BLOB_MAX_SINGLE_GET_SIZE = 8 * 1024 * 1024
+    BLOB_MAX_CHUNK_GET_SIZE = 4 * 1024 * 1024
+
 
     TMP_FOLDER = "artifacts"
     CONTEXT_FILE_NAME = "context.json"
+    RESEARCH_ANSWERS_FILE_NAME = "research_questions.json"
     INDEX_FILE_NAME = "index.json"
+    INDEX_FOLDER = "index"
+    INDEX_MANIFEST_NAME = "manifest.json"
+    INDEX_SEGMENTS_FOLDER = "segments"
+    INDEX_COMMIT_ATTEMPTS = 10
+    INDEX_CONCURRENCY = int(os.getenv("INDEX_CONCURRENCY", 8))
+    INDEX_EMBED_BATCH_SIZE = int(os.getenv("INDEX_EMBED_BATCH_SIZE", 100))
+
+    # Approximate Nearest Neighbours
+    INDEX_ANN_NAME = "ivf.npz"
+    ANN_THRESHOLD = int(os.getenv("ANN_THRESHOLD", 50000))
+    ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", 32))
+    ANN_REBUILD_GROWTH = 0.25
+
+    # Retrieval
+    RAG_CONCURRENCY = int(os.getenv("RAG_CONCURRENCY", 8))
+
+    # Completion Cache
+    COMPLETION_CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+    COMPLETIONS_FOLDER = "completions"
+
+    # Retriever Cache
+    RETRIEVER_CACHE_MAX_BYTES = int(os.getenv("RETRIEVER_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+    # PDF Parsing
+    PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", os.cpu_count() or 1))
+    PDF_PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", 50))
+
+    # Pipeline Jobs
+    PIPELINE_MANIFEST_NAME = "pipeline_manifest.json"
+    JOBS_FOLDER = "jobs"
+    PIPELINE_JOB_WORKERS = int(os.getenv("PIPELINE_JOB_WORKERS", 1))
+    PIPELINE_JOB_HEARTBEAT_INTERVAL = float(os.getenv("PIPELINE_JOB_HEARTBEAT_INTERVAL", 60))
+    PIPELINE_JOB_STALE_AFTER = float(os.getenv("PIPELINE_JOB_STALE_AFTER", 300))
+    # container level folder of markers for the jobs not yet finished, the workers of every instance recover jobs from it
+    PENDING_JOBS_FOLDER = "pending-jobs"
+    PIPELINE_DOCUMENT_CONCURRENCY = int(os.getenv("PIPELINE_DOCUMENT_CONCURRENCY", 8))
+
+    # Notion
+    NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1")
+    NOTION_VERSION = "2022-06-28"
+    NOTION_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", 3))
+    NOTION_MAX_CONNECTIONS = int(os.getenv("NOTION_MAX_CONNECTIONS", 10))
+    NOTION_MAX_ATTEMPTS = int(os.getenv("NOTION_MAX_ATTEMPTS", 6))
+    NOTION_TIMEOUT = float(os.getenv("NOTION_TIMEOUT", 30))
+
+    # Server Sent Events
+    # the functions ASGI wrapper buffers a response body until it is complete, so the stream endpoints are only
+    # served when the app runs behind a streaming ASGI server such as uvicorn, progress on functions is polled from /pipeline/jobs
+    SSE_ENABLED = os.getenv("SSE_ENABLED", "false").lower() == "true"
+    SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", 15))
+
+    # Parsed Document Cache
+    PARSED_FOLDER = "parsed"
+    PARSED_CACHE_MAX_BYTES = int(os.getenv("PARSED_CACHE_MAX_BYTES", 256 * 1024 * 1024))
 
 
     AGENT_INTERNALS = { 
@@ -72,7 +147,8 @@ class Settings:
             role=role,
             instructions=summarization,
             contiguous_on='',
-            output=''
+            output='',
+            reduce_strategy='llm'
         ),
 
         Skill(
@@ -80,7 +156,8 @@ class Settings:
             role=role,
             instructions=figures_toc,
             contiguous_on='',
-            output=''
+            output='',
+            reduce_strategy='llm'
         ),
 
         Skill(
@@ -88,7 +165,8 @@ class Settings:
             role=role,
             instructions=action_items,
             contiguous_on='',
-            output=''
+            output='',
+            reduce_strategy='concat'
         ),
 
         Skill(
@@ -96,7 +174,8 @@ class Settings:
             role=role,
             instructions=keypoints,
             contiguous_on='',
-            output=''
+            output='',
+            reduce_strategy='llm'
         ),
 
         Skill(
@@ -104,7 +183,8 @@ class Settings:
             role=role,
             instructions=quotes,
             contiguous_on='keypoints',
-            output=''
+            output='',
+            reduce_strategy='concat'
         ),
 
     ]
@@ -113,5 +193,13 @@ class Settings:
     FOUNDATION_MODEL = 'gpt-4o'
     NAIVE_CHUNK_THRESHOLD = 32000
 
+    MODEL_CONTEXT_WINDOWS = {
+        'gpt-4o': 128000,
+        'gpt-4o-mini': 128000,
+        'gpt-4-turbo': 128000,
+    }
+    SKILL_OUTPUT_TOKENS = 4096
+    MAX_CHUNK_TOKENS = 40000
+
 
 settings = Settings()
\ No newline at end of file
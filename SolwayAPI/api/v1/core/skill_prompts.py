@@ -60,9 +60,23 @@ UNDER NO CIRCUMSTANCES PROVIDE ANY INFORMATION THAT IS NOT INCLUDED IN THE DOCUM
 Take a deep breath, now begin."""
 
 
+# where the research question goes in rq_answering, it is filled in after the agent internals are populated
+RESEARCH_QUESTION_SLOT = "{research_question}"
+
 rq_answering = """Your Primary task is to help create this "#". 
 To do this, You will receive excerpts from pertinent documents provided by stakeholders in the #.
-Use these documents, along with your wisdom and knowledge of the world to answer the following Research Question:\n\n?\n\n 
+Use these documents, along with your wisdom and knowledge of the world to answer the following Research Question:\n\n{research_question}\n\n 
 If you use information from a particular document, please provide the document's name and page number. 
 Additionally, Keep in mind the following thematic areas while generating your response: \n & \n\n
 Take a deep breath, now begin."""
+
+
+reduce = """
+
+You previously completed the task above on consecutive portions of one long document, one response per portion. 
+You will now receive those partial responses, in document order, separated by "!!! PARTIAL RESPONSE !!!" markers. 
+Merge them into a single, coherent response to the task, as if you had read the whole document at once. 
+Remove repetition between portions, keep every distinct point, and keep all page number references and verbatim quotations exactly as they appear. 
+Do not mention that the document was split into portions. 
+UNDER NO CIRCUMSTANCES ADD INFORMATION THAT IS NOT INCLUDED IN THE PARTIAL RESPONSES. 
+Take a deep breath, now begin."""
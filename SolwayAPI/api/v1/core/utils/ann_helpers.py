@@ -0,0 +1,140 @@
+import io
+import math
+
+from typing import List, Optional
+
+import numpy as np
+
+from .index_helpers import normalize_rows
+
+
+def assign_to_centroids(vectors:np.ndarray, centroids:np.ndarray, batchsize:int=8192) -> np.ndarray:
+    """ index of the most similar centroid for each unit length vector, computed in batches to bound memory """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batchsize):
+        assignments[start:start+batchsize] = np.argmax(vectors[start:start+batchsize] @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors:np.ndarray, n_clusters:int, n_iter:int=15, sample_size:int=50000, seed:int=0) -> np.ndarray:
+    """
+    k-means on unit length vectors with cosine similarity, fitted on a random sample
+    returns the (n_clusters, d) unit length centroids
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_clusters)
+        occupied = np.flatnonzero(counts)
+
+        # sums of the members of each occupied cluster, in one pass over the sorted vectors
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[occupied]
+        centroids[occupied] = np.add.reduceat(vectors[order], starts, axis=0)
+
+        # empty clusters are re-seeded on random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+
+        centroids = normalize_rows(centroids)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    inverted file index, every vector is filed under its nearest k-means centroid
+    a search only scores the vectors filed under the n_probe centroids closest to the query
+    segments names the stored blocks of vectors the rows were filed from, in order, None when that is not known
+    """
+
+    def __init__(self, centroids:np.ndarray, assignments:np.ndarray, segments:Optional[List[str]]=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.segments = list(segments) if segments is not None else None
+        self._build_lists()
+
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+
+    def _build_lists(self) -> None:
+        """ orders the vector ids by list, so each list is a contiguous slice of self.order """
+        self.order = np.argsort(self.assignments, kind='stable')
+        self.offsets = np.searchsorted(self.assignments[self.order], np.arange(len(self.centroids) + 1))
+
+
+    @classmethod
+    def build(
+            cls, 
+            vectors, 
+            n_lists:Optional[int]=None, 
+            n_iter:int=15, 
+            sample_size:int=50000, 
+            seed:int=0, 
+            segments:Optional[List[str]]=None
+        ) -> "IVFIndex":
+        """ fits the centroids and files every vector, n_lists defaults to sqrt(N) """
+        vectors = normalize_rows(vectors)
+        n_lists = n_lists or max(1, int(math.sqrt(len(vectors))))
+        centroids = spherical_kmeans(vectors, n_lists, n_iter=n_iter, sample_size=sample_size, seed=seed)
+        return cls(centroids, assign_to_centroids(vectors, centroids), segments)
+
+
+    def add(self, vectors:np.ndarray, segments:Optional[List[str]]=None) -> "IVFIndex":
+        """ files new unit length vectors under the fitted centroids, after the vectors already in the index """
+        if len(vectors):
+            self.assignments = np.concatenate([self.assignments, assign_to_centroids(vectors, self.centroids)])
+            self._build_lists()
+        if self.segments is not None and segments is not None:
+            self.segments.extend(segments)
+        return self
+
+
+    def extend(self, vectors:np.ndarray) -> "IVFIndex":
+        """ files the rows of the full unit length vectors that were added after the index was last written """
+        return self.add(vectors[len(self):]) if len(vectors) > len(self) else self
+
+
+    def search(self, vectors:np.ndarray, queries:np.ndarray, top_n:int, n_probe:int) -> List[np.ndarray]:
+        """
+        approximate top_n for each unit length query, most similar first
+        vectors are the unit length rows the index was built from
+        """
+        n_probe = min(n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+
+        results = []
+        for query, probe in zip(queries, probes):
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c+1]] for c in probe])
+            scores = vectors[candidates] @ query
+            if len(candidates) > top_n:
+                best = np.argpartition(-scores, top_n - 1)[:top_n]
+                candidates, scores = candidates[best], scores[best]
+            results.append(candidates[np.argsort(-scores)])
+        return results
+
+
+    def to_bytes(self) -> bytes:
+        arrays = {"centroids": self.centroids, "assignments": self.assignments}
+        if self.segments is not None:
+            arrays["segments"] = np.array(self.segments, dtype=str)
+        with io.BytesIO() as f:
+            np.savez(f, **arrays)
+            return f.getvalue()
+
+
+    @classmethod
+    def from_bytes(cls, data:bytes) -> "IVFIndex":
+        """ indexes written before segments were recorded are read with segments None """
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            segments = arrays['segments'].tolist() if 'segments' in arrays.files else None
+            return cls(arrays['centroids'], arrays['assignments'], segments)
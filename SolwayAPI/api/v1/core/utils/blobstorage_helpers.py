@@ -1,13 +1,16 @@
 import io
 import os
+import asyncio
 import re
 import json
 
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+
+from concurrent.futures import Executor
 
 from pypdf import PdfReader
 
-import tiktoken
+from .tokenizer_helpers import DEFAULT_ENCODING, count_tokens, count_tokens_batch
 
 
 def get_file_extension(filename):
@@ -21,6 +24,13 @@ def get_file_name(path):
     return Path(path).name
 
 
+def get_parsed_document_name(blob_name:str, tmp_folder:str, parsed_folder:str) -> str:
+    """ path of the sidecar blob holding the parsed contents of a source document """
+    path = PurePosixPath(blob_name)
+    parent = '' if str(path.parent) == '.' else f"{path.parent}/"
+    return f"{parent}{tmp_folder}/{parsed_folder}/{path.stem}.json"
+
+
 def normalize_path(raw_parent:str, raw_child:str):
     """
     """
@@ -30,11 +40,9 @@ def normalize_path(raw_parent:str, raw_child:str):
     return path.rstrip('/')
 
 
-def num_tokens_from_string(string:str, encoding_name:str='cl100k_base') -> int:
+def num_tokens_from_string(string:str, encoding_name:str=DEFAULT_ENCODING) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+    return count_tokens(string, encoding_name)
 
 
 def clean_text(text):
@@ -43,23 +51,66 @@ def clean_text(text):
     return re.sub(r'[^\w\s,.!?\'"()\-:;]', '',stripped_text)
 
 
+def parse_page_range(stream:bytes, start:int, stop:int) -> list:
+    """
+        extracts the pages in [start, stop) of a pdf
+        module level so it can be pickled and run inside a worker process
+    """
+    with io.BytesIO(stream) as f:
+        reader = PdfReader(f)
+        page_texts = [clean_text(reader.pages[page_num].extract_text()) for page_num in range(start, stop)]
+
+    return [
+        {"textIN": page_text, "numTokens": num_tokens} 
+        for page_text, num_tokens in zip(page_texts, count_tokens_batch(page_texts))
+    ]
+
+
+def count_pdf_pages(stream:bytes) -> int:
+    """ number of pages in a pdf, only reads the document structure """
+    with io.BytesIO(stream) as f:
+        return len(PdfReader(f).pages)
+
+
+def split_page_range(num_pages:int, num_splits:int) -> list:
+    """ splits the pages of a document into at most num_splits contiguous (start, stop) ranges """
+    num_splits = max(1, min(num_splits, num_pages))
+    step, remainder = divmod(num_pages, num_splits)
+    ranges, start = [], 0
+    for split in range(num_splits):
+        stop = start + step + (1 if split < remainder else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
 def parse_pdf(stream) -> dict:
     """
         parses a pdf
         returns a dictionary where each key is a page number, and each value is a dictionary containing the pages raw text
         and the number of tokens
     """
-    pdf_text = {}
-    with io.BytesIO(stream) as f:
-        reader = PdfReader(f)
-        for page_num in range(len(reader.pages)):
-            page_text = clean_text(reader.pages[page_num].extract_text())
-            pdf_text[page_num+1] = {
-                "textIN": page_text,
-                "numTokens": num_tokens_from_string(page_text)
-            }
-            
-    return pdf_text
+    pages = parse_page_range(stream, 0, count_pdf_pages(stream))
+    return {page_num+1: page for page_num, page in enumerate(pages)}
+
+
+async def parse_pdf_parallel(stream:bytes, executor:Executor=None, page_threshold:int=50, num_workers:int=1) -> dict:
+    """
+        parses a pdf off the event loop, same output as parse_pdf
+        documents with at least page_threshold pages are split into page ranges and extracted across the executor's processes,
+        smaller ones stay on the single threaded path
+    """
+    num_pages = await asyncio.to_thread(count_pdf_pages, stream)
+    if executor is None or num_pages < page_threshold or num_workers < 2:
+        return await asyncio.to_thread(parse_pdf, stream)
+
+    loop = asyncio.get_running_loop()
+    page_ranges = await asyncio.gather(*[
+        loop.run_in_executor(executor, parse_page_range, stream, start, stop) 
+        for start, stop in split_page_range(num_pages, num_workers)
+    ])
+    pages = [page for page_range in page_ranges for page in page_range]
+    return {page_num+1: page for page_num, page in enumerate(pages)}
 
 
 def parse_files(raw_files:dict) -> dict:
@@ -0,0 +1,150 @@
+import sys
+import json
+import hashlib
+import logging
+
+from collections import OrderedDict
+
+from typing import Any, Callable, Hashable, Optional
+
+from openai.types.chat import ChatCompletion
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+
+from ..config import settings
+
+
+def sizeof_parsed_document(document:dict) -> int:
+    """ estimates the resident size of a parsed document, dominated by the page text """
+    return sum(sys.getsizeof(page.get('textIN', '')) + 64 for page in document.values())
+
+
+class LRUCache:
+    """
+    an in-process least recently used cache
+    bounded by the estimated size of its values rather than the number of entries
+    """
+
+    def __init__(self, max_bytes:int, sizeof:Optional[Callable[[Any], int]]=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or sys.getsizeof
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+
+    def __contains__(self, key:Hashable) -> bool:
+        return key in self._entries
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        """ returns the cached value and marks it as the most recently used """
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+
+    def put(self, key:Hashable, value:Any, size:Optional[int]=None) -> None:
+        """ caches a value, evicting the least recently used entries until it fits """
+        size = self.sizeof(value) if size is None else size
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            self._evict()
+
+
+    def pop(self, key:Hashable, default:Any=None) -> Any:
+        """ removes an entry from the cache """
+        if key not in self._entries:
+            return default
+        value, size = self._entries.pop(key)
+        self.nbytes -= size
+        return value
+
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.nbytes = 0
+
+
+    def _evict(self) -> None:
+        _, (_, size) = self._entries.popitem(last=False)
+        self.nbytes -= size
+
+
+def completion_cache_key(model:str, messages:list, request_kwargs:dict) -> str:
+    """ content hash of everything that determines a completion """
+    payload = json.dumps({"model": model, "messages": messages, "kwargs": request_kwargs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    two tier cache of chat completions, 
+    a process wide in-memory LRU in front of an optional blob tier under a project's artifacts folder
+    with bypass set, lookups always miss but fresh completions are still written back
+    """
+
+    memory = LRUCache(settings.COMPLETION_CACHE_MAX_BYTES, sizeof=lambda entry: len(entry[1]))
+
+    def __init__(self, blob_client:Optional[BlobServiceClient]=None, prefix:Optional[str]=None, bypass:bool=False):
+        self.blob_client = blob_client
+        self.prefix = prefix
+        self.bypass = bypass
+
+
+    def _blob(self, key:str):
+        return self.blob_client.get_blob_client(
+            container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+            blob=f"{self.prefix}/{key}.json"
+        )
+
+
+    async def get(self, key:str) -> Optional[ChatCompletion]:
+        if self.bypass:
+            return None
+
+        entry = self.memory.get(key)
+        if entry is not None:
+            return ChatCompletion.model_validate(entry[0])
+
+        if self.blob_client is None:
+            return None
+
+        try:
+            downloader = await self._blob(key).download_blob()
+            raw = await downloader.readall()
+
+        except ResourceNotFoundError:
+            return None
+
+        data = json.loads(raw)
+        self.memory.put(key, (data, raw))
+        return ChatCompletion.model_validate(data)
+
+
+    async def put(self, key:str, response:ChatCompletion) -> None:
+        data = response.model_dump(mode='json')
+        raw = json.dumps(data)
+        self.memory.put(key, (data, raw))
+        if self.blob_client is None:
+            return
+
+        try:
+            await self._blob(key).upload_blob(
+                raw, 
+                content_settings=ContentSettings(content_type='application/json'), 
+                overwrite=True
+            )
+        except Exception as e:
+            logging.warning(f"COULD NOT PERSIST COMPLETION {key}: {e}")
@@ -0,0 +1,152 @@
+import io
+import json
+
+from typing import List
+
+import numpy as np
+
+
+INDEX_FORMAT_VERSION = 3
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """ scales each row to unit length, so cosine similarity becomes a dot product """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return np.zeros((0, 0), dtype=np.float32)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def serialize_vectors(vectors) -> bytes:
+    """ stores embeddings as one contiguous float32 .npy blob """
+    with io.BytesIO() as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32), allow_pickle=False)
+        return f.getvalue()
+
+
+def deserialize_vectors(data:bytes) -> np.ndarray:
+    """ reads a .npy blob with a single np.frombuffer over the downloaded bytes, no copy is made """
+    with io.BytesIO(data) as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.frombuffer(data, dtype=dtype, offset=offset).reshape(shape, order='F' if fortran_order else 'C')
+
+
+def serialize_chunks(chunks:List[dict]) -> bytes:
+    """ stores chunk metadata column wise, so the keys are not repeated for every chunk """
+    columns = {
+        "title": [chunk.get('title') for chunk in chunks],
+        "page_number": [chunk.get('page_number') for chunk in chunks],
+        "text": [chunk.get('text') for chunk in chunks],
+    }
+    return json.dumps(columns, separators=(',', ':')).encode('utf-8')
+
+
+def deserialize_chunks(data:bytes) -> List[dict]:
+    """ turns the column wise chunk metadata back into the textstore records """
+    columns = json.loads(data)
+    return [
+        {"text": text, "title": title, "page_number": page_number}
+        for title, page_number, text in zip(columns['title'], columns['page_number'], columns['text'])
+    ]
+
+
+def build_segment(files:List[str], vectors, vectors_name:str, chunks_name:str) -> dict:
+    """ describes an immutable segment, the vectors and chunk metadata of one or more files """
+    return {
+        "files": files,
+        "count": int(len(vectors)),
+        "vectors": vectors_name,
+        "chunks": chunks_name,
+    }
+
+
+def empty_manifest() -> dict:
+    return {
+        "version": INDEX_FORMAT_VERSION,
+        "dtype": "float32",
+        "segments": [],
+    }
+
+
+def normalize_manifest(manifest:dict) -> dict:
+    """ single file manifests, version 2, are read as a manifest with one segment """
+    if manifest.get('version', 0) >= INDEX_FORMAT_VERSION:
+        return manifest
+
+    normalized = empty_manifest()
+    normalized['segments'] = [{
+        "files": manifest['filenames'],
+        "count": manifest['count'],
+        "vectors": manifest['vectors'],
+        "chunks": manifest['chunks'],
+    }]
+    return normalized
+
+
+def get_manifest_filenames(manifest:dict) -> List[str]:
+    """ names of every file in the index, in the order they were added """
+    return [file_name for segment in manifest['segments'] for file_name in segment['files']]
+
+
+def add_segments_to_manifest(manifest:dict, segments:List[dict]) -> dict:
+    """ appends segments to a manifest, segments whose files are already indexed are skipped """
+    indexed = set(get_manifest_filenames(manifest))
+    updated = {**manifest, "segments": list(manifest['segments'])}
+    for segment in segments:
+        if not set(segment['files']) <= indexed:
+            updated['segments'].append(segment)
+            indexed.update(segment['files'])
+    return updated
+
+
+def remove_files_from_manifest(manifest:dict, files:List[str]) -> tuple:
+    """ 
+    drops every segment holding any of the files, 
+    returns the manifest and the dropped segments that also held other files, those have to be written again without them
+    """
+    files = set(files)
+    kept, shared = [], []
+    for segment in manifest['segments']:
+        if files.isdisjoint(segment['files']):
+            kept.append(segment)
+        elif not set(segment['files']) <= files:
+            shared.append(segment)
+    return {**manifest, "segments": kept}, shared
+
+
+def concatenate_segments(segments:List[tuple]) -> tuple:
+    """ joins the (chunks, vectors) of each segment into one textstore and one (N, d) array """
+    textstore = [chunk for chunks, _ in segments for chunk in chunks]
+    vectors = [vectors for _, vectors in segments if len(vectors)]
+    if not vectors:
+        return textstore, np.zeros((0, 0), dtype=np.float32)
+    return textstore, np.concatenate(vectors) if len(vectors) > 1 else vectors[0]
+
+
+def empty_index() -> dict:
+    return {
+        "filenames": [],
+        "textstore": [],
+        "vectorstore": np.zeros((0, 0), dtype=np.float32),
+    }
+
+
+def migrate_legacy_index(index:dict) -> dict:
+    """ converts an index.json record, with embeddings stored as float lists, into the in-memory index """
+    if not index.get('vectorstore'):
+        return {**empty_index(), "filenames": index.get('filenames', [])}
+
+    return {
+        "filenames": index['filenames'],
+        "textstore": index['textstore'],
+        "vectorstore": np.asarray(index['vectorstore'], dtype=np.float32),
+    }
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+from typing import Optional
+
+
+PIPELINE_STAGES = ('context', 'index', 'skills', 'rag')
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_INTERRUPTED = 'interrupted'
+
+# jobs a worker picks up again once nothing has checkpointed them for a while, failed jobs are only resumed by hand
+RECOVERABLE_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_INTERRUPTED)
+
+STAGE_PENDING = 'pending'
+STAGE_RUNNING = 'running'
+STAGE_DONE = 'done'
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def new_job_record(job_id:Optional[str], params:dict) -> dict:
+    """ a pipeline job before any stage has run """
+    return {
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "params": params,
+        "stages": {
+            stage: {"status": STAGE_PENDING, "started_at": None, "finished_at": None} for stage in PIPELINE_STAGES
+        },
+        "completed_files": [],
+        "error": None,
+        "result": None,
+        "created_at": utc_now(),
+        "updated_at": utc_now(),
+    }
+
+
+def is_job_stale(record:dict, stale_after:float) -> bool:
+    """ whether a job's checkpoint is older than stale_after seconds, a running job's worker is then taken to be gone """
+    updated_at = datetime.fromisoformat(record['updated_at'])
+    return (datetime.now(timezone.utc) - updated_at).total_seconds() > stale_after
+
+
+def get_job_path(project_folder_name:str, tmp_folder:str, jobs_folder:str, job_id:str) -> str:
+    return f"{project_folder_name}/{tmp_folder}/{jobs_folder}/{job_id}.json"
+
+
+def get_pending_job_path(pending_folder:str, job_id:str) -> str:
+    return f"{pending_folder}/{job_id}.json"
+
+
+def job_status(record:dict) -> dict:
+    """ the job record without its result, for status polling """
+    return {key: value for key, value in record.items() if key != 'result'}
@@ -0,0 +1,141 @@
+import copy
+import time
+import asyncio
+import logging
+
+from typing import List, Optional
+
+import httpx
+
+from aiolimiter import AsyncLimiter
+
+from .retry_helpers import RETRYABLE_ERRORS, RetryPolicy, get_retry_after, retry_async
+
+
+NOTION_RETRYABLE_ERRORS = RETRYABLE_ERRORS + (httpx.TransportError,)
+
+# failures where the request certainly never reached notion, the only ones a request that creates something retries
+NOTION_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+NOTION_UNSENT_STATUSES = (429,)
+
+NOTION_IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+
+
+class NotionRequestError(Exception):
+    def __init__(self, message="Notion request failed with status *", status_code:int=0, response:Optional[httpx.Response]=None):
+            self.message = message.replace('*', str(status_code))
+            self.status_code = status_code
+            self.response = response
+            super().__init__(self.message)
+
+
+def get_title_property(title:str) -> dict:
+    return {
+        "title": {
+            "title": [
+                {
+                    "text": {
+                        "content": title
+                    }
+                }
+            ]
+        }
+    }
+
+
+class NotionClient:
+    """
+    async Notion API client, a single pooled keep-alive connection pool shared by every request in the process
+    requests go through a shared token bucket, and a 429 pauses every request for its Retry-After
+    the wait for the pause and the token bucket is not part of an attempt's timeout, only the http call is bounded
+
+    idempotent requests are retried with backoff when they are throttled, conflict, time out or fail,
+    requests that create something, POST and PATCH, are only retried when they certainly were not processed,
+    throttled or never sent, a timeout or server error may have created the page and is raised instead
+    transport replaces the network, e.g. with an httpx.ASGITransport over a local stand-in for the API
+    """
+
+    def __init__(
+            self, 
+            api_key:str, 
+            base_url:str, 
+            version:str, 
+            requests_per_second:float, 
+            max_connections:int, 
+            timeout:float, 
+            retry_policy:RetryPolicy,
+            transport:Optional[httpx.AsyncBaseTransport]=None
+        ):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                "Notion-Version": version,
+            },
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self.limiter = AsyncLimiter(requests_per_second, 1)
+        self.retry_policy = retry_policy
+        self.unsent_retry_policy = copy.copy(retry_policy)
+        self.unsent_retry_policy.retry_on = NOTION_UNSENT_ERRORS
+        self.unsent_retry_policy.retry_statuses = NOTION_UNSENT_STATUSES
+        self._paused_until = 0.0
+
+
+    def pause(self, seconds:float) -> None:
+        """ holds back every request until the server's Retry-After has passed """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+    async def wait_turn(self) -> None:
+        """ waits out a Retry-After pause, then for a token from the shared bucket """
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        await self.limiter.acquire()
+
+
+    async def _request(self, method:str, path:str, json:Optional[dict]=None) -> dict:
+        """ a single attempt, once wait_turn has let it through """
+        response = await self.http.request(method, path, json=json)
+
+        if response.is_error:
+            error = NotionRequestError(status_code=response.status_code, response=response)
+            if response.status_code == 429:
+                self.pause(get_retry_after(error) or 1.0)
+            elif response.status_code == 400:
+                logging.error(f"NOTION REJECTED {method} {path}: {response.text}")
+            raise error
+
+        return response.json()
+
+
+    async def request(self, method:str, path:str, json:Optional[dict]=None, idempotent:Optional[bool]=None) -> dict:
+        """ idempotent overrides the method's default, for updates such as archiving that are safe to send twice """
+        idempotent = method in NOTION_IDEMPOTENT_METHODS if idempotent is None else idempotent
+        policy = self.retry_policy if idempotent else self.unsent_retry_policy
+        return await retry_async(self._request, method, path, policy=policy, before_attempt=self.wait_turn, json=json)
+
+
+    async def create_page(self, parent_id:str, title:str, children:Optional[List[dict]]=None) -> str:
+        """ creates a child page of parent_id and returns its id """
+        payload = {
+            "parent": {"type": "page_id", "page_id": parent_id},
+            "properties": get_title_property(title),
+        }
+        if children:
+            payload["children"] = children
+
+        page = await self.request("POST", "/pages", json=payload)
+        return page['id']
+
+
+    async def archive_page(self, page_id:str) -> None:
+        """ moves a page to the trash, archiving an archived page again changes nothing so it is retried like a read """
+        await self.request("PATCH", f"/pages/{page_id}", json={"archived": True}, idempotent=True)
+
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
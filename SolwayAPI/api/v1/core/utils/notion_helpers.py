@@ -1,6 +1,35 @@
+import logging
+
+from typing import List, Optional
+
 from bs4 import BeautifulSoup
 
 from markdown_it import MarkdownIt
+from markdown_it.token import Token
+
+
+# notion rejects rich text objects over 2000 characters, and blocks with more than 100 of them
+NOTION_RICH_TEXT_LIMIT = 2000
+NOTION_RICH_TEXT_ITEMS = 100
+
+# a block, and a request, can hold at most 100 child blocks
+NOTION_MAX_CHILDREN = 100
+
+# a page can be created with at most two levels of nested blocks, deeper blocks are flattened into the second level
+NOTION_MAX_DEPTH = 2
+
+NOTION_LINK_SCHEMES = ('http://', 'https://', 'mailto:')
+
+# fence info strings and the notion code language they map to, anything else is sent as plain text
+NOTION_CODE_LANGUAGES = {
+    "bash": "bash", "sh": "shell", "shell": "shell", "c": "c", "cpp": "c++", "c++": "c++", "csharp": "c#", "cs": "c#", 
+    "css": "css", "go": "go", "html": "html", "java": "java", "javascript": "javascript", "js": "javascript", 
+    "json": "json", "markdown": "markdown", "md": "markdown", "python": "python", "py": "python", "r": "r", 
+    "ruby": "ruby", "rust": "rust", "sql": "sql", "typescript": "typescript", "ts": "typescript", "yaml": "yaml", "yml": "yaml",
+}
+
+# commonmark does not parse ~~strikethrough~~ or tables, LLM output uses both
+md = MarkdownIt("commonmark").enable(["strikethrough", "table"])
 
 
 def naive_batch(indexable, batch_size):
@@ -15,7 +44,7 @@ def markdown_to_html(markdown_content):
 
 
 def html_to_notion_blocks(html_content):
-    """ Converts HTML tags into corresponding Notion tags"""
+    """ Converts HTML tags into corresponding Notion tags, superseded by markdown_to_notion_blocks """
     
     soup = BeautifulSoup(html_content, 'html.parser')
     blocks = []
@@ -36,16 +65,15 @@ def html_to_notion_blocks(html_content):
                 blocks.extend(create_list_block(element, 'numbered_list_item'))
             # Add more element handlers as needed
             else:
-                print(f"Unhandled element: {element.name}")
+                logging.debug(f"Unhandled element: {element.name}")
         else:
-            print(f"Non-element content: {element}")
+            logging.debug(f"Non-element content: {element}")
 
     return blocks
 
 
 def create_heading_block(text, level):
     """ Creates a Heading Block"""
-    print(f"Creating heading level {level} with text: {text}")
     return {
         "object": "block",
         "type": f"heading_{level}",
@@ -134,3 +162,230 @@ def create_list_block(element, list_type):
             })
     return blocks
 
+
+
+def markdown_to_notion_blocks(markdown_content:str) -> List[dict]:
+    """ converts markdown into notion blocks straight from the markdown-it token stream, without rendering HTML """
+    blocks, _ = parse_block_tokens(md.parse(markdown_content), 0, depth=1)
+    return blocks
+
+
+def parse_block_tokens(tokens:List[Token], start:int, depth:int, stop:Optional[str]=None) -> tuple:
+    """ 
+    notion blocks for the tokens from start up to the closing token stop, 
+    returns the blocks and the index after the closing token
+    """
+    blocks = []
+    i = start
+    while i < len(tokens):
+        token = tokens[i]
+        if token.type == stop:
+            return blocks, i + 1
+
+        if token.type == 'heading_open':
+            level = min(int(token.tag[1]), 3)
+            blocks.extend(create_text_blocks(f"heading_{level}", inline_to_rich_text(tokens[i+1])))
+            i += 3
+
+        elif token.type == 'paragraph_open':
+            blocks.extend(create_text_blocks('paragraph', inline_to_rich_text(tokens[i+1])))
+            i += 3
+
+        elif token.type in ('bullet_list_open', 'ordered_list_open'):
+            list_type = 'bulleted_list_item' if token.type == 'bullet_list_open' else 'numbered_list_item'
+            items, i = parse_list_tokens(tokens, i + 1, depth, list_type, token.type.replace('_open', '_close'))
+            blocks.extend(items)
+
+        elif token.type == 'blockquote_open':
+            children, i = parse_block_tokens(tokens, i + 1, depth + 1, 'blockquote_close')
+            blocks.extend(nest_blocks('quote', children, depth))
+
+        elif token.type == 'table_open':
+            rows, i = parse_table_tokens(tokens, i + 1)
+            blocks.extend(create_table_blocks(rows, depth))
+
+        elif token.type in ('fence', 'code_block'):
+            blocks.append(create_code_block(token.content, token.info))
+            i += 1
+
+        elif token.type == 'hr':
+            blocks.append({"object": "block", "type": "divider", "divider": {}})
+            i += 1
+
+        elif token.type == 'inline':
+            blocks.extend(create_text_blocks('paragraph', inline_to_rich_text(token)))
+            i += 1
+
+        elif token.type == 'html_block':
+            blocks.extend(create_text_blocks('paragraph', append_rich_text([], token.content.strip())))
+            i += 1
+
+        else:
+            i += 1
+
+    return blocks, i
+
+
+def parse_list_tokens(tokens:List[Token], start:int, depth:int, list_type:str, stop:str) -> tuple:
+    """ one list item block per list_item_open, what follows an item's first paragraph becomes its children """
+    items = []
+    i = start
+    while tokens[i].type != stop:
+        children, i = parse_block_tokens(tokens, i + 1, depth + 1, 'list_item_close')
+        items.extend(nest_blocks(list_type, children, depth))
+    return items, i + 1
+
+
+def parse_table_tokens(tokens:List[Token], start:int) -> tuple:
+    """ the rich text of each cell, row by row with the header row first, and the index after table_close """
+    rows = []
+    i = start
+    while tokens[i].type != 'table_close':
+        if tokens[i].type == 'tr_open':
+            rows.append([])
+        elif tokens[i].type == 'inline':
+            rows[-1].append(inline_to_rich_text(tokens[i])[:NOTION_RICH_TEXT_ITEMS])
+        i += 1
+    return rows, i + 1
+
+
+def create_table_blocks(rows:List[list], depth:int) -> List[dict]:
+    """ 
+    a table block with a column header, tables over 100 rows are split into several tables that each repeat the header
+    tables beyond notion's nesting limit, where their rows can not be nested, are written as one paragraph per row
+    """
+    if depth >= NOTION_MAX_DEPTH:
+        blocks = []
+        for row in rows:
+            rich_text = []
+            for idx, cell in enumerate(row):
+                if idx:
+                    append_rich_text(rich_text, ' | ')
+                rich_text.extend(cell)
+            blocks.extend(create_text_blocks('paragraph', rich_text))
+        return blocks
+
+    width = max(len(row) for row in rows)
+    table_rows = [
+        {"object": "block", "type": "table_row", "table_row": {"cells": row + [[] for _ in range(width - len(row))]}}
+        for row in rows
+    ]
+    return [
+        {
+            "object": "block", 
+            "type": "table", 
+            "table": {
+                "table_width": width, 
+                "has_column_header": True, 
+                "has_row_header": False, 
+                "children": [table_rows[0]] + batch
+            }
+        }
+        for batch in naive_batch(table_rows[1:], NOTION_MAX_CHILDREN - 1) or [[]]
+    ]
+
+
+def nest_blocks(block_type:str, children:List[dict], depth:int) -> List[dict]:
+    """ 
+    a block whose own text is its first paragraph, and whose children are the remaining blocks
+    children beyond notion's nesting limit, or past the first 100, are placed after the block instead
+    """
+    rich_text = []
+    if children and children[0]['type'] == 'paragraph':
+        rich_text = children.pop(0)['paragraph']['rich_text']
+
+    blocks = create_text_blocks(block_type, rich_text)
+    if not children:
+        return blocks
+
+    if depth < NOTION_MAX_DEPTH:
+        blocks[-1][block_type]['children'] = children[:NOTION_MAX_CHILDREN]
+        return blocks + children[NOTION_MAX_CHILDREN:]
+    return blocks + children
+
+
+def inline_to_rich_text(token:Token) -> List[dict]:
+    """ rich text for an inline token, with bold, italic, strikethrough, inline code and links """
+    rich_text = []
+    annotations = {"bold": 0, "italic": 0, "strikethrough": 0}
+    link = None
+    for child in token.children or []:
+        if child.type == 'text':
+            append_rich_text(rich_text, child.content, annotations, link=link)
+
+        elif child.type == 'code_inline':
+            append_rich_text(rich_text, child.content, annotations, code=True, link=link)
+
+        elif child.type in ('softbreak', 'hardbreak'):
+            append_rich_text(rich_text, '\n', annotations, link=link)
+
+        elif child.type in ('strong_open', 'strong_close'):
+            annotations['bold'] += 1 if child.nesting > 0 else -1
+
+        elif child.type in ('em_open', 'em_close'):
+            annotations['italic'] += 1 if child.nesting > 0 else -1
+
+        elif child.type in ('s_open', 's_close'):
+            annotations['strikethrough'] += 1 if child.nesting > 0 else -1
+
+        elif child.type == 'link_open':
+            link = child.attrGet('href')
+
+        elif child.type == 'link_close':
+            link = None
+
+        elif child.type == 'image':
+            append_rich_text(rich_text, child.content or child.attrGet('src') or '', annotations, link=child.attrGet('src'))
+
+        elif child.type == 'html_inline':
+            append_rich_text(rich_text, child.content, annotations, link=link)
+
+    return rich_text
+
+
+def append_rich_text(rich_text:List[dict], content:str, annotations:Optional[dict]=None, code:bool=False, link:Optional[str]=None) -> List[dict]:
+    """ 
+    appends text to a rich text array, merging it into the previous item when they are formatted the same 
+    and splitting it into items of at most 2000 characters
+    """
+    if not content:
+        return rich_text
+
+    flags = {name: True for name, value in (annotations or {}).items() if value}
+    if code:
+        flags['code'] = True
+    link = link if link and link.startswith(NOTION_LINK_SCHEMES) else None
+
+    if rich_text and rich_text[-1].get('annotations', {}) == flags and rich_text[-1]['text'].get('link', {}).get('url') == link:
+        content = rich_text.pop()['text']['content'] + content
+
+    for start in range(0, len(content), NOTION_RICH_TEXT_LIMIT):
+        item = {"type": "text", "text": {"content": content[start:start+NOTION_RICH_TEXT_LIMIT]}}
+        if link:
+            item['text']['link'] = {"url": link}
+        if flags:
+            item['annotations'] = flags
+        rich_text.append(item)
+
+    return rich_text
+
+
+def create_text_blocks(block_type:str, rich_text:List[dict]) -> List[dict]:
+    """ blocks of block_type holding the rich text, split over several blocks when it has more than 100 items """
+    return [
+        {"object": "block", "type": block_type, block_type: {"rich_text": batch}}
+        for batch in naive_batch(rich_text, NOTION_RICH_TEXT_ITEMS) or [[]]
+    ]
+
+
+def create_code_block(content:str, info:str='') -> dict:
+    """ a code block, the fence's language when notion supports it and plain text otherwise """
+    language = info.split()[0].lower() if info.strip() else ''
+    return {
+        "object": "block",
+        "type": "code",
+        "code": {
+            "rich_text": append_rich_text([], content.rstrip('\n'))[:NOTION_RICH_TEXT_ITEMS],
+            "language": NOTION_CODE_LANGUAGES.get(language, "plain text"),
+        }
+    }
@@ -0,0 +1,101 @@
+import time
+
+from contextlib import contextmanager
+
+from typing import Dict, List, Optional
+
+from .job_helpers import utc_now
+
+
+PIPELINE_MANIFEST_VERSION = 1
+
+
+def empty_pipeline_manifest() -> dict:
+    return {
+        "version": PIPELINE_MANIFEST_VERSION,
+        "documents": {},
+        "indexed": {},
+        "rag": {},
+    }
+
+
+def seed_indexed_versions(record:dict) -> dict:
+    """ 
+    manifests written before index versions were recorded, 
+    each document is taken to be indexed at the version its skills were produced from
+    """
+    record.setdefault('rag', {})
+    indexed = record.setdefault('indexed', {})
+    for filename, entry in record['documents'].items():
+        indexed.setdefault(filename, {"etag": entry.get('etag'), "content_md5": entry.get('content_md5')})
+    return record
+
+
+def flatten_page_ids(pages:list) -> List[str]:
+    """ the ids of the pages an answer was published as, an answer longer than one page is a list of parts """
+    return [page_id for page in pages for page_id in (page if isinstance(page, list) else [page])]
+
+
+def get_pending_skills(entry:Optional[dict], unchanged:bool, skills:List[str], overwrite:bool) -> List[str]:
+    """ the requested skills a document still needs, all of them when it is new, has changed or is overwritten """
+    if overwrite or entry is None or not unchanged:
+        return list(skills)
+    produced = set(entry.get('skills', []))
+    return [skill for skill in skills if skill not in produced]
+
+
+def record_document(
+        entry:Optional[dict], 
+        unchanged:bool, 
+        version:dict, 
+        skills:List[str], 
+        file_page_id:Optional[str], 
+        notion_pages:dict
+    ) -> dict:
+    """ 
+    the manifest entry of a document once its skills are generated and published
+    skills and pages of an unchanged document are added to what it already had, a changed document starts over
+    """
+    previous = entry if entry and unchanged else {}
+    return {
+        "etag": version.get('etag'),
+        "content_md5": version.get('content_md5'),
+        "skills": sorted(set(previous.get('skills', [])) | set(skills)),
+        "file_page_id": file_page_id,
+        "notion_pages": {**previous.get('notion_pages', {}), **notion_pages},
+        "updated_at": utc_now(),
+    }
+
+
+class StageTimer:
+    """
+    wall clock time of each pipeline stage, 
+    a stage that runs once per document spans from its first start to its last finish, 
+    the time each document spent in it is kept as well
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans:Dict[str, list] = {}
+        self.documents:Dict[str, dict] = {}
+
+
+    @contextmanager
+    def time(self, stage:str, document:Optional[str]=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            first, last = self.spans.get(stage, (start, end))
+            self.spans[stage] = [min(first, start), max(last, end)]
+            if document:
+                self.documents.setdefault(document, {})[stage] = round(end - start, 3)
+
+
+    def report(self) -> dict:
+        return {
+            "total": round(time.perf_counter() - self.started, 3),
+            "stages": {stage: round(last - first, 3) for stage, (first, last) in self.spans.items()},
+            "documents": self.documents,
+        }
@@ -0,0 +1,85 @@
+import time
+import asyncio
+
+from contextlib import asynccontextmanager
+
+from aiolimiter import AsyncLimiter
+
+
+def estimate_tokens(*texts:str, expected_output:int=0) -> int:
+    """ cheap token estimate for rate limiting, roughly four characters per token """
+    return sum(len(text) for text in texts) // 4 + expected_output
+
+
+class AIMDConcurrencyLimiter:
+    """
+    caps the number of requests in flight, the cap follows additive increase / multiplicative decrease
+    every success raises it by about one per window of requests, a throttled request halves it
+    """
+
+    def __init__(self, initial:int, minimum:int=1, maximum:int=64, decrease:float=0.5, cooldown:float=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+    def on_throttle(self) -> None:
+        """ a burst of 429s from the same window only backs off once """
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._last_decrease = now
+
+
+class OpenAIRateLimiter:
+    """
+    process wide limiter for OpenAI requests
+    token buckets for requests and estimated tokens per minute, in front of an AIMD concurrency cap
+    """
+
+    def __init__(self, requests_per_minute:int, tokens_per_minute:int, concurrency:AIMDConcurrencyLimiter):
+        self.tokens_per_minute = tokens_per_minute
+        self.request_bucket = AsyncLimiter(requests_per_minute, 60)
+        self.token_bucket = AsyncLimiter(tokens_per_minute, 60)
+        self.concurrency = concurrency
+
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens:int):
+        """ waits for a concurrency slot and for both buckets before the request is sent """
+        await self.concurrency.acquire()
+        try:
+            await self.request_bucket.acquire()
+            await self.token_bucket.acquire(min(max(estimated_tokens, 1), self.tokens_per_minute))
+            yield
+        finally:
+            await self.concurrency.release()
+
+
+    def on_success(self) -> None:
+        self.concurrency.on_success()
+
+
+    def on_throttle(self) -> None:
+        self.concurrency.on_throttle()
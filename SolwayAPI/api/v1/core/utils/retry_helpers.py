@@ -0,0 +1,134 @@
+import json
+import time
+import random
+import asyncio
+import logging
+
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+from typing import AsyncContextManager, Awaitable, Callable, Optional, Tuple, Type
+
+import openai
+import voyageai.error
+
+
+RETRYABLE_ERRORS:Tuple[Type[BaseException], ...] = (
+    asyncio.TimeoutError,
+    json.JSONDecodeError,
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    voyageai.error.RateLimitError,
+    voyageai.error.Timeout,
+    voyageai.error.APIConnectionError,
+    voyageai.error.ServerError,
+    voyageai.error.ServiceUnavailableError,
+)
+
+
+class RetryPolicy:
+    """
+    exponential backoff with full jitter, bounded by a deadline covering every attempt of a call
+    attempt_timeout bounds a single attempt, deadline bounds the call as a whole, either can be None for no bound
+    time spent waiting for a rate limiter before an attempt counts against neither
+    retry_statuses restricts the http statuses retried, by default 408, 409, 429 and server errors are
+    """
+
+    def __init__(
+            self,
+            max_attempts:int=6,
+            base_delay:float=1.0,
+            max_delay:float=60.0,
+            attempt_timeout:Optional[float]=300.0,
+            deadline:Optional[float]=900.0,
+            retry_on:Tuple[Type[BaseException], ...]=RETRYABLE_ERRORS,
+            retry_statuses:Optional[Tuple[int, ...]]=None
+        ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.retry_on = retry_on
+        self.retry_statuses = retry_statuses
+
+
+    def is_retryable(self, error:BaseException) -> bool:
+        if isinstance(error, self.retry_on):
+            return True
+        status = getattr(error, 'status_code', None) or getattr(error, 'http_status', None)
+        if self.retry_statuses is not None:
+            return status in self.retry_statuses
+        return status in (408, 409, 429) or (status is not None and status >= 500)
+
+
+    def backoff(self, attempt:int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def get_retry_after(error:BaseException) -> Optional[float]:
+    """ seconds to wait from the Retry-After header of a failed request, as seconds or an http date """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+async def retry_async(
+        fn:Callable[..., Awaitable], 
+        *args, 
+        policy:RetryPolicy, 
+        before_attempt:Optional[Callable[[], Awaitable]]=None, 
+        attempt_slot:Optional[Callable[[], AsyncContextManager]]=None, 
+        **kwargs
+    ):
+    """
+    awaits fn(*args, **kwargs), retrying transient failures according to the policy
+    the Retry-After header is honoured when the server sends one
+    before_attempt is awaited ahead of every attempt, for waits such as a rate limiter's token bucket
+    attempt_slot is entered around every attempt and left before any backoff, for limiters that hold a slot while a request is in flight
+    neither wait is counted against the attempt timeout or the deadline
+    """
+    deadline = time.monotonic() + policy.deadline if policy.deadline is not None else None
+    for attempt in range(policy.max_attempts):
+        waiting_since = time.monotonic()
+        try:
+            if before_attempt is not None:
+                await before_attempt()
+
+            async with attempt_slot() if attempt_slot is not None else nullcontext():
+                timeout = policy.attempt_timeout
+                if deadline is not None:
+                    deadline += time.monotonic() - waiting_since
+                    remaining = deadline - time.monotonic()
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                return await asyncio.wait_for(fn(*args, **kwargs), timeout=timeout)
+
+        except Exception as e:
+            if attempt + 1 >= policy.max_attempts or not policy.is_retryable(e):
+                raise
+
+            retry_after = get_retry_after(e)
+            delay = min(policy.max_delay, retry_after) if retry_after is not None else policy.backoff(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+
+            logging.warning(f"RETRYING {getattr(fn, '__name__', fn)} IN {delay:.1f}s AFTER ATTEMPT {attempt + 1}: {type(e).__name__} {e}")
+            await asyncio.sleep(delay)
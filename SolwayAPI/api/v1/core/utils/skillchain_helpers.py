@@ -1,23 +1,228 @@
 import copy
+import json
+import asyncio
 
-from openai import AsyncOpenAI
+from typing import AsyncContextManager, AsyncIterator, Callable, Dict, List, Optional, Set
 
-async def make_open_ai_request(client:AsyncOpenAI, system_prompt:str, user_message:str, model:str='gpt-4o', **request_kwargs):
+from openai import AsyncOpenAI, RateLimitError
+from openai.types.chat import ChatCompletion
+from voyageai import Client as VoyageClient
+
+from azure.storage.blob.aio import BlobServiceClient
+
+from ..clients import get_openai_rate_limiter
+from ..config import settings
+from .cache_helpers import CompletionCache, completion_cache_key
+from .rate_limit_helpers import estimate_tokens
+from .retry_helpers import RetryPolicy, retry_async
+from .tokenizer_helpers import decode, encode
+
+
+llm_retry_policy = RetryPolicy(
+    max_attempts=settings.LLM_MAX_ATTEMPTS,
+    base_delay=settings.LLM_BACKOFF_BASE,
+    max_delay=settings.LLM_BACKOFF_MAX,
+    attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT,
+    deadline=settings.LLM_CALL_DEADLINE
+)
+
+
+def get_open_ai_slot(system_prompt:str, user_message:str, **request_kwargs) -> Callable[[], AsyncContextManager]:
+    """ 
+    the process wide rate limiter slot a request is sent in, 
+    retry_async enters it ahead of each attempt, so queueing for it does not use up the attempt's timeout
+    """
+    rate_limiter = get_openai_rate_limiter()
+    estimated_tokens = estimate_tokens(
+        system_prompt, 
+        user_message, 
+        expected_output=request_kwargs.get('max_tokens', settings.OPENAI_EXPECTED_OUTPUT_TOKENS)
+    )
+    return lambda: rate_limiter.limit(estimated_tokens)
+
+
+async def request_open_ai_completion(client:AsyncOpenAI, system_prompt:str, user_message:str, model:str='gpt-4o', **request_kwargs):
+    """
+    a single chat completion attempt, sent once its rate limiter slot is held
+    429s lower the limiter's concurrency and successes raise it
+    """
+    rate_limiter = get_openai_rate_limiter()
+    try:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=get_messages(system_prompt, user_message),
+            **request_kwargs,
+        )
+    except RateLimitError:
+        rate_limiter.on_throttle()
+        raise
+
+    rate_limiter.on_success()
+    return response
+
+
+def get_completion_cache(project_folder_name:Optional[str]=None, blob_client:Optional[BlobServiceClient]=None, bypass:bool=False) -> CompletionCache:
+    """ completion cache persisted under the project's artifacts folder, memory only without a project """
+    if project_folder_name and blob_client is not None:
+        return CompletionCache(
+            blob_client=blob_client, 
+            prefix=f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.COMPLETIONS_FOLDER}", 
+            bypass=bypass
+        )
+    return CompletionCache(bypass=bypass)
+
+
+def get_messages(system_prompt:str, user_message:str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message},
+    ]
+
+
+async def make_open_ai_request(
+        client:AsyncOpenAI, 
+        system_prompt:str, 
+        user_message:str, 
+        model:str='gpt-4o', 
+        completion_cache:Optional[CompletionCache]=None, 
+        **request_kwargs
+    ):
     """
     calls openai chat completion endpoint with a specified
-    system prompt and user message
-    """
-    response = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ],
-        **request_kwargs,
+    system prompt and user message, transient failures are retried with backoff
+    identical requests are answered from the completion cache
+    """
+    completion_cache = completion_cache or get_completion_cache()
+    key = completion_cache_key(model, get_messages(system_prompt, user_message), request_kwargs)
+    response = await completion_cache.get(key)
+    if response is not None:
+        return response
+
+    response = await retry_async(
+        request_open_ai_completion, client, system_prompt, user_message, model, 
+        policy=llm_retry_policy, 
+        attempt_slot=get_open_ai_slot(system_prompt, user_message, **request_kwargs), 
+        **request_kwargs
     )
+    await completion_cache.put(key, response)
     return response
 
 
+async def make_open_ai_json_request(
+        client:AsyncOpenAI, 
+        system_prompt:str, 
+        user_message:str, 
+        model:str='gpt-4o', 
+        completion_cache:Optional[CompletionCache]=None, 
+        **request_kwargs
+    ) -> dict:
+    """
+    calls openai in json mode and returns the parsed object, 
+    a completion that is not valid JSON is requested again like any other transient failure
+    only completions that parse are cached
+    """
+    request_kwargs = {**request_kwargs, "response_format": {"type": "json_object"}}
+    completion_cache = completion_cache or get_completion_cache()
+    key = completion_cache_key(model, get_messages(system_prompt, user_message), request_kwargs)
+    response = await completion_cache.get(key)
+    if response is not None:
+        return json.loads(response.choices[0].message.content)
+
+    async def request_json():
+        response = await request_open_ai_completion(client, system_prompt, user_message, model, **request_kwargs)
+        return response, json.loads(response.choices[0].message.content)
+
+    response, content = await retry_async(
+        request_json, 
+        policy=llm_retry_policy, 
+        attempt_slot=get_open_ai_slot(system_prompt, user_message, **request_kwargs)
+    )
+    await completion_cache.put(key, response)
+    return content
+
+
+async def open_open_ai_stream(client:AsyncOpenAI, system_prompt:str, user_message:str, model:str='gpt-4o', **request_kwargs):
+    """ opens a streamed chat completion, a 429 lowers the shared concurrency like any other request """
+    try:
+        return await client.chat.completions.create(
+            model=model,
+            messages=get_messages(system_prompt, user_message),
+            stream=True,
+            **request_kwargs,
+        )
+    except RateLimitError:
+        get_openai_rate_limiter().on_throttle()
+        raise
+
+
+async def stream_open_ai_completion(
+        client:AsyncOpenAI, 
+        system_prompt:str, 
+        user_message:str, 
+        model:str='gpt-4o', 
+        completion_cache:Optional[CompletionCache]=None, 
+        **request_kwargs
+    ) -> AsyncIterator[str]:
+    """
+    streams a chat completion as text deltas, the stream holds a rate limiter slot until it ends
+    opening the stream is retried with backoff, a failure after tokens were forwarded is raised
+    a cached completion is replayed as a single delta, and a stream that finishes is written to the cache
+    """
+    completion_cache = completion_cache or get_completion_cache()
+    key = completion_cache_key(model, get_messages(system_prompt, user_message), request_kwargs)
+    response = await completion_cache.get(key)
+    if response is not None:
+        yield response.choices[0].message.content
+        return
+
+    rate_limiter = get_openai_rate_limiter()
+    estimated_tokens = estimate_tokens(
+        system_prompt, 
+        user_message, 
+        expected_output=request_kwargs.get('max_tokens', settings.OPENAI_EXPECTED_OUTPUT_TOKENS)
+    )
+
+    content, chunk, finish_reason = [], None, None
+    async with rate_limiter.limit(estimated_tokens):
+        stream = await retry_async(
+            open_open_ai_stream, client, system_prompt, user_message, model, 
+            policy=llm_retry_policy, **request_kwargs
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                content.append(delta)
+                yield delta
+
+    rate_limiter.on_success()
+    if chunk is None:
+        return
+
+    await completion_cache.put(key, ChatCompletion.model_validate({
+        "id": chunk.id,
+        "object": "chat.completion",
+        "created": chunk.created,
+        "model": chunk.model,
+        "choices": [{
+            "index": 0, 
+            "finish_reason": finish_reason or "stop", 
+            "message": {"role": "assistant", "content": ''.join(content)}
+        }],
+    }))
+
+
+async def make_voyage_embed_request(client:VoyageClient, texts:List[str], model:str="voyage-large-2-instruct", input_type:str="document") -> List[List[float]]:
+    """ embeds texts with voyage, the blocking client runs in a worker thread and transient failures are retried """
+    response = await retry_async(
+        asyncio.to_thread, client.embed, texts, 
+        policy=llm_retry_policy, model=model, input_type=input_type
+    )
+    return response.embeddings
+
+
 def build_string(string_dict:dict):
     """ creates an LLM friendly representation of the contents of a python dictionary """
     string = ''
@@ -71,32 +276,85 @@ def update_internals(context:dict, agent_internals:dict):
     return updated_internals
 
 
-def chunk_document_naive(encoder:object, document:str, chunksize:int=40000, overlap:int=1250):
-    """ chunks a document into chunks with an overlap """
-    
-    tokens = encoder.encode(document)
-    chunks = []
-    start = 0
+def build_skill_graph(skills:list, implicit_dependencies:Optional[Dict[str, Set[str]]]=None) -> Dict[str, Set[str]]:
+    """ maps each skill name to the names of the skills whose output it needs, from the contiguous_on edges """
+    graph = {skill.name: {skill.contiguous_on} if skill.contiguous_on else set() for skill in skills}
+    for name, dependencies in (implicit_dependencies or {}).items():
+        if name in graph:
+            graph[name] |= dependencies - {name}
+    return graph
 
-    while start < len(tokens) - overlap:
 
-        # Determine the end of the current chunk
-        if start == 0:
-            end = start + chunksize 
-        else:
-            end = start + chunksize - overlap
-        
-        end = min(end, len(tokens))
+def resolve_skill_order(requested:List[str], graph:Dict[str, Set[str]]) -> List[str]:
+    """
+    the requested skills plus every prerequisite they pull in, in dependency order
+    raises a KeyError for skills that are not in the graph and a ValueError for cycles
+    """
+    order, visiting, visited = [], set(), set()
+
+    def visit(name:str):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Skill dependency cycle through {name}")
+        visiting.add(name)
+        for dependency in sorted(graph[name]):
+            visit(dependency)
+        visiting.discard(name)
+        visited.add(name)
+        order.append(name)
+
+    for name in requested:
+        visit(name)
+    return order
+
+
+# tokens taken by the "!!! START PAGE n !!! PAGE TEXT: ... !!!" wrapper around each page
+PAGE_MARKER_TOKENS = 16
+
+
+def format_page(page, data:dict) -> str:
+    """ wraps a page's text with its page number, so generations can cite it """
+    return f"""!!! START PAGE {page} !!! PAGE TEXT: {data.get('textIN')} !!!"""
+
+
+def get_chunk_budget(context_window:int, prompt_tokens:int, output_tokens:int, max_chunk_tokens:int) -> int:
+    """ document tokens that fit in one request, next to the prompt and the expected output """
+    return max(1, min(max_chunk_tokens, context_window - prompt_tokens - output_tokens))
+
+
+def split_page(page, data:dict, budget:int) -> List[str]:
+    """ splits a page that does not fit in a chunk on its own, every piece keeps the page number """
+    tokens = encode(data.get('textIN'))
+    piece_size = max(1, budget - PAGE_MARKER_TOKENS)
+    return [
+        format_page(page, {"textIN": decode(tokens[start:start+piece_size])}) 
+        for start in range(0, len(tokens), piece_size)
+    ]
+
+
+def plan_page_chunks(document:dict, budget:int) -> List[str]:
+    """
+    packs whole pages into chunks of at most budget tokens, using the numTokens stored when the pdf was parsed
+    pages are never cut unless a single page is larger than the budget
+    """
+    chunks, current, current_tokens = [], [], 0
+    for page, data in document.items():
+        page_tokens = int(data.get('numTokens')) + PAGE_MARKER_TOKENS
+
+        if current and current_tokens + page_tokens > budget:
+            chunks.append(''.join(current))
+            current, current_tokens = [], 0
 
-        chunk = tokens[start:end]
-        chunks.append(chunk)
+        if page_tokens > budget:
+            chunks.extend(split_page(page, data, budget))
+            continue
 
-        # Move the start for the next chunk
-        if start == 0:
-            start = end
-        else:
-            start = end - overlap 
+        current.append(format_page(page, data))
+        current_tokens += page_tokens
 
+    if current:
+        chunks.append(''.join(current))
     return chunks
 
 
@@ -0,0 +1,41 @@
+import json
+import asyncio
+
+from typing import AsyncIterator
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event:str, data) -> str:
+    """ a server sent event, the data is sent as a single line of JSON """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def with_heartbeat(events:AsyncIterator[str], interval:float) -> AsyncIterator[str]:
+    """ 
+    forwards the events, sending an SSE comment whenever the stream has been idle for interval seconds
+    keeps proxies and the functions host from closing a connection that is waiting on a long generation
+    """
+    iterator = events.__aiter__()
+    next_event = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=interval)
+            if not done:
+                yield ": keep-alive\n\n"
+                continue
+
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+
+            yield event
+            next_event = asyncio.ensure_future(iterator.__anext__())
+
+    finally:
+        next_event.cancel()
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+
+from contextlib import asynccontextmanager
+
+from typing import AsyncIterator, List, Optional
+
+
+def get_leaf_errors(error:BaseException) -> List[BaseException]:
+    """ the exceptions inside an exception group, nested groups included, in the order they were raised """
+    if isinstance(error, BaseExceptionGroup):
+        return [leaf for inner in error.exceptions for leaf in get_leaf_errors(inner)]
+    return [error]
+
+
+@asynccontextmanager
+async def first_error_task_group() -> AsyncIterator[asyncio.TaskGroup]:
+    """
+    an asyncio.TaskGroup that raises the first exception its tasks failed with rather than an ExceptionGroup,
+    so callers and error messages name the real failure, any further failures are logged
+    """
+    try:
+        async with asyncio.TaskGroup() as group:
+            yield group
+
+    except ExceptionGroup as errors:
+        first, *rest = get_leaf_errors(errors)
+        for error in rest:
+            logging.error(f"ALSO FAILED IN TASK GROUP: {type(error).__name__} {error}")
+        raise first
+
+
+def limit_semaphore(concurrency:Optional[int], default:int) -> asyncio.Semaphore:
+    """ a semaphore of concurrency permits, default when it is None, and at least one so waiters are never stuck """
+    return asyncio.Semaphore(max(1, concurrency if concurrency is not None else default))
@@ -0,0 +1,42 @@
+import functools
+
+from typing import List
+
+import tiktoken
+
+
+# the encoding token counts and chunk sizes have always been measured in, numTokens stored with parsed documents
+# and the chunk thresholds are in cl100k tokens, it counts gpt-4o text slightly high so chunk budgets stay conservative
+DEFAULT_ENCODING = 'cl100k_base'
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model:str=DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """ 
+    returns the cached encoder for a model, 
+    encoding names such as cl100k_base are accepted as well 
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(model)
+
+
+def encode(text:str, model:str=DEFAULT_ENCODING) -> List[int]:
+    """ tokenizes a string, special tokens are treated as plain text """
+    return get_encoding(model).encode_ordinary(text)
+
+
+def decode(tokens:List[int], model:str=DEFAULT_ENCODING) -> str:
+    """ turns a list of tokens back into a string """
+    return get_encoding(model).decode(tokens)
+
+
+def count_tokens(text:str, model:str=DEFAULT_ENCODING) -> int:
+    """ returns the number of tokens in a string """
+    return len(encode(text, model))
+
+
+def count_tokens_batch(texts:List[str], model:str=DEFAULT_ENCODING, num_threads:int=8) -> List[int]:
+    """ returns the number of tokens in each string, the strings are encoded in parallel by tiktoken """
+    return [len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(texts, num_threads=num_threads)]
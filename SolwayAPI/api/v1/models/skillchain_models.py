@@ -7,4 +7,5 @@ class Skill(BaseModel):
     role:str
     instructions:str
     contiguous_on:str
-    output:Optional[str]
\ No newline at end of file
+    output:Optional[str]
+    reduce_strategy:Optional[str]='concat'
@@ -1,14 +1,20 @@
 import copy
 import json
+import uuid
+import asyncio
 import logging
 
-from typing import Dict, List, Optional
+from pathlib import Path
+
+from typing import Dict, List, Literal, Optional
 
 from fastapi import (
     APIRouter, 
     Depends
 )
 
+import numpy as np
+
 from openai import AsyncOpenAI
 from voyageai import Client as VoyageClient
 
@@ -17,7 +23,12 @@ from langchain_core.documents import Document
 from langchain_voyageai import VoyageAIEmbeddings
 from langchain_experimental.text_splitter import SemanticChunker
 
-from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import (
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError
+)
+from azure.storage.blob.aio import BlobServiceClient
 
 from SolwayAPI.api.v1.core.config import settings
 
@@ -29,19 +40,46 @@ from SolwayAPI.api.v1.core.clients import (
 from SolwayAPI.api.v1.core.chain_prompts import (
     research_questions,
     thematic_areas,
-    context
+    context,
+    combined
 )
 
 
 from .blobstorage import (
+    DocumentStore,
     get_az_blob_storage_client,
+    get_document_store,
     get_blob, 
-    create_blob
+    create_blob,
+    download_blob_bytes,
+    download_json_with_etag,
+    upload_blob_bytes
 )
 
+from ..core.utils.ann_helpers import IVFIndex
 from ..core.utils.blobstorage_helpers import get_file_name
+from ..core.utils.index_helpers import (
+    add_segments_to_manifest,
+    build_segment,
+    concatenate_segments,
+    deserialize_chunks,
+    deserialize_vectors,
+    empty_index,
+    empty_manifest,
+    get_manifest_filenames,
+    migrate_legacy_index,
+    normalize_manifest,
+    normalize_rows,
+    remove_files_from_manifest,
+    serialize_chunks,
+    serialize_vectors
+)
+from ..core.utils.cache_helpers import CompletionCache
+from ..core.utils.task_helpers import limit_semaphore
 from ..core.utils.skillchain_helpers import (
-    make_open_ai_request,
+    get_completion_cache,
+    make_open_ai_json_request,
+    make_voyage_embed_request,
     update_internals,
     build_string,
     get_all_textIN
@@ -57,6 +95,12 @@ logging.basicConfig(level=logging.INFO)
 router = APIRouter(tags=['artifacts'])
 
 
+class IndexCommitError(Exception):
+    def __init__(self, message="Could not commit to the index of *, the manifest kept changing", project_folder_name:str=''):
+            self.message = message.replace('*', project_folder_name)
+            super().__init__(self.message)
+
+
 class Indexer:
 
     def create_chunks_for_index(self, file_name:str, file:Dict[str, Dict[str, str]], text_splitter:SemanticChunker):
@@ -65,68 +109,82 @@ class Indexer:
         return [{"text": chunk.page_content, "title":file_name, "page_number": chunk.metadata['page_number']} for chunk in chunks]
 
 
-    def get_chunk_embeddings(self, vo_client:VoyageClient, chunks:List[dict], batchsize:int) -> list:
+    async def get_chunk_embeddings(self, vo_client:VoyageClient, chunks:List[dict], batchsize:int) -> list:
         """embeds a list of chunks with the voyager client"""
         batches = [chunk.get("text") for chunk in chunks]
         batches = [batches[step:step+batchsize] for step in range(0, len(batches), batchsize)]
 
         embeddings = []
         for batch in batches:
-            embeddings.append(vo_client.embed(batch, model="voyage-large-2-instruct", input_type="document").embeddings)
+            embeddings.append(await make_voyage_embed_request(vo_client, batch))
         
         return [emb for embs in embeddings for emb in embs]
         
     
     async def __call__(self, vo_client:VoyageClient, file_name:str, file:dict, text_splitter, batchsize:int=100):
-        """ runs the key functions of the class """
-        text_chunks = self.create_chunks_for_index(file_name, file, text_splitter)
-        chunk_embeddings = self.get_chunk_embeddings(vo_client, text_chunks, batchsize)
+        """ runs the key functions of the class, the blocking voyage calls run in worker threads """
+        text_chunks = await asyncio.to_thread(self.create_chunks_for_index, file_name, file, text_splitter)
+        chunk_embeddings = await self.get_chunk_embeddings(vo_client, text_chunks, batchsize)
         return {"chunks":text_chunks, "embeddings": chunk_embeddings}
 
 
+CONTEXT_EXTRACTIONS = ('context', 'research_questions', 'thematic_areas')
+CONTEXT_PROMPTS = dict(zip(CONTEXT_EXTRACTIONS, (context, research_questions, thematic_areas)))
+
+
 class Context:
 
     def __init__(self, internals:dict):
         self.internals = copy.deepcopy(internals)
 
 
-    async def generate_context(self, oai_client:AsyncOpenAI, context_prompt:str, research_plan:str, max_retries:int=10) -> dict:
-        """ get the research questions out of the research documents """
-        response = None
+    async def generate_context(self, oai_client:AsyncOpenAI, context_prompt:str, research_plan:str, completion_cache:CompletionCache=None) -> dict:
+        """ get the research questions out of the research documents, failed or malformed responses are retried """
         try:
-            for i in range(max_retries):
-                response = await make_open_ai_request(oai_client, context_prompt, research_plan, response_format={"type": "json_object"})
-                return json.loads(response.choices[0].message.content)
+            return await make_open_ai_json_request(oai_client, context_prompt, research_plan, completion_cache=completion_cache)
         except Exception as e:
-            print(e)
-            print(response)
+            logging.error(f"Could not generate context: {type(e).__name__} {e}")
             return {"Max Retries Exceed" : "Could not get message content from OpenAI"}
         
 
-    async def __call__(self, oai_client:AsyncOpenAI, research_plan_text:str):
-        """ Creates the Context for the Research Project """
+    async def extract_concurrently(self, oai_client:AsyncOpenAI, research_plan_text:str, completion_cache:CompletionCache=None) -> tuple:
+        """ three JSON mode calls in flight at once, each one sends the full research plan """
+        return await asyncio.gather(*[
+            self.generate_context(oai_client, CONTEXT_PROMPTS[key], research_plan_text, completion_cache) for key in CONTEXT_EXTRACTIONS
+        ])
+
+
+    async def extract_combined(self, oai_client:AsyncOpenAI, research_plan_text:str, completion_cache:CompletionCache=None) -> tuple:
+        """ one JSON mode call for all three extractions, the research plan is only sent once """
+        extraction = await self.generate_context(oai_client, combined, research_plan_text, completion_cache)
+        missing = [key for key in CONTEXT_EXTRACTIONS if not isinstance(extraction.get(key), dict) or not extraction[key]]
+        if missing:
+            logging.warning(f"COMBINED CONTEXT MISSING {missing}, EXTRACTING SEPARATELY...")
+            fallbacks = await asyncio.gather(*[
+                self.generate_context(oai_client, CONTEXT_PROMPTS[key], research_plan_text, completion_cache) for key in missing
+            ])
+            extraction = {**extraction, **dict(zip(missing, fallbacks))}
+        return tuple(extraction[key] for key in CONTEXT_EXTRACTIONS)
+
+
+    async def __call__(self, oai_client:AsyncOpenAI, research_plan_text:str, completion_cache:CompletionCache=None, mode:str='concurrent'):
+        """ 
+        Creates the Context for the Research Project 
+        mode is concurrent, three calls at once, or combined, a single call extracting everything
+        """
 
         context_dict = {}
 
         context_dict['research_plan_text'] = research_plan_text
 
-        context_dict['context']  = await self.generate_context(
-            oai_client, context, research_plan_text
-        )
-        
-        context_dict['context']['research_questions'] = build_string(
-            await self.generate_context(
-                oai_client, research_questions, 
-                research_plan_text
-            )
-        )
-        
-        context_dict['context']['thematic_areas'] = build_string(
-            await self.generate_context(
-                oai_client, thematic_areas, 
-                research_plan_text
-            )
-        )
+        if mode == 'combined':
+            project_context, project_questions, project_themes = await self.extract_combined(oai_client, research_plan_text, completion_cache)
+        else:
+            project_context, project_questions, project_themes = await self.extract_concurrently(oai_client, research_plan_text, completion_cache)
+
+        context_dict['context'] = dict(project_context)
+        context_dict['context']['research_questions'] = build_string(project_questions)
+        context_dict['context']['thematic_areas'] = build_string(project_themes)
 
         context_dict['agent_internals'] =  update_internals(context_dict['context'], self.internals['agent_internals']) 
         
@@ -148,8 +206,11 @@ async def generate_context(
     proposal_file_name:str, 
     project_folder_name:str, 
     overwrite:Optional[bool]=False, 
+    bypass_cache:Optional[bool]=False,
+    mode:Literal['concurrent', 'combined']='concurrent',
     oai_client:AsyncOpenAI=Depends(get_oai_client),
-    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client),
+    document_store:DocumentStore=Depends(get_document_store)
     ) -> dict:   
     """
     Second step in the chain is to get the contextualizing information from the RFP, 
@@ -158,100 +219,358 @@ async def generate_context(
     proposal_file_name="city_of_kelowna/sub_project_1/20240524_KelownaClimateDev_Research Plan vEPR.pdf"
     project_folder_name = "city_of_kelowna/sub_project_1"
     """
+    context_name = f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}"
     project_context = None
     try:
-        context_blob = await get_blob(
-            f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}",
-            service_client=blob_client
-        )
+        context_blob = await document_store.get(context_name)
         project_context = list(context_blob.values()).pop()
 
     except Exception as e:
         logging.info(f"NO CONTEXT FOUND...")
 
     if not project_context or overwrite:
-        blob = await get_blob(
-            f"{proposal_file_name}", 
-            service_client=blob_client
-        )
+        blob = await document_store.get(proposal_file_name)
 
         project_context = await Context(settings.AGENT_INTERNALS)(
             research_plan_text=get_all_textIN(list(blob.keys()).pop(), list(blob.values()).pop()),
-            oai_client=oai_client
+            oai_client=oai_client,
+            completion_cache=get_completion_cache(project_folder_name, blob_client, bypass_cache),
+            mode=mode
         )
 
         await create_blob(
-            blob_name=f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}",
+            blob_name=context_name,
             content=project_context,
             overwrite=overwrite,
             service_client=blob_client
         )
+        document_store.put(context_name, {get_file_name(context_name): project_context})
 
     return project_context
 
 
 
-@router.post("/index") 
-async def create_index_record(
-    project_folder_name:str, 
-    file_name:List[str],
-    batchsize:Optional[int]=100,
-    vo_client:VoyageClient=Depends(get_voyage_ai_client),
-    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)):   
+def get_index_path(project_folder_name:str, name:str) -> str:
+    return f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.INDEX_FOLDER}/{name}"
+
+
+async def load_index_manifest(project_folder_name:str, blob_client:BlobServiceClient) -> tuple:
+    """ returns the project's index manifest and its etag, or (None, None) when there is no manifest yet """
+    try:
+        manifest, etag = await download_json_with_etag(
+            get_index_path(project_folder_name, settings.INDEX_MANIFEST_NAME), 
+            blob_client
+        )
+        return normalize_manifest(manifest), etag
+
+    except ResourceNotFoundError:
+        logging.info(f"NO INDEX MANIFEST FOUND...")
+        return None, None
+
+
+async def get_index_etag(project_folder_name:str, blob_client:BlobServiceClient) -> Optional[str]:
+    """ 
+    etag of the blob that versions a project's index, read with a HEAD request 
+    the manifest changes on every commit, projects on the legacy format are versioned by index.json
+    """
+    for blob_name in [
+        get_index_path(project_folder_name, settings.INDEX_MANIFEST_NAME), 
+        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.INDEX_FILE_NAME}"
+    ]:
+        try:
+            properties = await blob_client.get_blob_client(
+                container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+                blob=blob_name
+            ).get_blob_properties()
+            return properties.etag
+
+        except ResourceNotFoundError:
+            continue
+
+    return None
+
+
+async def load_index_segment(project_folder_name:str, segment:dict, blob_client:BlobServiceClient) -> tuple:
+    """ downloads one segment's chunk metadata and vectors """
+    chunks, vectors = await asyncio.gather(
+        download_blob_bytes(get_index_path(project_folder_name, segment['chunks']), blob_client),
+        download_blob_bytes(get_index_path(project_folder_name, segment['vectors']), blob_client)
+    )
+    return deserialize_chunks(chunks), deserialize_vectors(vectors)
+
+
+async def load_index(project_folder_name:str, blob_client:BlobServiceClient) -> dict:
     """ 
-    updates the index file
-    city_of_kelowna/sub_project_1/1184_492.pdf
+    loads a project's index, the segments are downloaded concurrently 
+    and their vectors joined into one (N, d) float32 array
+    projects still on the legacy index.json are read and converted in memory
     """
+    manifest, _ = await load_index_manifest(project_folder_name, blob_client)
+    if manifest is None:
+        return await load_legacy_index(project_folder_name, blob_client)
+
+    segments = await asyncio.gather(*[
+        load_index_segment(project_folder_name, segment, blob_client) for segment in manifest['segments']
+    ])
+    textstore, vectorstore = concatenate_segments(segments)
+    ann = await load_ann_index(project_folder_name, blob_client) if len(vectorstore) >= settings.ANN_THRESHOLD else None
+    if ann is not None and get_unfiled_segments(manifest, ann) is None:
+        # segments were replaced since the ann index was written, its row ids no longer match until it is rebuilt
+        logging.info("ANN INDEX DOES NOT MATCH THE MANIFEST, SEARCHING EXACTLY...")
+        ann = None
+
+    return {
+        "filenames": get_manifest_filenames(manifest),
+        "textstore": textstore,
+        "vectorstore": vectorstore,
+        "ann": ann,
+    }
+
+
+async def load_ann_index(project_folder_name:str, blob_client:BlobServiceClient) -> Optional[IVFIndex]:
+    """ the IVF index stored next to the segments, None when it has not been built """
+    try:
+        return IVFIndex.from_bytes(await download_blob_bytes(
+            get_index_path(project_folder_name, settings.INDEX_ANN_NAME), 
+            blob_client
+        ))
+
+    except ResourceNotFoundError:
+        logging.info(f"NO ANN INDEX FOUND...")
+        return None
+
+
+async def load_segment_vectors(project_folder_name:str, segments:List[dict], blob_client:BlobServiceClient) -> np.ndarray:
+    """ the unit length vectors of the segments, in manifest order, without their chunk metadata """
+    vectors = await asyncio.gather(*[
+        download_blob_bytes(get_index_path(project_folder_name, segment['vectors']), blob_client) for segment in segments
+    ])
+    return normalize_rows(concatenate_segments([([], deserialize_vectors(data)) for data in vectors])[1])
+
+
+def get_unfiled_segments(manifest:dict, ann:IVFIndex) -> Optional[List[dict]]:
+    """ 
+    the segments committed after the ann index was written, 
+    None when the segments it was filed from are not the manifest's first segments in order, its rows would not match
+    """
+    filed = ann.segments
+    if filed is None or [segment['vectors'] for segment in manifest['segments'][:len(filed)]] != filed:
+        return None
+    if sum(segment['count'] for segment in manifest['segments'][:len(filed)]) != len(ann):
+        return None
+    return manifest['segments'][len(filed):]
+
+
+async def update_ann_index(project_folder_name:str, manifest:dict, blob_client:BlobServiceClient, rebuild:bool=False) -> None:
+    """ 
+    builds the IVF index once a project has more than ANN_THRESHOLD chunks,
+    only the vectors of segments committed since it was written are downloaded and filed under the existing centroids,
+    it is rebuilt from every segment once the index has grown by ANN_REBUILD_GROWTH, or when segments were replaced
+    """
+    total = sum(segment['count'] for segment in manifest['segments'])
+    if total < settings.ANN_THRESHOLD:
+        return
+
+    ann = None if rebuild else await load_ann_index(project_folder_name, blob_client)
+    unfiled = get_unfiled_segments(manifest, ann) if ann is not None else None
+    if unfiled is None or total > len(ann) * (1 + settings.ANN_REBUILD_GROWTH):
+        logging.info(f"BUILDING ANN INDEX OVER {total} CHUNKS...")
+        vectors = await load_segment_vectors(project_folder_name, manifest['segments'], blob_client)
+        ann = await asyncio.to_thread(IVFIndex.build, vectors, segments=[segment['vectors'] for segment in manifest['segments']])
+    elif unfiled:
+        vectors = await load_segment_vectors(project_folder_name, unfiled, blob_client)
+        ann = await asyncio.to_thread(ann.add, vectors, [segment['vectors'] for segment in unfiled])
+    else:
+        return
+
+    await upload_blob_bytes(
+        get_index_path(project_folder_name, settings.INDEX_ANN_NAME), 
+        ann.to_bytes(), 
+        True, 
+        blob_client
+    )
+
+
+async def load_legacy_index(project_folder_name:str, blob_client:BlobServiceClient) -> dict:
+    """ migration path for indexes written as a single index.json """
     try:
         index_blob = await get_blob(
             f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.INDEX_FILE_NAME}", 
             service_client=blob_client
         )
-        index = list(index_blob.values()).pop()
+        return migrate_legacy_index(list(index_blob.values()).pop())
 
-    except Exception as e:
+    except ResourceNotFoundError:
         logging.info(f"NO INDEX FOUND...")
-        index = {
-            "filenames": [],
-            "textstore": [],
-            "vectorstore": [],
-        }
-
-    assert len(index['textstore']) == len(index['vectorstore'])
-    proper_file_name = get_file_name(file_name)
-
-    if proper_file_name not in index['filenames']:
-        chunker = SemanticChunker(
-            VoyageAIEmbeddings(
-                voyage_api_key=settings.VOYAGE_API_KEY, model="voyage-large-2-instruct"
-            ),
-            breakpoint_threshold_type="percentile"
-        )
+        return empty_index()
+
+
+async def load_index_filenames(project_folder_name:str, blob_client:BlobServiceClient) -> List[str]:
+    """ names of the files already in a project's index, only reads the manifest when there is one """
+    manifest, _ = await load_index_manifest(project_folder_name, blob_client)
+    if manifest is None:
+        return (await load_legacy_index(project_folder_name, blob_client))['filenames']
+    return get_manifest_filenames(manifest)
+
+
+async def write_index_segment(project_folder_name:str, files:List[str], chunks:List[dict], embeddings, blob_client:BlobServiceClient) -> dict:
+    """ uploads an immutable segment, it is not part of the index until a manifest commit references it """
+    segment_name = f"{settings.INDEX_SEGMENTS_FOLDER}/{Path(files[0]).stem}-{uuid.uuid4().hex[:8]}"
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    segment = build_segment(files, vectors, f"{segment_name}.npy", f"{segment_name}.chunks.json")
+
+    await asyncio.gather(
+        upload_blob_bytes(get_index_path(project_folder_name, segment['vectors']), serialize_vectors(vectors), False, blob_client),
+        upload_blob_bytes(get_index_path(project_folder_name, segment['chunks']), serialize_chunks(chunks), False, blob_client, 'application/json')
+    )
+    return segment
+
+
+async def write_legacy_segments(project_folder_name:str, blob_client:BlobServiceClient) -> List[dict]:
+    """ the legacy index.json written as a segment, empty when the project has no legacy index """
+    legacy_index = await load_legacy_index(project_folder_name, blob_client)
+    if not legacy_index['filenames']:
+        return []
+    return [await write_index_segment(
+        project_folder_name, legacy_index['filenames'], legacy_index['textstore'], legacy_index['vectorstore'], blob_client
+    )]
+
+
+async def write_segment_without(project_folder_name:str, segment:dict, files:List[str], blob_client:BlobServiceClient) -> dict:
+    """ a copy of a segment holding several files, without the chunks of the given files """
+    chunks, vectors = await load_index_segment(project_folder_name, segment, blob_client)
+    keep = [idx for idx, chunk in enumerate(chunks) if chunk.get('title') not in files]
+    return await write_index_segment(
+        project_folder_name, 
+        [file_name for file_name in segment['files'] if file_name not in files], 
+        [chunks[idx] for idx in keep], 
+        vectors[keep], 
+        blob_client
+    )
+
+
+async def commit_index_segments(project_folder_name:str, segments:List[dict], blob_client:BlobServiceClient, replace:List[str]=()) -> dict:
+    """ 
+    adds segments to the manifest with an etag conditional write, 
+    when another writer got there first the manifest is re-read and the commit retried
+    a legacy index.json is migrated to a segment once, retries reuse it rather than writing it again
 
-        file_content = await get_blob(
-            file_name, 
-            service_client=blob_client
-        )
+    the chunks of the files in replace are dropped from the index before the segments are added,
+    a segment they share with other files is written again without them, once per commit
+    the dropped segment blobs are left in place, readers of the previous manifest may still download them
+    """
+    manifest_name = get_index_path(project_folder_name, settings.INDEX_MANIFEST_NAME)
+    legacy_segments = None
+    rewritten_segments = {}
+    for _ in range(settings.INDEX_COMMIT_ATTEMPTS):
+        manifest, etag = await load_index_manifest(project_folder_name, blob_client)
+        if manifest is None:
+            if legacy_segments is None:
+                legacy_segments = await write_legacy_segments(project_folder_name, blob_client)
+            manifest = add_segments_to_manifest(empty_manifest(), legacy_segments)
+
+        if replace:
+            manifest, shared = remove_files_from_manifest(manifest, replace)
+            for segment in shared:
+                if segment['vectors'] not in rewritten_segments:
+                    rewritten_segments[segment['vectors']] = await write_segment_without(project_folder_name, segment, replace, blob_client)
+            manifest = add_segments_to_manifest(manifest, [rewritten_segments[segment['vectors']] for segment in shared])
+
+        manifest = add_segments_to_manifest(manifest, segments)
+        try:
+            await upload_blob_bytes(
+                manifest_name, 
+                json.dumps(manifest).encode('utf-8'), 
+                overwrite=etag is not None, 
+                service_client=blob_client, 
+                content_type='application/json', 
+                etag=etag
+            )
+            return manifest
+
+        except (ResourceModifiedError, ResourceExistsError):
+            logging.info("INDEX MANIFEST CHANGED, RETRYING COMMIT...")
+
+    raise IndexCommitError(project_folder_name=project_folder_name)
+
+
+async def index_file(
+        project_folder_name:str, 
+        file_name:str, 
+        chunker:SemanticChunker, 
+        batchsize:int, 
+        semaphore:asyncio.Semaphore, 
+        vo_client:VoyageClient, 
+        blob_client:BlobServiceClient,
+        document_store:Optional[DocumentStore]=None
+    ) -> dict:
+    """ downloads, chunks and embeds one file, then uploads it as an uncommitted index segment """
+    document_store = document_store or DocumentStore(blob_client)
+    async with semaphore:
+        proper_file_name = get_file_name(file_name)
+        file_content = await document_store.get(file_name)
 
         indexer = Indexer()
         record = await indexer(vo_client, proper_file_name, list(file_content.values()).pop(), chunker, batchsize)
 
         assert len(record['chunks']) == len(record['embeddings'])
 
-        index['filenames'].append(proper_file_name)
-        index['textstore'] += record['chunks']
-        index['vectorstore'] += record["embeddings"]
+        return await write_index_segment(project_folder_name, [proper_file_name], record['chunks'], record['embeddings'], blob_client)
 
-        await create_blob(
-            blob_name=f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.INDEX_FILE_NAME}",
-            content=index,
-            overwrite=True,
-            service_client=blob_client
-        )
+
+def get_semantic_chunker() -> SemanticChunker:
+    return SemanticChunker(
+        VoyageAIEmbeddings(
+            voyage_api_key=settings.VOYAGE_API_KEY, model="voyage-large-2-instruct"
+        ),
+        breakpoint_threshold_type="percentile"
+    )
+
+
+async def commit_index(project_folder_name:str, segments:List[dict], blob_client:BlobServiceClient, replace:List[str]=()) -> dict:
+    """ 
+    commits the segments to the manifest, replacing the chunks of the files in replace,
+    and updates the ANN index once the project is large enough, it is rebuilt when chunks were replaced
+    """
+    manifest = await commit_index_segments(project_folder_name, segments, blob_client, replace)
+    await update_ann_index(project_folder_name, manifest, blob_client, rebuild=bool(replace))
+    return manifest
+
+
+@router.post("/index") 
+async def create_index_record(
+    project_folder_name:str, 
+    file_name:List[str],
+    batchsize:Optional[int]=settings.INDEX_EMBED_BATCH_SIZE,
+    concurrency:Optional[int]=settings.INDEX_CONCURRENCY,
+    vo_client:VoyageClient=Depends(get_voyage_ai_client),
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client),
+    document_store:DocumentStore=Depends(get_document_store)):   
+    """ 
+    adds a batch of files to the index, 
+    the files are downloaded, chunked and embedded concurrently and committed to the index in one write
+
+    file_name: ["city_of_kelowna/sub_project_1/1184_492.pdf", "city_of_kelowna/sub_project_1/1184_493.pdf"]
+    """
+    if isinstance(file_name, str):
+        file_name = [file_name]
+
+    filenames = await load_index_filenames(project_folder_name, blob_client)
+    new_files = list(dict.fromkeys(name for name in file_name if get_file_name(name) not in filenames))
+
+    if new_files:
+        chunker = get_semantic_chunker()
+        semaphore = limit_semaphore(concurrency, settings.INDEX_CONCURRENCY)
+        segments = await asyncio.gather(*[
+            index_file(project_folder_name, name, chunker, batchsize, semaphore, vo_client, blob_client, document_store) for name in new_files
+        ])
+
+        manifest = await commit_index(project_folder_name, segments, blob_client)
+        filenames = get_manifest_filenames(manifest)
     else:
-        logging.info("File already in Index")
+        logging.info("Files already in Index")
 
-    return {'files': index['filenames']}
+    return {'files': filenames}
 
 
 @router.post("/delete") 
@@ -1,11 +1,13 @@
 import json 
+import asyncio
 import logging
 
-from io import BytesIO
+from typing import Dict, Optional
 
-from typing import Optional
-
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
 
 from fastapi import (
     HTTPException,
@@ -15,13 +17,27 @@ from fastapi import (
 
 
 from SolwayAPI.api.v1.core.config import settings
-from SolwayAPI.api.v1.core.clients import get_blob_storage_client
-from SolwayAPI.api.v1.core.utils.blobstorage_helpers import parse_files
+from SolwayAPI.api.v1.core.clients import (
+    get_blob_storage_client,
+    get_process_pool
+)
+from SolwayAPI.api.v1.core.utils.cache_helpers import LRUCache, sizeof_parsed_document
+from SolwayAPI.api.v1.core.utils.blobstorage_helpers import (
+    get_file_extension,
+    get_file_name,
+    get_parsed_document_name,
+    parse_files,
+    parse_pdf_parallel
+)
 
 def get_az_blob_storage_client(client:BlobServiceClient=Depends(get_blob_storage_client)):
     return client
 
 
+# parsed documents keyed by blob name, each entry remembers the etag / md5 it was parsed from
+parsed_document_cache = LRUCache(settings.PARSED_CACHE_MAX_BYTES, sizeof=lambda entry: sizeof_parsed_document(entry['document']))
+
+
 logging.basicConfig(level=logging.INFO)
 
 router = APIRouter(tags=['azure-blob-storage'])
@@ -35,10 +51,125 @@ async def get_blob(blob_name:str, service_client=Depends(get_az_blob_storage_cli
         container=settings.BLOB_STORAGE_CONTAINER_NAME, 
         blob=blob_name
     )
-    stream = BytesIO()
-    blob_client.download_blob().readinto(stream)
-    stream.seek(0)
-    return parse_files({blob_name:stream.read()})
+    if get_file_extension(blob_name) == 'pdf':
+        return await get_parsed_document(blob_name, blob_client, service_client)
+
+    downloader = await blob_client.download_blob(max_concurrency=settings.BLOB_MAX_CONCURRENCY)
+    return parse_files({blob_name: await downloader.readall()})
+
+
+class DocumentStore:
+    """
+    request scoped store of parsed blobs, each blob is downloaded and parsed at most once per request
+    concurrent readers of the same blob share a single fetch, a fetch that fails is forgotten so it can be retried
+    callers must treat the returned documents as read only, they are shared
+    """
+
+    def __init__(self, service_client:BlobServiceClient):
+        self.service_client = service_client
+        self._documents:Dict[str, asyncio.Future] = {}
+
+
+    def __contains__(self, blob_name:str) -> bool:
+        return blob_name in self._documents
+
+
+    async def get(self, blob_name:str) -> dict:
+        """ the blob as get_blob returns it """
+        if blob_name not in self._documents:
+            document = asyncio.ensure_future(get_blob(blob_name, service_client=self.service_client))
+            document.add_done_callback(lambda fetch: self._forget_failed(blob_name, fetch))
+            self._documents[blob_name] = document
+
+        # a reader that is cancelled must not cancel the fetch the other readers are waiting on
+        return await asyncio.shield(self._documents[blob_name])
+
+
+    def put(self, blob_name:str, contents:dict) -> None:
+        """ replaces a blob's contents after this request has written it """
+        document = asyncio.get_running_loop().create_future()
+        document.set_result(contents)
+        self._documents[blob_name] = document
+
+
+    def discard(self, blob_name:str) -> None:
+        """ releases a document no later stage of the request will read """
+        self._documents.pop(blob_name, None)
+
+
+    def _forget_failed(self, blob_name:str, fetch:asyncio.Future) -> None:
+        if (fetch.cancelled() or fetch.exception() is not None) and self._documents.get(blob_name) is fetch:
+            del self._documents[blob_name]
+
+
+def get_document_store(service_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> DocumentStore:
+    """ a new store for every request, endpoints called from the pipeline are passed the pipeline's store """
+    return DocumentStore(service_client)
+
+
+def get_content_md5(properties) -> Optional[str]:
+    """ hex content hash of a blob, azure only stores it for blobs uploaded in a single request """
+    content_md5 = properties.content_settings.content_md5
+    return bytes(content_md5).hex() if content_md5 else None
+
+
+def is_same_version(entry:dict, etag:str, content_md5:Optional[str]) -> bool:
+    """ a parsed entry is fresh when its source etag, or its content hash, matches the blob """
+    if entry.get('etag') == etag:
+        return True
+    return bool(content_md5) and entry.get('content_md5') == content_md5
+
+
+async def get_parsed_document(blob_name:str, blob_client, service_client:BlobServiceClient) -> dict:
+    """
+    returns a parsed document, parsing it at most once per content version
+    looks in the in-process LRU first, then the persisted sidecar blob, before downloading and parsing the source
+    """
+    file_name = get_file_name(blob_name)
+    properties = await blob_client.get_blob_properties()
+    content_md5 = get_content_md5(properties)
+
+    entry = parsed_document_cache.get(blob_name)
+    if entry and is_same_version(entry, properties.etag, content_md5):
+        return {file_name: entry['document']}
+
+    sidecar_name = get_parsed_document_name(blob_name, settings.TMP_FOLDER, settings.PARSED_FOLDER)
+    try:
+        sidecar = list((await get_blob(sidecar_name, service_client=service_client)).values()).pop()
+        if is_same_version(sidecar, properties.etag, content_md5):
+            # json object keys are strings, page numbers are restored as integers
+            sidecar['document'] = {int(page):data for page, data in sidecar['document'].items()}
+            parsed_document_cache.put(blob_name, sidecar)
+            return {file_name: sidecar['document']}
+
+    except ResourceNotFoundError:
+        logging.info(f"NO PARSED DOCUMENT FOUND: {sidecar_name}")
+
+    downloader = await blob_client.download_blob(max_concurrency=settings.BLOB_MAX_CONCURRENCY)
+    document = await parse_pdf_parallel(
+        await downloader.readall(),
+        executor=get_process_pool(),
+        page_threshold=settings.PDF_PARALLEL_PAGE_THRESHOLD,
+        num_workers=settings.PDF_PARSE_WORKERS
+    )
+
+    entry = {
+        "etag": downloader.properties.etag,
+        "content_md5": get_content_md5(downloader.properties),
+        "document": document
+    }
+    parsed_document_cache.put(blob_name, entry)
+    try:
+        await create_blob(
+            blob_name=sidecar_name,
+            content=entry,
+            overwrite=True,
+            service_client=service_client
+        )
+    except HTTPException as e:
+        logging.warning(f"COULD NOT PERSIST PARSED DOCUMENT: {sidecar_name} {e.detail}")
+
+    return {file_name: document}
 
 
 
@@ -51,13 +182,96 @@ async def create_blob(blob_name:str, content:str, overwrite:Optional[bool], serv
         blob=blob_name
     )
     try:
-        blob_client.upload_blob(json.dumps(content), content_type='application/json', overwrite=overwrite)
+        await blob_client.upload_blob(
+            json.dumps(content), 
+            content_settings=ContentSettings(content_type='application/json'), 
+            overwrite=overwrite,
+            max_concurrency=settings.BLOB_MAX_CONCURRENCY
+        )
         return f"JSON uploaded successfully to blob: {blob_name}"
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading JSON to blob: {str(e)}")
 
 
+async def download_blob_bytes(blob_name:str, service_client:BlobServiceClient) -> bytes:
+    """ downloads the raw contents of a blob, without parsing them """
+    blob_client = service_client.get_blob_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+        blob=blob_name
+    )
+    downloader = await blob_client.download_blob(max_concurrency=settings.BLOB_MAX_CONCURRENCY)
+    return await downloader.readall()
+
+
+async def blob_exists(blob_name:str, service_client:BlobServiceClient) -> bool:
+    """ whether a blob exists, read with a HEAD request """
+    blob_client = service_client.get_blob_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+        blob=blob_name
+    )
+    return await blob_client.exists()
+
+
+async def delete_blob_if_exists(blob_name:str, service_client:BlobServiceClient) -> None:
+    blob_client = service_client.get_blob_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+        blob=blob_name
+    )
+    try:
+        await blob_client.delete_blob()
+    except ResourceNotFoundError:
+        pass
+
+
+async def download_json_with_etag(blob_name:str, service_client:BlobServiceClient) -> tuple:
+    """ downloads a JSON blob along with the etag it was read at, for conditional writes """
+    blob_client = service_client.get_blob_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+        blob=blob_name
+    )
+    downloader = await blob_client.download_blob()
+    return json.loads(await downloader.readall()), downloader.properties.etag
+
+
+async def upload_blob_bytes(
+        blob_name:str, 
+        data:bytes, 
+        overwrite:bool, 
+        service_client:BlobServiceClient, 
+        content_type:str='application/octet-stream', 
+        etag:Optional[str]=None
+    ) -> dict:
+    """ 
+    uploads raw bytes to a blob, returns the upload properties including the new etag 
+    when an etag is passed the write only succeeds if the blob has not changed since it was read
+    """
+    logging.info(f"CREATING BLOB: {settings.BLOB_STORAGE_CONTAINER_NAME}/{blob_name}")
+    blob_client = service_client.get_blob_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME, 
+        blob=blob_name
+    )
+    conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
+    return await blob_client.upload_blob(
+        data, 
+        content_settings=ContentSettings(content_type=content_type), 
+        overwrite=overwrite,
+        max_concurrency=settings.BLOB_MAX_CONCURRENCY,
+        **conditions
+    )
+
+
+async def list_blob_versions(directory_name:str, service_client:BlobServiceClient) -> Dict[str, dict]:
+    """ etag and content hash of every blob under a directory, read from a single listing """
+    container_client = service_client.get_container_client(
+        container=settings.BLOB_STORAGE_CONTAINER_NAME
+    )
+    return {
+        blob.name: {"etag": blob.etag, "content_md5": get_content_md5(blob)} 
+        async for blob in container_client.list_blobs(name_starts_with=directory_name)
+    }
+
+
 @router.get("/describe-container-contents")
 async def describe_container(directory_name:Optional[str]=None, service_client=Depends(get_az_blob_storage_client)) -> dict:
     """ prints the names of the blobs in a container"""
@@ -68,7 +282,7 @@ async def describe_container(directory_name:Optional[str]=None, service_client=D
 
     blob_list = blob_client.walk_blobs(name_starts_with=directory_name, delimiter='')
 
-    files = [blob.name for blob in blob_list]
+    files = [blob.name async for blob in blob_list]
 
     return {
         "container_files": files
@@ -0,0 +1,383 @@
+import json
+import uuid
+import asyncio
+import logging
+
+from typing import Dict, List, Literal, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException
+)
+
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob.aio import BlobServiceClient
+
+from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.core.clients import (
+    get_blob_storage_client,
+    get_openai_client,
+    get_voyage_client
+)
+from SolwayAPI.api.v1.core.utils.job_helpers import (
+    JOB_FAILED,
+    JOB_INTERRUPTED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    RECOVERABLE_STATUSES,
+    get_job_path,
+    get_pending_job_path,
+    is_job_stale,
+    job_status,
+    new_job_record,
+    utc_now
+)
+
+from .skillchain import validate_skills
+
+from .pipe import (
+    PipelineProgress,
+    execute_pipeline
+)
+
+from .blobstorage import (
+    get_az_blob_storage_client,
+    delete_blob_if_exists,
+    download_blob_bytes,
+    download_json_with_etag,
+    list_blob_versions,
+    upload_blob_bytes
+)
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+class PipelineJob(PipelineProgress):
+    """
+    a pipeline run checkpointed to <project>/artifacts/jobs/<job_id>.json after every stage and file,
+    so a job that crashed or timed out resumes where it stopped
+    """
+
+    def __init__(self, record:dict, blob_client:BlobServiceClient):
+        super().__init__(record)
+        self.blob_client = blob_client
+        self._lock = asyncio.Lock()
+
+
+    @property
+    def job_id(self) -> str:
+        return self.record['job_id']
+
+
+    @property
+    def path(self) -> str:
+        return get_job_path(
+            self.record['params']['project_folder_name'],
+            settings.TMP_FOLDER,
+            settings.JOBS_FOLDER,
+            self.job_id
+        )
+
+
+    async def save(self):
+        """ concurrent checkpoints are written one at a time, each one writes the latest record """
+        async with self._lock:
+            await super().save()
+            await upload_blob_bytes(
+                self.path,
+                json.dumps(self.record, default=str).encode('utf-8'),
+                True,
+                self.blob_client,
+                'application/json'
+            )
+
+
+    async def set_status(self, status:str, **fields):
+        self.record.update(status=status, **fields)
+        await self.save()
+
+
+    @property
+    def pending_path(self) -> str:
+        return get_pending_job_path(settings.PENDING_JOBS_FOLDER, self.job_id)
+
+
+    async def mark_pending(self):
+        """ lists the job among the unfinished ones, where the workers of any instance can recover it from """
+        await upload_blob_bytes(
+            self.pending_path,
+            json.dumps({"job_id": self.job_id, "path": self.path}).encode('utf-8'),
+            True,
+            self.blob_client,
+            'application/json'
+        )
+
+
+    async def clear_pending(self):
+        await delete_blob_if_exists(self.pending_path, self.blob_client)
+
+
+    async def heartbeat(self, interval:float):
+        """ 
+        checkpoints the job every interval seconds while it is queued or runs on this instance, 
+        so a live job is never taken for a stale one 
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+
+    @classmethod
+    async def load(cls, project_folder_name:str, job_id:str, blob_client:BlobServiceClient) -> "PipelineJob":
+        try:
+            record = json.loads(await download_blob_bytes(
+                get_job_path(project_folder_name, settings.TMP_FOLDER, settings.JOBS_FOLDER, job_id),
+                blob_client
+            ))
+        except ResourceNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found in {project_folder_name}")
+        return cls(record, blob_client)
+
+
+async def run_pipeline_job(job:PipelineJob):
+    """ runs a job's remaining stages with the shared clients, the outcome is checkpointed with the job """
+    await job.set_status(JOB_RUNNING, error=None)
+    try:
+        result = await execute_pipeline(
+            **job.record['params'],
+            oai_client=get_openai_client(),
+            vo_client=get_voyage_client(),
+            blob_client=job.blob_client,
+            progress=job
+        )
+
+    except asyncio.CancelledError:
+        await asyncio.shield(job.set_status(JOB_INTERRUPTED))
+        raise
+
+    except Exception as e:
+        logging.exception(f"PIPELINE JOB {job.job_id} FAILED")
+        await job.set_status(JOB_FAILED, error=f"{type(e).__name__}: {e}")
+        await job.clear_pending()
+        return
+
+    await job.set_status(JOB_SUCCEEDED, result=result)
+    await job.clear_pending()
+
+
+class PipelineJobQueue:
+    """
+    in-process queue of pipeline jobs, drained by background workers started with the app
+    jobs on it are heartbeated and listed under PENDING_JOBS_FOLDER until they finish, 
+    so when the host is recycled or scaled in, the workers of the next instance to start, or of any running one,
+    pick its queued, running and interrupted jobs up again once their checkpoints are PIPELINE_JOB_STALE_AFTER old
+    """
+
+    def __init__(self, workers:int=1, recovery_interval:float=settings.PIPELINE_JOB_STALE_AFTER):
+        self.workers = workers
+        self.recovery_interval = recovery_interval
+        self.queue = asyncio.Queue()
+        self.active:Dict[str, PipelineJob] = {}
+        self._heartbeats:Dict[str, asyncio.Task] = {}
+        self._tasks:List[asyncio.Task] = []
+
+
+    def is_active(self, job_id:str) -> bool:
+        return job_id in self.active
+
+
+    async def submit(self, job:PipelineJob):
+        await job.mark_pending()
+        self.active[job.job_id] = job
+        self._heartbeats[job.job_id] = asyncio.create_task(job.heartbeat(settings.PIPELINE_JOB_HEARTBEAT_INTERVAL))
+        await self.queue.put(job)
+
+
+    async def recover(self, blob_client:BlobServiceClient):
+        """ 
+        queues the unfinished jobs no instance has checkpointed for PIPELINE_JOB_STALE_AFTER,
+        a job is claimed with a conditional write of its checkpoint, so only one instance takes it over
+        """
+        for pending_path in await list_blob_versions(f"{settings.PENDING_JOBS_FOLDER}/", blob_client):
+            try:
+                pending = json.loads(await download_blob_bytes(pending_path, blob_client))
+                if self.is_active(pending['job_id']):
+                    continue
+
+                record, etag = await download_json_with_etag(pending['path'], blob_client)
+                job = PipelineJob(record, blob_client)
+                if record['status'] not in RECOVERABLE_STATUSES:
+                    await job.clear_pending()
+                    continue
+                if not is_job_stale(record, settings.PIPELINE_JOB_STALE_AFTER):
+                    continue
+
+                record.update(status=JOB_QUEUED, updated_at=utc_now())
+                await upload_blob_bytes(
+                    job.path, json.dumps(record, default=str).encode('utf-8'), True, blob_client, 'application/json', etag=etag
+                )
+
+            except ResourceNotFoundError:
+                await delete_blob_if_exists(pending_path, blob_client)
+                continue
+
+            except ResourceModifiedError:
+                logging.info(f"PIPELINE JOB {pending['job_id']} WAS CHECKPOINTED BY ANOTHER WORKER, NOT RECOVERING IT")
+                continue
+
+            logging.info(f"RECOVERING PIPELINE JOB {job.job_id}")
+            await self.submit(job)
+
+
+    async def _recover_periodically(self, blob_client:BlobServiceClient):
+        while True:
+            try:
+                await self.recover(blob_client)
+            except Exception:
+                logging.exception("COULD NOT RECOVER PIPELINE JOBS")
+            await asyncio.sleep(self.recovery_interval)
+
+
+    async def start(self, blob_client:Optional[BlobServiceClient]=None):
+        """ starts the workers, and with a blob client, the recovery of jobs left unfinished by stopped instances """
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if blob_client is not None:
+            self._tasks.append(asyncio.create_task(self._recover_periodically(blob_client)))
+
+
+    async def stop(self):
+        tasks = self._tasks + list(self._heartbeats.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._heartbeats = {}
+
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await run_pipeline_job(job)
+            except Exception:
+                logging.exception(f"PIPELINE JOB {job.job_id} COULD NOT BE RUN")
+            finally:
+                self.active.pop(job.job_id, None)
+                if (heartbeat := self._heartbeats.pop(job.job_id, None)) is not None:
+                    heartbeat.cancel()
+                self.queue.task_done()
+
+
+job_queue = PipelineJobQueue(settings.PIPELINE_JOB_WORKERS)
+
+
+async def start_job_workers():
+    await job_queue.start(await get_blob_storage_client())
+
+
+async def stop_job_workers():
+    await job_queue.stop()
+
+
+router = APIRouter(tags=['pipeline-jobs'])
+
+
+@router.post("/")
+async def submit_pipeline_job(
+    project_folder_name:str,
+    research_plan_name:str,
+    project_notion_page_id:str,
+    skills:List[str],
+    overwrite:Optional[bool]=False,
+    bypass_cache:Optional[bool]=False,
+    context_mode:Literal['concurrent', 'combined']='concurrent',
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> dict:
+    """
+    queues a pipeline run and returns its job id straight away,
+    poll /pipeline/jobs/{job_id} for progress and /pipeline/jobs/{job_id}/result once it has succeeded
+
+    project_notion_page_id: 5fafa95792794aa59be594105ecb5c73 \n
+
+    project_folder_name: city_of_kelowna/sub_project_1 \n
+
+    research_plan_name: city_of_kelowna/sub_project_1/20240524_KelownaClimateDev_Research Plan vEPR.pdf \n
+
+    skills: ["summarization", "keypoints", "quotes"]
+    """
+    validate_skills(skills)
+    job = PipelineJob(new_job_record(uuid.uuid4().hex, {
+        "project_folder_name": project_folder_name,
+        "research_plan_name": research_plan_name,
+        "project_notion_page_id": project_notion_page_id,
+        "skills": skills,
+        "overwrite": overwrite,
+        "bypass_cache": bypass_cache,
+        "context_mode": context_mode,
+    }), blob_client)
+
+    await job.save()
+    await job_queue.submit(job)
+
+    return {
+        "job_id": job.job_id,
+        "status": job.record['status'],
+        "created_at": job.record['created_at']
+    }
+
+
+@router.get("/{job_id}")
+async def get_pipeline_job(job_id:str, project_folder_name:str, blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> dict:
+    """ the job's status and the progress of each stage """
+    if job_queue.is_active(job_id):
+        return job_status(job_queue.active[job_id].record)
+    return job_status((await PipelineJob.load(project_folder_name, job_id, blob_client)).record)
+
+
+@router.get("/{job_id}/result")
+async def get_pipeline_job_result(job_id:str, project_folder_name:str, blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> dict:
+    """ the result of a job that has succeeded """
+    job = job_queue.active.get(job_id) or await PipelineJob.load(project_folder_name, job_id, blob_client)
+    if job.record['status'] != JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.record['status']}, not {JOB_SUCCEEDED}")
+
+    return {
+        "job_id": job_id,
+        "result": job.record['result'],
+        "finished_at": job.record['updated_at']
+    }
+
+
+@router.post("/{job_id}/resume")
+async def resume_pipeline_job(job_id:str, project_folder_name:str, blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> dict:
+    """
+    queues a job again from its last checkpoint, stages and files it already finished are skipped
+    for jobs that failed, or were interrupted or lost when their worker stopped
+
+    a queued or running job is only resumed once its checkpoint is older than PIPELINE_JOB_STALE_AFTER, 
+    its worker may still be alive on another instance and would run it, and write its notion pages, a second time
+    the workers recover such jobs on their own as well
+    """
+    if job_queue.is_active(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is already {job_queue.active[job_id].record['status']}")
+
+    job = await PipelineJob.load(project_folder_name, job_id, blob_client)
+    if job.record['status'] == JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} has already {JOB_SUCCEEDED}")
+
+    if job.record['status'] in (JOB_QUEUED, JOB_RUNNING) and not is_job_stale(job.record, settings.PIPELINE_JOB_STALE_AFTER):
+        raise HTTPException(
+            status_code=409, 
+            detail=f"Job {job_id} is {job.record['status']}, last checkpointed at {job.record['updated_at']}, it can be resumed once it has been idle for {settings.PIPELINE_JOB_STALE_AFTER:.0f}s"
+        )
+
+    await job.set_status(JOB_QUEUED)
+    await job_queue.submit(job)
+
+    return {
+        "job_id": job_id,
+        "status": job.record['status'],
+        "resumed_at": utc_now()
+    }
@@ -1,15 +1,14 @@
-import requests
+import logging
 
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import APIRouter
 
-from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.core.clients import get_notion_client
+from SolwayAPI.api.v1.core.utils.notion_api_helpers import NotionRequestError
 from SolwayAPI.api.v1.core.utils.notion_helpers import (
     naive_batch,
-    html_to_notion_blocks,
-    markdown_to_html
-
+    markdown_to_notion_blocks
 )
 
 router = APIRouter(tags=['notion'])
@@ -21,19 +20,14 @@ async def create_child_notion_page(parent_id:str, title:str, subtitle:Optional[s
     Creates a child notion page of a parent Id.
     Notion API does not support programatically creating "root" pages at the workspace level.     
     The skill name is used as the subtitle, so will appear before the title in some instances
+    Requests go through the shared notion client, which is rate limited and retries throttled requests
     """
     
-    url = "https://api.notion.com/v1/pages"
-    
-    headers = {
-        "Authorization": f"Bearer {settings.NOTION_API_KEY}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28"
-    }
-    
+    notion_client = get_notion_client()
+
     if content:
         
-        content_blocks = html_to_notion_blocks(markdown_to_html(content))
+        content_blocks = markdown_to_notion_blocks(content)
         
         # notion accepts at most 100 blocks at a time
         batches = naive_batch(content_blocks, 100)
@@ -49,52 +43,22 @@ async def create_child_notion_page(parent_id:str, title:str, subtitle:Optional[s
             if len(batches) > 1:
                 batch_title = f"{subtitle} - Part {i+1} - {title}"
 
-            payload = {
-                "parent": {"type": "page_id", "page_id": parent_id},
-                "properties": {
-                    "title": {
-                        "title": [
-                            {
-                                "text": {
-                                    "content": batch_title
-                                }
-                            }
-                        ] 
-                    }
-                },
-                "children": batch
-            }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code == 400:
-                print(f"Error creating page {title}: {response.json()}")
-            response.raise_for_status()
-            page_ids.append(response.json()['id'])
+            page_ids.append(await notion_client.create_page(parent_id, batch_title, batch))
         return page_ids
     
     else:
 
-        payload = {
-            "parent": {"type": "page_id", "page_id": parent_id},
-            "properties": {
-                "title": {
-                    "title": [
-                        {
-                            "text": {
-                                "content": title
-                            }
-                        }
-                    ]
-                }
-            }
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code == 400:
-            print(f"Error creating page {title}: {response.json()}")
-        response.raise_for_status()
-        
-        return response.json()['id']
+        return await notion_client.create_page(parent_id, title)
 
 
+async def archive_notion_pages(page_ids:List[str]):
+    """ 
+    archives pages a re-run replaces, 
+    a page that was already removed by hand is logged and skipped rather than failing the run
+    """
+    notion_client = get_notion_client()
+    for page_id in page_ids:
+        try:
+            await notion_client.archive_page(page_id)
+        except NotionRequestError as e:
+            logging.warning(f"COULD NOT ARCHIVE NOTION PAGE {page_id}: {e}")
@@ -1,9 +1,10 @@
 
+import json
 import asyncio 
 
 import logging 
 
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from fastapi import (
     APIRouter, 
@@ -14,31 +15,59 @@ from pathlib import Path
 
 from openai import AsyncOpenAI
 from voyageai import Client as VoyageClient
-from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob.aio import BlobServiceClient
 
+from SolwayAPI.api.v1.core.config import settings
 from SolwayAPI.api.v1.core.utils.blobstorage_helpers import get_file_name
+from SolwayAPI.api.v1.core.utils.job_helpers import (
+    STAGE_DONE,
+    STAGE_RUNNING,
+    new_job_record,
+    utc_now
+)
+from SolwayAPI.api.v1.core.utils.pipeline_helpers import (
+    StageTimer,
+    empty_pipeline_manifest,
+    flatten_page_ids,
+    get_pending_skills,
+    record_document,
+    seed_indexed_versions
+)
+from SolwayAPI.api.v1.core.utils.task_helpers import first_error_task_group, limit_semaphore
 
 from .artifacts import (
     get_voyage_ai_client,
-    create_index_record,
+    get_semantic_chunker,
+    commit_index,
     generate_context,
-    
+    get_index_etag,
+    index_file,
+    load_index_filenames
 )
 
 from .skillchain import (
     get_oai_client,
-    generate_skills
+    generate_skills,
+    create_skill_pages,
+    validate_skills
 )
 
 from .rag import (
+    get_research_answers_name,
     retrieval_aug_gen
 )
 
-from .notion import create_child_notion_page
+from .notion import archive_notion_pages, create_child_notion_page
 
 from .blobstorage import (
+    DocumentStore,
     get_az_blob_storage_client,
-    describe_container,
+    blob_exists,
+    download_blob_bytes,
+    is_same_version,
+    list_blob_versions,
+    upload_blob_bytes
 )
 
 
@@ -47,20 +76,140 @@ logging.basicConfig(level=logging.INFO)
 router = APIRouter(tags=['pipeline'])
 
 
-async def process_file(oai_client:AsyncOpenAI, skills:list, filename:str, project_folder_name:str, project_notion_page_id:str,  overwrite:bool, blob_client:BlobServiceClient):
-    # create a link page on the project page
-    file_page_id = await create_child_notion_page(project_notion_page_id, Path(get_file_name(filename)).stem)
+class PipelineManifest:
+    """
+    per project record of the version of each input document, of the skills produced from it and of the version in the index,
+    persisted to <project>/artifacts/pipeline_manifest.json after each document so a re-run only does new work
+    """
 
-    await generate_skills(
+    def __init__(self, project_folder_name:str, blob_client:BlobServiceClient, record:Optional[dict]=None):
+        self.project_folder_name = project_folder_name
+        self.blob_client = blob_client
+        self.record = record or empty_pipeline_manifest()
+        self._lock = asyncio.Lock()
+
+
+    @property
+    def path(self) -> str:
+        return f"{self.project_folder_name}/{settings.TMP_FOLDER}/{settings.PIPELINE_MANIFEST_NAME}"
+
+
+    @classmethod
+    async def load(cls, project_folder_name:str, blob_client:BlobServiceClient) -> "PipelineManifest":
+        manifest = cls(project_folder_name, blob_client)
+        try:
+            manifest.record = seed_indexed_versions(json.loads(await download_blob_bytes(manifest.path, blob_client)))
+        except ResourceNotFoundError:
+            logging.info("NO PIPELINE MANIFEST FOUND...")
+        return manifest
+
+
+    def entry(self, filename:str) -> Optional[dict]:
+        return self.record['documents'].get(filename)
+
+
+    def plan(self, filename:str, version:dict, skills:List[str], overwrite:bool) -> tuple:
+        """ the entry a document's new skills build on, empty when it starts over, and the skills it still needs """
+        entry = self.entry(filename)
+        unchanged = entry is not None and is_same_version(entry, version.get('etag'), version.get('content_md5'))
+        previous = entry if unchanged and not overwrite else {}
+        return previous, get_pending_skills(entry, unchanged, skills, overwrite)
+
+
+    def is_index_stale(self, filename:str, version:dict) -> bool:
+        """ whether a document has changed since it was indexed, documents the manifest has no index version for are not """
+        indexed = self.record['indexed'].get(filename)
+        return indexed is not None and not is_same_version(indexed, version.get('etag'), version.get('content_md5'))
+
+
+    async def update(self, filename:str, entry:dict):
+        """ concurrent documents are written one at a time, each write has every finished document """
+        async with self._lock:
+            self.record['documents'][filename] = entry
+            await self.save()
+
+
+    async def update_indexed(self, versions:Dict[str, dict]):
+        """ records the version of each document committed to the index """
+        async with self._lock:
+            self.record['indexed'].update({
+                filename: {"etag": version.get('etag'), "content_md5": version.get('content_md5')} 
+                for filename, version in versions.items()
+            })
+            await self.save()
+
+
+    def has_answers_for(self, index_etag:Optional[str]) -> bool:
+        """ whether the research answers were last generated from the index at index_etag """
+        return index_etag is not None and self.record['rag'].get('index_etag') == index_etag
+
+
+    async def update_rag(self, index_etag:Optional[str], notion_pages:List[str]):
+        """ records the index the research answers were generated from and the notion pages they were published as """
+        async with self._lock:
+            self.record['rag'] = {"index_etag": index_etag, "notion_pages": notion_pages, "updated_at": utc_now()}
+            await self.save()
+
+
+    async def save(self):
+        await upload_blob_bytes(
+            self.path, 
+            json.dumps(self.record).encode('utf-8'), 
+            True, 
+            self.blob_client, 
+            'application/json'
+        )
+
+
+async def process_file(
+        oai_client:AsyncOpenAI, 
+        skills:list, 
+        filename:str, 
+        project_folder_name:str, 
+        project_notion_page_id:str,  
+        overwrite:bool, 
+        blob_client:BlobServiceClient, 
+        bypass_cache:bool=False, 
+        manifest:Optional[PipelineManifest]=None, 
+        version:Optional[dict]=None,
+        document_store:Optional[DocumentStore]=None
+    ) -> bool:
+    """ 
+    generates and publishes the skills a document is missing, returns False when there was nothing to do 
+    an unchanged document only runs newly requested skills, and only their notion pages are created
+    """
+    manifest = manifest or PipelineManifest(project_folder_name, blob_client)
+    version = version or {}
+    previous, pending_skills = manifest.plan(filename, version, skills, overwrite)
+    if not pending_skills:
+        logging.info(f"SKIPPING UNCHANGED DOCUMENT: {filename}")
+        return False
+
+    file_page_id = previous.get('file_page_id')
+    if not file_page_id:
+        # create a link page on the project page
+        file_page_id = await create_child_notion_page(project_notion_page_id, Path(get_file_name(filename)).stem)
+
+    result = await generate_skills(
         oai_client=oai_client,
-        skills=skills,
+        skills=pending_skills,
         filename=filename,
         project_folder_name=project_folder_name,
-        notion_page_id=file_page_id,
-        overwrite=overwrite,
-        blob_client=blob_client
+        overwrite=not previous,
+        bypass_cache=bypass_cache,
+        blob_client=blob_client,
+        document_store=document_store or DocumentStore(blob_client)
     )
 
+    published = previous.get('notion_pages', {})
+    unpublished = {skill: generation for skill, generation in result['generations'].items() if skill not in published}
+    notion_pages = {skill: page_id async for skill, page_id in create_skill_pages(file_page_id, filename, unpublished)}
+
+    await manifest.update(filename, record_document(
+        previous, bool(previous), version, list(result['generations']), file_page_id, notion_pages
+    ))
+    return True
+
 
 def filter_files_in_directory(blob_list, project_folder_name):
     """
@@ -82,6 +231,248 @@ def filter_files_in_directory(blob_list, project_folder_name):
 
 
 
+class PipelineProgress:
+    """
+    which stages of a pipeline run have finished, and which files the skills stage has processed
+    a finished stage is skipped when the run is resumed, save is where a job checkpoints the record
+    """
+
+    def __init__(self, record:Optional[dict]=None):
+        self.record = record or new_job_record(None, {})
+
+
+    def is_done(self, stage:str) -> bool:
+        return self.record['stages'][stage]['status'] == STAGE_DONE
+
+
+    def completed_files(self) -> set:
+        return set(self.record['completed_files'])
+
+
+    async def start_stage(self, stage:str):
+        self.record['stages'][stage].update(status=STAGE_RUNNING, started_at=utc_now())
+        await self.save()
+
+
+    async def finish_stage(self, stage:str):
+        self.record['stages'][stage].update(status=STAGE_DONE, finished_at=utc_now())
+        await self.save()
+
+
+    async def finish_file(self, filename:str):
+        self.record['completed_files'].append(filename)
+        await self.save()
+
+
+    async def save(self):
+        self.record['updated_at'] = utc_now()
+
+
+async def list_project_files(project_folder_name:str, research_plan_name:str, blob_client:BlobServiceClient) -> Dict[str, dict]:
+    """ the version of each document directly under the project folder, without the research plan """
+    versions = await list_blob_versions(project_folder_name, service_client=blob_client)
+    logging.info(f"Described File names: {list(versions)}")
+    file_names = filter_files_in_directory(versions, project_folder_name)
+    file_names = [name for name in file_names if name != research_plan_name]
+
+    logging.info(f"Filtered Filename: {file_names}")
+    return {name: versions[name] for name in file_names}
+
+
+async def execute_pipeline(
+        project_folder_name:str,
+        research_plan_name:str,
+        project_notion_page_id:str,
+        skills:List[str],
+        overwrite:bool,
+        bypass_cache:bool,
+        context_mode:str,
+        oai_client:AsyncOpenAI,
+        vo_client:VoyageClient,
+        blob_client:BlobServiceClient,
+        progress:Optional[PipelineProgress]=None
+    ) -> dict:
+    """ 
+    runs the pipeline as a stage graph rather than in barrier separated phases
+    context starts straight away, alongside every document moving through parse -> index and parse -> skills on its own
+    a document's skills only wait for the context, the index is committed once every document is indexed,
+    and RAG starts as soon as the index is committed and the context is done
+
+    stages and files the progress already records as done are skipped,
+    and documents the pipeline manifest records as unchanged only run newly requested skills
+    a document that changed since it was indexed is indexed again, its new segment replaces the old one in the commit,
+    and RAG is skipped only while the index is at the etag the saved answers were generated from,
+    a new run overwrites the previous answers and archives their notion pages
+    every blob is fetched and parsed once per run through a shared document store, 
+    a document is released from it once its index and skills stages are done,
+    and at most PIPELINE_DOCUMENT_CONCURRENCY parsed documents are held in it at a time
+    """
+    progress = progress or PipelineProgress()
+    timer = StageTimer()
+    document_store = DocumentStore(blob_client)
+    versions = await list_project_files(project_folder_name, research_plan_name, blob_client)
+    file_names = list(versions)
+    manifest = await PipelineManifest.load(project_folder_name, blob_client)
+    processed_files = []
+
+    run_index = not progress.is_done('index')
+    run_skills = not progress.is_done('skills')
+    indexed = set(await load_index_filenames(project_folder_name, blob_client)) if run_index else set()
+    stale = [
+        filename for filename in file_names 
+        if get_file_name(filename) in indexed and manifest.is_index_stale(filename, versions[filename])
+    ]
+    index_files = []
+    completed_files = progress.completed_files()
+
+    chunker = get_semantic_chunker() if run_index else None
+    parse_semaphore = limit_semaphore(settings.PIPELINE_DOCUMENT_CONCURRENCY, 1)
+    index_semaphore = limit_semaphore(settings.INDEX_CONCURRENCY, 1)
+
+    async def run_stage(stage:str, coroutine):
+        await progress.start_stage(stage)
+        with timer.time(stage):
+            result = await coroutine
+        await progress.finish_stage(stage)
+        return result
+
+    async def context_stage():
+        if progress.is_done('context'):
+            return
+        await run_stage('context', generate_context(
+            project_folder_name=project_folder_name, 
+            proposal_file_name=research_plan_name,
+            overwrite=overwrite,
+            bypass_cache=bypass_cache,
+            mode=context_mode,
+            oai_client=oai_client,
+            blob_client=blob_client,
+            document_store=document_store
+        ))
+        logging.info("got context")
+
+    async def parse_document(filename:str):
+        """ 
+        downloads and parses a document once, the index and skills stages read it from the document store 
+        the permit is held until release_document, a parsed document waiting on the context still counts against it
+        """
+        await parse_semaphore.acquire()
+        with timer.time('parse', filename):
+            await document_store.get(filename)
+
+    async def index_document(filename:str, parsed:asyncio.Task) -> dict:
+        await parsed
+        with timer.time('index', filename):
+            return await index_file(
+                project_folder_name, filename, chunker, settings.INDEX_EMBED_BATCH_SIZE, 
+                index_semaphore, vo_client, blob_client, document_store
+            )
+
+    async def skills_document(filename:str, parsed:asyncio.Task, context_done:asyncio.Task):
+        await asyncio.gather(parsed, context_done)
+        with timer.time('skills', filename):
+            if await process_file(
+                oai_client, skills, filename, project_folder_name, project_notion_page_id, overwrite, blob_client, bypass_cache, 
+                manifest=manifest, 
+                version=versions[filename],
+                document_store=document_store
+            ):
+                processed_files.append(filename)
+        await progress.finish_file(filename)
+
+    async def release_document(filename:str, stages:List[asyncio.Task]):
+        await asyncio.gather(*stages)
+        document_store.discard(filename)
+        parse_semaphore.release()
+
+    async def index_stage(index_tasks:List[asyncio.Task]):
+        if not run_index:
+            return
+        await progress.start_stage('index')
+        segments = await asyncio.gather(*index_tasks)
+        if segments:
+            with timer.time('index'), timer.time('index_commit'):
+                await commit_index(project_folder_name, segments, blob_client, replace=[get_file_name(filename) for filename in stale])
+            await manifest.update_indexed({filename: versions[filename] for filename in index_files})
+        await progress.finish_stage('index')
+        logging.info("created index")
+
+    async def skills_stage(skill_tasks:List[asyncio.Task]):
+        if not run_skills:
+            return
+        await progress.start_stage('skills')
+        await asyncio.gather(*skill_tasks)
+        await progress.finish_stage('skills')
+        logging.info("generated skills")
+
+    async def rag_stage(index_done:asyncio.Task, context_done:asyncio.Task):
+        await asyncio.gather(index_done, context_done)
+        if progress.is_done('rag'):
+            return
+        index_etag = await get_index_etag(project_folder_name, blob_client)
+        if (
+            not overwrite 
+            and manifest.has_answers_for(index_etag) 
+            and await blob_exists(get_research_answers_name(project_folder_name), blob_client)
+        ):
+            logging.info("INDEX UNCHANGED SINCE THE LAST ANSWERS, SKIPPING RESEARCH QUESTIONS")
+            await progress.finish_stage('rag')
+            return
+        logging.info("GENERATING RESEARCH QUESTIONS")
+        await progress.start_stage('rag')
+        with timer.time('rag'):
+            answers = await retrieval_aug_gen(
+                project_folder_name=project_folder_name,
+                top_n=30,
+                notion_page_id=project_notion_page_id,
+                overwrite=True,
+                bypass_cache=bypass_cache,
+                oai_client=oai_client,
+                vo_client=vo_client,
+                blob_client=blob_client,
+                document_store=document_store
+            )
+            # the new answers replace the pages of the previous ones, archiving is repeated safely if the run stops here
+            await archive_notion_pages(manifest.record['rag'].get('notion_pages', []))
+            await manifest.update_rag(index_etag, flatten_page_ids(answers['created_notion_pages']))
+        await progress.finish_stage('rag')
+
+    async with first_error_task_group() as task_group:
+        context_done = task_group.create_task(context_stage())
+        index_tasks, skill_tasks = [], []
+
+        for filename in file_names:
+            needs_index = run_index and (get_file_name(filename) not in indexed or filename in stale)
+            needs_skills = run_skills and filename not in completed_files and bool(manifest.plan(filename, versions[filename], skills, overwrite)[1])
+            if not (needs_index or needs_skills):
+                continue
+
+            parsed = task_group.create_task(parse_document(filename))
+            stages = [parsed]
+            if needs_index:
+                index_files.append(filename)
+                index_tasks.append(task_group.create_task(index_document(filename, parsed)))
+                stages.append(index_tasks[-1])
+            if needs_skills:
+                skill_tasks.append(task_group.create_task(skills_document(filename, parsed, context_done)))
+                stages.append(skill_tasks[-1])
+            task_group.create_task(release_document(filename, stages))
+
+        index_done = task_group.create_task(index_stage(index_tasks))
+        task_group.create_task(skills_stage(skill_tasks))
+        task_group.create_task(rag_stage(index_done, context_done))
+
+    timings = timer.report()
+    logging.info(f"PIPELINE STAGE TIMINGS: {json.dumps(timings['stages'])} TOTAL: {timings['total']}s")
+
+    return {
+        "pipe_completion_state": True,
+        "processed_files": processed_files,
+        "skipped_files": [filename for filename in file_names if filename not in processed_files],
+        "timings": timings
+    }
+
+
 @router.post("/") 
 async def run_pipeline(    
     project_folder_name:str,
@@ -89,6 +480,8 @@ async def run_pipeline(
     project_notion_page_id:str,
     skills:List[str],
     overwrite:Optional[bool]=False,
+    bypass_cache:Optional[bool]=False,
+    context_mode:Literal['concurrent', 'combined']='concurrent',
     oai_client:AsyncOpenAI=Depends(get_oai_client), 
     vo_client:VoyageClient=Depends(get_voyage_ai_client), 
     blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)) -> dict:
@@ -99,52 +492,22 @@ async def run_pipeline(
 
     research_plan_name: city_of_kelowna/sub_project_1/20240524_KelownaClimateDev_Research Plan vEPR.pdf \n
 
-    skills: ["summarization", "keypoints", "quotes"]
-    """
-
-    file_names = await describe_container(project_folder_name, service_client=blob_client)
-    logging.info(f"Described File names: {file_names['container_files']}")
-    file_names = file_names["container_files"]
-    file_names = filter_files_in_directory(file_names, project_folder_name)
-    file_names = [name for name in file_names if name != research_plan_name]
+    skills: ["summarization", "keypoints", "quotes"] \n
 
-    logging.info(f"Filtered Filename: {file_names}")
+    context_mode: concurrent runs the three context extractions at once, combined extracts them in a single call \n
 
-    context = await generate_context(
-        project_folder_name=project_folder_name, 
-        proposal_file_name=research_plan_name,
-        overwrite=overwrite,
-        oai_client=oai_client,
-        blob_client=blob_client
-    )
-
-    logging.info("got context")
-
-    for filename in file_names:
-        await create_index_record(project_folder_name=project_folder_name, file_name=filename, vo_client=vo_client, blob_client=blob_client)
-
-    logging.info("created index")
-
-    logging.info("GENERATING SKILLS")
-
-    await asyncio.gather(*[process_file(oai_client, skills, filename, project_folder_name, project_notion_page_id, overwrite, blob_client) for filename in file_names])
-
-    logging.info("generated skills")
-
-    logging.info("GENERATING RESEARCH QUESTIONS")
-    questions = context['context']['research_questions'].split("\n")
-    questions = [q.strip('- ') for q in questions[1:] if q]
-
-    await retrieval_aug_gen(
+    long running projects should be submitted to /pipeline/jobs instead, which returns straight away
+    """
+    validate_skills(skills)
+    return await execute_pipeline(
         project_folder_name=project_folder_name,
-        top_n=30,
-        notion_page_id=project_notion_page_id,
+        research_plan_name=research_plan_name,
+        project_notion_page_id=project_notion_page_id,
+        skills=skills,
         overwrite=overwrite,
+        bypass_cache=bypass_cache,
+        context_mode=context_mode,
         oai_client=oai_client,
         vo_client=vo_client,
         blob_client=blob_client
     )
-
-    return {
-        "pipe_completion_state": True
-    }
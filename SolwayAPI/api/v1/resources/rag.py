@@ -1,9 +1,10 @@
 import copy 
+import asyncio
 import logging
 
 from datetime import datetime
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import (
     APIRouter, 
@@ -12,31 +13,41 @@ from fastapi import (
 
 import numpy as np
 
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient
 
 from openai import AsyncOpenAI
 from voyageai import Client as VoyageClient
     
 
 from SolwayAPI.api.v1.core.config import settings
-from SolwayAPI.api.v1.core.skill_prompts import rq_answering, role
+from SolwayAPI.api.v1.core.skill_prompts import RESEARCH_QUESTION_SLOT, rq_answering, role
 
 from SolwayAPI.api.v1.models.skillchain_models import Skill 
 
-from SolwayAPI.api.v1.core.utils.skillchain_helpers import make_open_ai_request
+from SolwayAPI.api.v1.core.utils.cache_helpers import CompletionCache, LRUCache
+from SolwayAPI.api.v1.core.utils.index_helpers import normalize_rows
+from SolwayAPI.api.v1.core.utils.task_helpers import limit_semaphore
+from SolwayAPI.api.v1.core.utils.skillchain_helpers import (
+    get_completion_cache,
+    make_open_ai_request,
+    make_voyage_embed_request
+)
 
 from .skillchain import (
     get_oai_client
 )
 
 from .artifacts import (
-    get_voyage_ai_client
+    get_voyage_ai_client,
+    get_index_etag,
+    load_index
 )
 
 from .blobstorage import (
+    DocumentStore,
     get_az_blob_storage_client,
-    create_blob,
-    get_blob, 
+    get_document_store,
+    create_blob
 )
 
 from .notion import create_child_notion_page
@@ -47,50 +58,162 @@ class Retriever:
 
     def __init__(self, index):
         
-        self.chunks2idx = {idx:chunk for idx, chunk in enumerate(index['textstore'])}
-        self.embs2idx = {idx:emb for idx, emb in enumerate(index['vectorstore'])}
-        self.vector_store = {idx:np.array(emb) for idx, emb in self.embs2idx.items()}
+        self.chunks = index['textstore']
+        self.embeddings = self.normalize(index['vectorstore'])
+        self.ann = index.get('ann') if len(self.embeddings) >= settings.ANN_THRESHOLD else None
+        if self.ann is not None:
+            # load_index only hands over an ann index filed from the first segments of the manifest,
+            # chunks committed after it was last written are filed under its centroids
+            self.ann = self.ann.extend(self.embeddings) if len(self.ann) <= len(self.embeddings) else None
+
+
+    @property
+    def nbytes(self) -> int:
+        """ estimated resident size of the retriever, the embeddings, ann lists and chunk text """
+        nbytes = self.embeddings.nbytes + sum(len(chunk.get('text', '')) + 200 for chunk in self.chunks)
+        if self.ann is not None:
+            nbytes += self.ann.centroids.nbytes + self.ann.assignments.nbytes + self.ann.order.nbytes
+        return nbytes
+
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        """ scales each row to unit length, so cosine similarity becomes a dot product """
+        return normalize_rows(vectors)
 
 
     def populate_prompt(self, skill:Skill, agent_internals:dict) -> str:
         """ swaps the dummy symbols in the skill prompt with the generated replacements """
-        full_prompt = skill.role + skill.instructions
-        for _, value in agent_internals.items():
-            full_prompt = full_prompt.replace(value['marker'], value['replacement'])
-        return full_prompt
+        return self.populate_text(skill.role + skill.instructions, agent_internals)
 
 
-    def cosine_similarity(self, a, b):
-        """ similarity metrics to compare embeddings"""
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    @staticmethod
+    def populate_text(text:str, agent_internals:dict) -> str:
+        for _, value in agent_internals.items():
+            text = text.replace(value['marker'], value['replacement'])
+        return text
+
+
+    def populate_question_prompt(self, skill:Skill, agent_internals:dict) -> Tuple[str, str]:
+        """ 
+        populates the prompt on either side of the research question slot, 
+        a question is then placed between the two halves, so neither it nor the replacements are substituted again
+        """
+        before, after = (skill.role + skill.instructions).split(RESEARCH_QUESTION_SLOT, 1)
+        return self.populate_text(before, agent_internals), self.populate_text(after, agent_internals)
+
+
+    def top_k(self, query_embeddings, top_n:int) -> List[np.ndarray]:
+        """ 
+        returns the indices of the top_n chunks per question, most similar first
+        large projects are searched through the ann index, others exactly
+        """
+        queries = self.normalize(query_embeddings)
+        top_n = min(top_n, len(self.embeddings))
+        if not top_n:
+            return np.zeros((len(queries), 0), dtype=np.int64)
+
+        if self.ann is None:
+            return self.exact_top_k(queries, top_n)
+
+        results = self.ann.search(self.embeddings, queries, top_n, settings.ANN_N_PROBE)
+        for idx, result in enumerate(results):
+            # the probed lists held fewer than top_n chunks
+            if len(result) < top_n:
+                results[idx] = self.exact_top_k(queries[idx:idx+1], top_n)[0]
+        return results
+
+
+    def exact_top_k(self, queries:np.ndarray, top_n:int) -> np.ndarray:
+        """ scores every unit length question against every chunk in one matrix multiply """
+        scores = queries @ self.embeddings.T
+        if top_n < scores.shape[1]:
+            candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (len(queries), 1))
+
+        order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
+
+
+    def build_user_message(self, chunk_indices) -> str:
+        """ lays out the retrieved chunks with the document name and page number to reference """
+        usr_msg = ''
+        for i in chunk_indices:
+            chunk = self.chunks[i]
+            usr_msg += f"!!! START CHUNK !!! DOCUMENT NAME TO REFERENCE: {chunk.get('title')} PAGE NUMBER TO REFERENCE: {chunk.get('page_number')} DOCUMENT TEXT: {chunk.get('text')} !!! END CHUNK !!!"
+        return usr_msg
+
+
+    async def answer_question(
+            self, 
+            oai_client:AsyncOpenAI, 
+            sys_prompt:Tuple[str, str], 
+            question:str, 
+            chunk_indices, 
+            semaphore:asyncio.Semaphore, 
+            completion_cache:CompletionCache=None
+        ) -> str:
+        """ answers one research question, the question is placed in the slot between the populated prompt halves """
+        before, after = sys_prompt
+        question_prompt = before + question + after
+        async with semaphore:
+            response = await make_open_ai_request(
+                oai_client, question_prompt, self.build_user_message(chunk_indices), completion_cache=completion_cache
+            )
+        return response.choices[0].message.content
+
+
+    async def __call__(
+            self, 
+            oai_client:AsyncOpenAI, 
+            vo_client:VoyageClient, 
+            sys_prompt:Tuple[str, str], 
+            queries:List[str], 
+            top_n:int, 
+            concurrency:Optional[int]=settings.RAG_CONCURRENCY,
+            completion_cache:CompletionCache=None
+        ) -> Dict[str, str]:
+        """ 
+        answers the research questions in the proposal concurrently, at most concurrency at a time, keeping question order 
+        None uses RAG_CONCURRENCY, and a concurrency below 1 is raised to 1
+        """
+        
+        q_embs = await make_voyage_embed_request(vo_client, queries)
+        top_indices = self.top_k(q_embs, top_n)
+
+        semaphore = limit_semaphore(concurrency, settings.RAG_CONCURRENCY)
+        responses = await asyncio.gather(*[
+            self.answer_question(oai_client, sys_prompt, question, top_indices[idx], semaphore, completion_cache) 
+            for idx, question in enumerate(queries)
+        ])
+        
+        return {q:r for q, r in zip(queries, responses)}
 
 
-    async def __call__(self, oai_client:AsyncOpenAI, vo_client:VoyageClient, sys_prompt:str, queries:List[str], top_n:int) -> None:
-        """ answers each research question in the proposal, writest oaj  son"""
-        
-        q_embs = vo_client.embed(queries, model="voyage-large-2-instruct", input_type="document").embeddings
 
-        responses = []
-        for idx, question in enumerate(queries):
+# loaded retrievers keyed by project, each entry remembers the index etag it was loaded at
+retriever_cache = LRUCache(settings.RETRIEVER_CACHE_MAX_BYTES, sizeof=lambda entry: entry['retriever'].nbytes)
 
-            # Calculate similarity between the user question & each chunk
-            similarities = [self.cosine_similarity(q_embs[idx], chunk) for chunk in self.embs2idx.values()]
-            sorted_indices = np.argsort(similarities)[::-1]
-            top_indices = sorted_indices[:top_n]
-            top_chunks_after_retrieval = [self.chunks2idx[i] for i in top_indices]
-    
-            usr_msg = ''
-            for chunk in top_chunks_after_retrieval:
-                usr_msg += f"!!! START CHUNK !!! DOCUMENT NAME TO REFERENCE: {chunk.get('title')} PAGE NUMBER TO REFERENCE: {chunk.get('page_number')} DOCUMENT TEXT: {chunk.get('text')} !!! END CHUNK !!!"
 
-            sys_prompt = sys_prompt.replace("?", question)
+async def get_retriever(project_folder_name:str, blob_client:BlobServiceClient) -> Retriever:
+    """ 
+    returns the project's retriever, a warm project only costs a HEAD request on the index 
+    the index is downloaded again once its etag changes
+    """
+    etag = await get_index_etag(project_folder_name, blob_client)
+    entry = retriever_cache.get(project_folder_name)
+    if entry and etag and entry['etag'] == etag:
+        return entry['retriever']
+
+    retriever = Retriever(await load_index(project_folder_name, blob_client))
+    if etag:
+        retriever_cache.put(project_folder_name, {"etag": etag, "retriever": retriever})
+    return retriever
 
-            print(sys_prompt)
-            response = await make_open_ai_request(oai_client, sys_prompt, usr_msg)
-            responses.append(response.choices[0].message.content)
-        
-        return {q:r for q, r in zip(queries, responses)}
 
+def get_research_answers_name(project_folder_name:str) -> str:
+    return f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.RESEARCH_ANSWERS_FILE_NAME}"
 
 
 rq_skill = Skill(
@@ -109,12 +232,18 @@ router = APIRouter(tags=['retrieval'])
 async def retrieval_aug_gen(
     project_folder_name:str, 
     top_n:int=30,
+    concurrency:Optional[int]=settings.RAG_CONCURRENCY,
     notion_page_id:Optional[str]='',
     overwrite:Optional[bool]=False, 
+    bypass_cache:Optional[bool]=False,
     oai_client:AsyncOpenAI=Depends(get_oai_client),
     vo_client:VoyageClient=Depends(get_voyage_ai_client),
-    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)):   
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client),
+    document_store:DocumentStore=Depends(get_document_store)):   
     """ Performs RAG \n
+
+    every call publishes new notion pages under notion_page_id, earlier answers' pages are left in place,
+    the pipeline archives the pages of the answers it replaces \n
     
     notion_page_id: b38df40ef7fa49678bbb069a71203eb3
 
@@ -122,24 +251,16 @@ async def retrieval_aug_gen(
     
     """
     
-    context_content = await get_blob(
-        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}", 
-        service_client=blob_client
+    context_content = await document_store.get(
+        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}"
     )
 
     context = list(context_content.values()).pop()
 
     logging.info(context['context'].get("research_questions"))
 
-    index_content = await get_blob(
-        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.INDEX_FILE_NAME}", 
-        service_client=blob_client
-    )
-
-    index = list(index_content.values()).pop()
-
-    retriever = Retriever(index)
-    sys_prompt = retriever.populate_prompt(copy.deepcopy(rq_skill), context['agent_internals'])
+    retriever = await get_retriever(project_folder_name, blob_client)
+    sys_prompt = retriever.populate_question_prompt(copy.deepcopy(rq_skill), context['agent_internals'])
 
     questions = context['context']['research_questions'].split("\n")
     questions = [q.strip('- ') for q in questions[1:] if q]
@@ -149,11 +270,13 @@ async def retrieval_aug_gen(
         vo_client=vo_client, 
         sys_prompt=sys_prompt, 
         queries=questions, 
-        top_n=top_n
+        top_n=top_n,
+        concurrency=concurrency,
+        completion_cache=get_completion_cache(project_folder_name, blob_client, bypass_cache)
     )
     
     await create_blob(
-        blob_name=f"{project_folder_name}/{settings.TMP_FOLDER}/research_questions.json",
+        blob_name=get_research_answers_name(project_folder_name),
         content=answers,
         overwrite=overwrite,
         service_client=blob_client
@@ -1,36 +1,58 @@
 import copy
+import asyncio
 import logging 
 
 from pathlib import Path
 
 from datetime import datetime
 
-from typing import Dict, List, Union, Optional
+from typing import AsyncIterator, Dict, List, Union, Optional
 
 from fastapi import (
     APIRouter, 
-    Depends
+    Depends,
+    HTTPException
 )
+from fastapi.responses import StreamingResponse
 
 from openai import AsyncOpenAI
 
-from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob.aio import BlobServiceClient
 
 from SolwayAPI.api.v1.core.config import settings
 from SolwayAPI.api.v1.core.clients import get_openai_client
+from SolwayAPI.api.v1.core.skill_prompts import reduce as reduce_instructions
 from SolwayAPI.api.v1.models.skillchain_models import Skill
 
 from SolwayAPI.api.v1.core.utils.blobstorage_helpers import get_file_name
+from SolwayAPI.api.v1.core.utils.tokenizer_helpers import count_tokens
+from SolwayAPI.api.v1.core.utils.cache_helpers import CompletionCache
+from SolwayAPI.api.v1.core.utils.task_helpers import first_error_task_group
 from SolwayAPI.api.v1.core.utils.skillchain_helpers import (
-    chunk_document_naive,
+    build_skill_graph,
+    format_page,
+    get_all_numTokens,
+    get_chunk_budget,
+    get_completion_cache,
     make_open_ai_request,
+    plan_page_chunks,
+    resolve_skill_order,
+    stream_open_ai_completion,
+)
+from SolwayAPI.api.v1.core.utils.sse_helpers import (
+    SSE_HEADERS,
+    format_sse,
+    with_heartbeat
 )
 
 from .notion import create_child_notion_page
 
 
 from .blobstorage import (
+    DocumentStore,
     get_az_blob_storage_client,
+    get_document_store,
     get_blob, 
     create_blob
 )
@@ -39,6 +61,9 @@ from .blobstorage import (
 logging.basicConfig(level=logging.INFO)
 
 
+REDUCE_STRATEGIES = ('concat', 'llm')
+
+
 class ContextError(Exception):
     def __init__(self, message="Could not Read Agent Internals: "):
             self.message = message 
@@ -56,6 +81,11 @@ class InvalidSkillError(Exception):
             self.message = message.replace('*', missing_skill)
             super().__init__(self.message)
 
+class InvalidReduceStrategyError(Exception):
+    def __init__(self, message="Reduce strategy * is not supported, please use concat or llm", strategy:str=''):
+            self.message = message.replace('*', strategy)
+            super().__init__(self.message)
+
 class OAIRequestError(Exception):
     def __init__(self, message="Could Not Succesfully Request OpenAI", missing_skill:str=''):
             self.message = message.replace('*', missing_skill)
@@ -65,7 +95,6 @@ class OAIRequestError(Exception):
 
 class SkillChain:
 
-
     def populate_prompt(self, skill:Skill, agent_internals:dict) -> str:
         """ swaps the dummy symbols in the skill prompt with the generated replacements """
         full_prompt = skill.role + skill.instructions
@@ -87,63 +116,138 @@ class SkillChain:
             prompt:str, 
             model:str, 
             token_thresh:int, 
-            contiguous_on:str=None
+            contiguous_on:str=None,
+            reduce_strategy:str='concat',
+            completion_cache:CompletionCache=None
         ):
-        """ calls OpenAI with a skill prompt on a document """
-
-        text, num_tokens = '', 0
-        for page, data in document.items():
-            num_tokens += int(data.get('numTokens'))
-            text += f"""!!! START PAGE {page} !!! PAGE TEXT: {data.get('textIN')} !!!"""
-
-        if int(num_tokens) > token_thresh:
-            chunks = chunk_document_naive(self.encoding, text)        
-            text = [skill_completions['summarization'].output + self.encoding.decode(chunk) for chunk in chunks]
+        """ 
+        calls OpenAI with a skill prompt on a document 
+        large documents are packed page by page into chunks sized to the model's context window,
+        every chunk is mapped concurrently and the partial outputs reduced into one
+        """
 
         if contiguous_on:
             # we're replacing a special marker within the prompt, 
             prompt = self.contiguous_generation(prompt, skill_completions[contiguous_on].output)
-        
-        oai_responses = []
 
+        if get_all_numTokens(document) > token_thresh:
+            summary = skill_completions['summarization'].output
+            budget = get_chunk_budget(
+                settings.MODEL_CONTEXT_WINDOWS.get(model, token_thresh), 
+                count_tokens(prompt + summary), 
+                settings.SKILL_OUTPUT_TOKENS, 
+                settings.MAX_CHUNK_TOKENS
+            )
+            text = [summary + chunk for chunk in plan_page_chunks(document, budget)]
+        else:
+            text = ''.join(format_page(page, data) for page, data in document.items())
+        
         if isinstance(text, str):            
-            oai_response = await make_open_ai_request(oai_client, prompt, text, model)            
-            response = oai_response.choices[0].message.content
+            oai_response = await make_open_ai_request(oai_client, prompt, text, model, completion_cache=completion_cache)
+            return oai_response.choices[0].message.content
         
-        elif isinstance(text, list):
+        oai_responses = await asyncio.gather(*[
+            make_open_ai_request(oai_client, prompt, chunk, model, completion_cache=completion_cache) for chunk in text
+        ])
+        partials = [resp.choices[0].message.content for resp in oai_responses]
+        partials = [partial for partial in partials if partial and 'sorry' not in partial]
 
-            for chunk in text:
-                oai_response = await make_open_ai_request(oai_client, prompt, chunk, model)
-                oai_responses.append(oai_response)
-            
-            try:
-                response = '\n\n'.join(
-                    [resp.choices[0].message.content for resp in oai_responses if 'sorry' not in resp.choices[0].message.content]
-                )
-            except Exception as e:
-                print(f"Unexpected Error: {e}")
-            
-        return response
+        return await self.reduce_partials(oai_client, prompt, partials, model, reduce_strategy, completion_cache)
 
 
-    async def __call__(self, oai_client:AsyncOpenAI, skills:Union[List[str], str], context:dict, document:dict) -> Dict[str, str]:
-        """ runs the key functions of the class """
-
-        skill_completions = {k.name:copy.deepcopy(k) for k in settings.SKILLS if k.name in skills}
+    async def reduce_partials(
+            self, 
+            oai_client:AsyncOpenAI, 
+            prompt:str, 
+            partials:List[str], 
+            model:str, 
+            reduce_strategy:str='concat', 
+            completion_cache:CompletionCache=None
+        ) -> str:
+        """ 
+        merges the outputs of each chunk, 
+        concat joins them in document order, llm asks the model to merge them into one coherent output
+        """
+        if reduce_strategy not in REDUCE_STRATEGIES:
+            raise InvalidReduceStrategyError(strategy=reduce_strategy)
+
+        if reduce_strategy == 'concat' or len(partials) < 2:
+            return '\n\n'.join(partials)
+
+        oai_response = await make_open_ai_request(
+            oai_client, 
+            prompt + reduce_instructions, 
+            ''.join(f"!!! PARTIAL RESPONSE !!!\n{partial}\n" for partial in partials), 
+            model, 
+            completion_cache=completion_cache
+        )
+        return oai_response.choices[0].message.content
+
+
+    def plan_skills(self, skills:Union[List[str], str], document:dict, token_thresh:int) -> tuple:
+        """
+        builds the skill DAG from the contiguous_on edges and resolves the requested skills against it
+        prerequisites are pulled in automatically, unknown skills are rejected before any request is made
+        documents over token_thresh are chunked, and each chunk is prefixed with the summarization output
+        """
+        skills = [skills] if isinstance(skills, str) else skills
+        known = {skill.name for skill in settings.SKILLS}
+        for name in skills:
+            if name not in known:
+                raise InvalidSkillError(missing_skill=name)
 
         for skill in settings.SKILLS:
-            if skill.name in skills:
-                completion = await self.create_skill_completion(
-                    oai_client=oai_client,
-                    skill_completions=skill_completions,
-                    document=document,
-                    prompt=self.populate_prompt(skill, context.get("agent_internals")), 
-                    contiguous_on=skill.contiguous_on if skill.contiguous_on else None,
-                    model=settings.FOUNDATION_MODEL, 
-                    token_thresh=settings.NAIVE_CHUNK_THRESHOLD,
-                )
+            if skill.reduce_strategy not in REDUCE_STRATEGIES:
+                raise InvalidReduceStrategyError(strategy=skill.reduce_strategy)
+
+        implicit_dependencies = {}
+        if get_all_numTokens(document) > token_thresh:
+            implicit_dependencies = {name: {'summarization'} for name in known}
+
+        graph = build_skill_graph(settings.SKILLS, implicit_dependencies)
+        return graph, resolve_skill_order(skills, graph)
+
 
-                skill_completions[skill.name].output = completion
+    async def __call__(
+            self, 
+            oai_client:AsyncOpenAI, 
+            skills:Union[List[str], str], 
+            context:dict, 
+            document:dict, 
+            completion_cache:CompletionCache=None,
+            skill_events:Optional[asyncio.Queue]=None
+        ) -> Dict[str, str]:
+        """ 
+        runs the key functions of the class
+        each skill starts as soon as the skills it depends on have finished, independent skills run concurrently
+        if skill_events is passed, (name, generation) is put on it as each skill finishes
+        """
+        graph, order = self.plan_skills(skills, document, settings.NAIVE_CHUNK_THRESHOLD)
+        skills_by_name = {skill.name: skill for skill in settings.SKILLS}
+        skill_completions = {name: copy.deepcopy(skills_by_name[name]) for name in order}
+        tasks = {}
+
+        async def run_skill(skill:Skill):
+            for dependency in graph[skill.name]:
+                await tasks[dependency]
+
+            skill_completions[skill.name].output = await self.create_skill_completion(
+                oai_client=oai_client,
+                skill_completions=skill_completions,
+                document=document,
+                prompt=self.populate_prompt(skill, context.get("agent_internals")), 
+                contiguous_on=skill.contiguous_on if skill.contiguous_on else None,
+                reduce_strategy=skill.reduce_strategy,
+                model=settings.FOUNDATION_MODEL, 
+                token_thresh=settings.NAIVE_CHUNK_THRESHOLD,
+                completion_cache=completion_cache
+            )
+            if skill_events is not None:
+                skill_events.put_nowait((skill.name, skill_completions[skill.name].model_dump()))
+
+        async with first_error_task_group() as task_group:
+            for name in order:
+                tasks[name] = task_group.create_task(run_skill(skills_by_name[name]))
             
         return {k:v.model_dump() for k, v in skill_completions.items()}
 
@@ -153,6 +257,75 @@ def get_oai_client(client:AsyncOpenAI=Depends(get_openai_client)):
     return client
 
 
+def require_sse():
+    """ 
+    the stream endpoints need a host that streams response bodies, 
+    under the functions ASGI wrapper every event would only arrive once the whole response is done
+    """
+    if not settings.SSE_ENABLED:
+        raise HTTPException(
+            status_code=501, 
+            detail="Streaming responses are disabled on this host, use /skills/ or follow progress through /pipeline/jobs"
+        )
+
+
+def validate_skills(skills:List[str]):
+    """ unknown skill names are rejected with a 422, as invalid request parameters are, before any work is started """
+    known = {skill.name for skill in settings.SKILLS}
+    unknown = [name for name in skills if name not in known]
+    if unknown:
+        raise HTTPException(status_code=422, detail=InvalidSkillError(missing_skill=', '.join(unknown)).message)
+
+
+async def load_skill_inputs(filename:str, project_folder_name:str, document_store:DocumentStore) -> tuple:
+    """ the project context and the parsed document a skill chain runs on """
+    context_contents = await document_store.get(
+        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}"
+    )
+
+    context = list(context_contents.values()).pop()
+    if not context.get("agent_internals"):
+        raise ContextError
+    
+    file_contents = await document_store.get(filename)
+    return context, list(file_contents.values()).pop()
+
+
+async def save_skill_generations(filename:str, project_folder_name:str, generations:dict, overwrite:bool, blob_client:BlobServiceClient):
+    """ 
+    writes a document's skills JSON, 
+    without overwrite the generations are merged into the skills already saved for the document
+    """
+    blob_name = f"{project_folder_name}/{settings.TMP_FOLDER}/skills/{Path(get_file_name(filename)).stem}.json"
+    if not overwrite:
+        try:
+            existing = list((await get_blob(blob_name, service_client=blob_client)).values()).pop()
+            generations = {**existing, **generations}
+
+        except ResourceNotFoundError:
+            logging.info(f"NO SKILLS FOUND FOR {filename}...")
+
+    await create_blob(
+        blob_name=blob_name,
+        content=generations,
+        overwrite=True,
+        service_client=blob_client
+    )
+
+
+async def create_skill_pages(notion_page_id:str, filename:str, generations:dict) -> AsyncIterator[tuple]:
+    """ writes a notion page per skill, yielding (skill, page_id) as each one is created """
+    for skill, generation in generations.items():
+        page_id = await create_child_notion_page(
+            notion_page_id, 
+            title=get_file_name(filename), 
+            subtitle=skill, 
+            content=generation.get('output')
+        )
+        logging.info(f"Created Notion Page: {skill} - {get_file_name(filename)}: Notion ID: {page_id}")
+        yield skill, page_id
+
+
 @router.post("/") 
 async def generate_skills(
     skills:List[str],
@@ -160,12 +333,15 @@ async def generate_skills(
     project_folder_name:str, 
     overwrite:bool=False, 
     notion_page_id:Optional[str]=None,
+    bypass_cache:Optional[bool]=False,
     oai_client:AsyncOpenAI=Depends(get_oai_client),
-    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client),
+    document_store:DocumentStore=Depends(get_document_store)
     ) -> dict:   
     """
     Third step in the chain is to run the skills
     returns this information as JSON and writes to the disk of the host 
+    without overwrite, the generations are merged into the document's existing skills JSON
 
     If notion_page_id is passed, this should correspond to the Documents Page ID, not the Project's ID
 
@@ -179,46 +355,23 @@ async def generate_skills(
     file_name: city_of_kelowna/sub_project_1/1184_492.pdf
     """
 
-    context_contents = await get_blob(
-        f"{project_folder_name}/{settings.TMP_FOLDER}/{settings.CONTEXT_FILE_NAME}", 
-        service_client=blob_client
-    )
-
-    context = list(context_contents.values()).pop()
-    if not context.get("agent_internals"):
-        raise ContextError
-    
-    file_contents = await get_blob(
-        filename, 
-        service_client=blob_client
-    )
+    validate_skills(skills)
+    context, document = await load_skill_inputs(filename, project_folder_name, document_store)
 
     skill_chain = SkillChain()
     generations = await skill_chain(
         oai_client=oai_client,
         skills=skills,
         context=context,
-        document=list(file_contents.values()).pop()
+        document=document,
+        completion_cache=get_completion_cache(project_folder_name, blob_client, bypass_cache)
     )
 
-    await create_blob(
-        blob_name=f"{project_folder_name}/{settings.TMP_FOLDER}/skills/{Path(get_file_name(filename)).stem}.json",
-        content=generations,
-        overwrite=True,
-        service_client=blob_client
-    )
+    await save_skill_generations(filename, project_folder_name, generations, overwrite, blob_client)
 
     created_pages = []
     if notion_page_id:
-        for skill, generation in generations.items():
-            
-            page_id = await create_child_notion_page(
-                notion_page_id, 
-                title=get_file_name(filename), 
-                subtitle=skill, 
-                content=generation.get('output')
-            )
-            logging.info(f"Created Notion Page: {skill} - {get_file_name(filename)}: Notion ID: {page_id}")
+        async for _, page_id in create_skill_pages(notion_page_id, filename, generations):
             created_pages.append(page_id)
     
     return {
@@ -228,19 +381,150 @@ async def generate_skills(
     }
 
 
+@router.post("/stream", dependencies=[Depends(require_sse)]) 
+async def stream_skills(
+    skills:List[str],
+    filename:str,
+    project_folder_name:str, 
+    overwrite:bool=False, 
+    notion_page_id:Optional[str]=None,
+    bypass_cache:Optional[bool]=False,
+    oai_client:AsyncOpenAI=Depends(get_oai_client),
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client),
+    document_store:DocumentStore=Depends(get_document_store)
+    ) -> StreamingResponse:   
+    """
+    Streaming variant of the skills endpoint, as server sent events
+    only served with SSE_ENABLED, where the app runs behind a server that streams responses
+
+    started: the requested skills, sent straight away
+    planned: the skills that will run, prerequisites included, once the context and document are loaded
+    skill: a skill's generation, sent as soon as that skill finishes
+    notion: a created notion page, once every skill has finished
+    done / error: the end of the stream
+
+    project_folder_name: city_of_kelowna/sub_project_1
+
+    skills: ["summarization", "figures_toc", "action_items", "keypoints", "quotes"]
+
+    file_name: city_of_kelowna/sub_project_1/1184_492.pdf
+    """
+
+    validate_skills(skills)
+    skill_chain = SkillChain()
+
+    async def events():
+        yield format_sse('started', {"filename": filename, "skills": skills})
+
+        try:
+            context, document = await load_skill_inputs(filename, project_folder_name, document_store)
+            _, order = skill_chain.plan_skills(skills, document, settings.NAIVE_CHUNK_THRESHOLD)
+
+        except Exception as e:
+            logging.exception(f"SKILL STREAM FAILED FOR {filename}")
+            yield format_sse('error', {"detail": str(e)})
+            return
+
+        yield format_sse('planned', {"filename": filename, "skills": order})
+        skill_events = asyncio.Queue()
+
+        async def run_chain():
+            try:
+                return await skill_chain(
+                    oai_client=oai_client,
+                    skills=skills,
+                    context=context,
+                    document=document,
+                    completion_cache=get_completion_cache(project_folder_name, blob_client, bypass_cache),
+                    skill_events=skill_events
+                )
+            finally:
+                skill_events.put_nowait(None)
+
+        chain = asyncio.create_task(run_chain())
+        try:
+            while (event := await skill_events.get()) is not None:
+                skill, generation = event
+                yield format_sse('skill', {"skill": skill, "generation": generation})
+            generations = await chain
+
+            await save_skill_generations(filename, project_folder_name, generations, overwrite, blob_client)
+
+            created_pages = []
+            if notion_page_id:
+                async for skill, page_id in create_skill_pages(notion_page_id, filename, generations):
+                    created_pages.append(page_id)
+                    yield format_sse('notion', {"skill": skill, "page_id": page_id})
+
+        except Exception as e:
+            logging.exception(f"SKILL STREAM FAILED FOR {filename}")
+            yield format_sse('error', {"detail": str(e)})
+            return
+
+        finally:
+            chain.cancel()
+
+        yield format_sse('done', {"created_notion_page_ids": created_pages, "created_at": str(datetime.now())})
+
+    return StreamingResponse(
+        with_heartbeat(events(), settings.SSE_HEARTBEAT_INTERVAL), 
+        media_type="text/event-stream", 
+        headers=SSE_HEADERS
+    )
+
+
 
 @router.post("/completion") 
-async def completion(message:str, client:AsyncOpenAI=Depends(get_oai_client)) -> dict:   
+async def completion(
+    message:str, 
+    project_folder_name:Optional[str]=None, 
+    bypass_cache:Optional[bool]=False,
+    client:AsyncOpenAI=Depends(get_oai_client),
+    blob_client:BlobServiceClient=Depends(get_az_blob_storage_client)
+    ) -> dict:   
     """
     Third step in the Chain is to run the skills
     returns this information as JSON and writes to the disk of the host 
 
     If notion_page_id is passed, this should correspond to the Documents Page ID, not the Project's ID
+
+    with project_folder_name, completions are cached under the project's artifacts, otherwise only in memory
     """
-    response = await make_open_ai_request(client, "you are a helpful Assistant", message)
+    response = await make_open_ai_request(
+        client, 
+        "you are a helpful Assistant", 
+        message, 
+        completion_cache=get_completion_cache(project_folder_name, blob_client, bypass_cache)
+    )
     assistant_message = response.choices[0].message.content
     return {
         "completion": assistant_message,
         "created_at": str(datetime.now())
     }
 
+
+@router.post("/completion/stream", dependencies=[Depends(require_sse)]) 
+async def stream_completion(message:str, client:AsyncOpenAI=Depends(get_oai_client)) -> StreamingResponse:   
+    """
+    Streaming variant of the completion endpoint, 
+    each token event carries the next piece of the completion as it is generated
+    only served with SSE_ENABLED, where the app runs behind a server that streams responses
+    """
+
+    async def events():
+        try:
+            async for delta in stream_open_ai_completion(client, "you are a helpful Assistant", message):
+                yield format_sse('token', {"content": delta})
+
+        except Exception as e:
+            logging.exception("COMPLETION STREAM FAILED")
+            yield format_sse('error', {"detail": str(e)})
+            return
+
+        yield format_sse('done', {"created_at": str(datetime.now())})
+
+    return StreamingResponse(
+        with_heartbeat(events(), settings.SSE_HEARTBEAT_INTERVAL), 
+        media_type="text/event-stream", 
+        headers=SSE_HEADERS
+    )
@@ -0,0 +1,64 @@
+"""
+recall@k and latency of the IVF index against exact search on the same data
+
+    python -m benchmarks.ann_benchmark --chunks 200000 --questions 50 --n-probe 8 16 32 64
+"""
+import time
+import argparse
+
+import numpy as np
+
+from SolwayAPI.api.v1.core.utils.ann_helpers import IVFIndex
+from SolwayAPI.api.v1.core.utils.index_helpers import normalize_rows
+
+
+def topic_centres(num_topics:int, dim:int, rng:np.random.Generator) -> np.ndarray:
+    return rng.standard_normal((num_topics, dim), dtype=np.float32)
+
+
+def clustered_vectors(num:int, topics:np.ndarray, rng:np.random.Generator) -> np.ndarray:
+    """ 
+    embeddings cluster by topic, uniform noise would be the worst case for any ivf index
+    chunks and questions are drawn around the same topics, the way questions ask about what the documents cover
+    """
+    members = rng.integers(0, len(topics), size=num)
+    return normalize_rows(topics[members] + 0.6 * rng.standard_normal((num, topics.shape[1]), dtype=np.float32))
+
+
+def exact_search(vectors:np.ndarray, queries:np.ndarray, top_n:int) -> np.ndarray:
+    scores = queries @ vectors.T
+    candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--top-n', type=int, default=30)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    topics = topic_centres(args.topics, args.dim, rng)
+    vectors = clustered_vectors(args.chunks, topics, rng)
+    queries = clustered_vectors(args.questions, topics, rng)
+
+    start = time.perf_counter()
+    ann = IVFIndex.build(vectors)
+    print(f"built {len(ann.centroids)} lists over {args.chunks} chunks in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    truth = exact_search(vectors, queries, args.top_n)
+    exact_seconds = time.perf_counter() - start
+    print(f"exact        : {exact_seconds * 1000:8.1f} ms for {args.questions} questions")
+
+    for n_probe in args.n_probe:
+        start = time.perf_counter()
+        results = ann.search(vectors, queries, args.top_n, n_probe)
+        seconds = time.perf_counter() - start
+        recall = np.mean([len(set(found) & set(expected)) / args.top_n for found, expected in zip(results, truth)])
+        print(f"n_probe {n_probe:>4} : {seconds * 1000:8.1f} ms   recall@{args.top_n} {recall:.3f}   {exact_seconds / seconds:5.1f} x")
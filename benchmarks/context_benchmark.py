@@ -0,0 +1,139 @@
+"""
+latency and token cost of the concurrent versus the combined Context extraction
+
+    python -m benchmarks.context_benchmark --plan-pages 30
+    python -m benchmarks.context_benchmark --research-plan plan.txt --live
+
+the default client simulates OpenAI, latency grows with the prompt and the output tokens
+--live sends the requests to OpenAI and reports the usage it returns
+"""
+import time
+import json
+import random
+import asyncio
+import argparse
+
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from SolwayAPI.api.v1.core import chain_prompts
+from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.core.clients import get_openai_client
+from SolwayAPI.api.v1.core.utils.cache_helpers import CompletionCache
+from SolwayAPI.api.v1.core.utils.tokenizer_helpers import count_tokens
+from SolwayAPI.api.v1.resources.artifacts import Context, CONTEXT_EXTRACTIONS
+
+
+FAKE_EXTRACTIONS = {
+    "context": {
+        "client": "City of Kelowna",
+        "client_background": "a municipality in the Okanagan valley planning for climate resilience",
+        "consultancy": "Solway",
+        "problem_statement": "How might we prepare the city's development for a changing climate",
+        "consultancy_task": "Climate development research report",
+    },
+    "research_questions": {"municipal plans": ["How is climate risk assessed?", "Which adaptation measures are funded?"]},
+    "thematic_areas": {"thematic_areas": ["stormwater", "housing", "transportation"]},
+}
+
+
+# the extraction each system prompt asks for, None is every extraction at once
+PROMPT_EXTRACTIONS = {getattr(chain_prompts, key): key for key in CONTEXT_EXTRACTIONS}
+PROMPT_EXTRACTIONS[chain_prompts.combined] = None
+
+
+class FakeCompletions:
+    """ answers chat completions after a delay of base_latency plus a cost per prompt and per output token """
+
+    def __init__(self, base_latency:float, prefill_rate:float, decode_rate:float):
+        self.base_latency = base_latency
+        self.prefill_rate = prefill_rate
+        self.decode_rate = decode_rate
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+
+
+    async def create(self, model:str, messages:list, **kwargs) -> ChatCompletion:
+        key = PROMPT_EXTRACTIONS[messages[0]['content']]
+        content = json.dumps(FAKE_EXTRACTIONS if key is None else FAKE_EXTRACTIONS[key])
+
+        prompt_tokens = sum(count_tokens(message['content']) for message in messages)
+        completion_tokens = count_tokens(content)
+        await asyncio.sleep(self.base_latency + prompt_tokens / self.prefill_rate + completion_tokens / self.decode_rate)
+
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+class UsageRecorder:
+    """ wraps the real client and sums the usage reported by OpenAI """
+
+    def __init__(self, client):
+        self.client = client
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+
+
+    async def create(self, **kwargs) -> ChatCompletion:
+        response = await self.client.chat.completions.create(**kwargs)
+        self.calls += 1
+        self.prompt_tokens += response.usage.prompt_tokens
+        self.completion_tokens += response.usage.completion_tokens
+        return response
+
+
+def make_research_plan(num_pages:int, words_per_page:int=450, seed:int=0) -> str:
+    rng = random.Random(seed)
+    vocabulary = [
+        "climate", "adaptation", "council", "infrastructure", "stormwater", "the", "of", "and", "policy",
+        "resilience", "research", "question", "housing", "transportation", "emissions", "thematic", "area", "plan",
+    ]
+    return '\n'.join(' '.join(rng.choice(vocabulary) for _ in range(words_per_page)) for _ in range(num_pages))
+
+
+async def run(research_plan_text:str, args) -> None:
+    """ both modes run on one event loop, the process wide rate limiter is bound to it """
+    for mode in ('concurrent', 'combined'):
+        if args.live:
+            completions = UsageRecorder(get_openai_client())
+        else:
+            completions = FakeCompletions(args.base_latency, args.prefill_rate, args.decode_rate)
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        start = time.perf_counter()
+        await Context(settings.AGENT_INTERNALS)(client, research_plan_text, completion_cache=CompletionCache(bypass=True), mode=mode)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{mode:>10}: {elapsed:6.2f} s, {completions.calls} calls, "
+            f"{completions.prompt_tokens:7d} prompt tokens, {completions.completion_tokens:5d} completion tokens"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plan-pages', type=int, default=30)
+    parser.add_argument('--research-plan', type=str, default=None, help="text file to use as the research plan")
+    parser.add_argument('--live', action='store_true', help="send the requests to OpenAI")
+    parser.add_argument('--base-latency', type=float, default=0.4)
+    parser.add_argument('--prefill-rate', type=float, default=20000, help="simulated prompt tokens per second")
+    parser.add_argument('--decode-rate', type=float, default=80, help="simulated output tokens per second")
+    args = parser.parse_args()
+
+    if args.research_plan:
+        with open(args.research_plan) as f:
+            research_plan_text = f.read()
+    else:
+        research_plan_text = make_research_plan(args.plan_pages)
+    print(f"research plan: {count_tokens(research_plan_text)} tokens")
+
+    asyncio.run(run(research_plan_text, args))
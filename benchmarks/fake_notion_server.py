@@ -0,0 +1,137 @@
+"""
+local stand-in for the Notion pages API, it enforces Notion's limit of about three requests per second
+throttled requests get a 429 with a Retry-After header, and a share of requests can be made to fail with a 502
+
+    python -m benchmarks.fake_notion_server --port 8765
+    NOTION_API_URL=http://127.0.0.1:8765/v1 NOTION_API_TOKEN=fake func start
+"""
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+from collections import Counter
+
+import uvicorn
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+RICH_TEXT_LIMIT = 2000
+CHILDREN_LIMIT = 100
+
+
+class TokenBucket:
+    """ allows bursts of up to capacity requests, refilled at rate per second """
+
+    def __init__(self, rate:float, capacity:float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+    def wait_time(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def notion_error(status:int, code:str, message:str, headers:dict=None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"object": "error", "status": status, "code": code, "message": message},
+        headers=headers
+    )
+
+
+def too_many_children(blocks:list) -> bool:
+    """ notion rejects more than 100 children in any block, at every level of nesting """
+    if len(blocks) > CHILDREN_LIMIT:
+        return True
+    return any(too_many_children(block.get(block.get('type'), {}).get('children', [])) for block in blocks)
+
+
+def rich_text_too_long(blocks:list) -> bool:
+    """ notion rejects any rich text object whose content is longer than 2000 characters """
+    for block in blocks:
+        body = block.get(block.get('type'), {})
+        for rich_text in body.get('rich_text', []):
+            if len(rich_text.get('text', {}).get('content', '')) > RICH_TEXT_LIMIT:
+                return True
+        if rich_text_too_long(body.get('children', [])):
+            return True
+    return False
+
+
+def create_app(requests_per_second:float=3.0, burst:float=3.0, failure_rate:float=0.0, latency:float=0.05, seed:int=0) -> FastAPI:
+    """ a fresh server, app.state.stats counts requests, throttled and failed requests and created pages """
+    app = FastAPI()
+    app.state.stats = Counter()
+    app.state.pages = {}
+    bucket = TokenBucket(requests_per_second, burst)
+    rng = random.Random(seed)
+
+    @app.post("/v1/pages")
+    async def create_page(request:Request):
+        stats = app.state.stats
+        stats['requests'] += 1
+
+        if not request.headers.get('authorization', '').startswith('Bearer '):
+            stats['unauthorized'] += 1
+            return notion_error(401, "unauthorized", "API token is invalid.")
+
+        if not request.headers.get('notion-version'):
+            stats['invalid'] += 1
+            return notion_error(400, "missing_version", "Notion-Version header failed validation.")
+
+        if not bucket.take():
+            stats['throttled'] += 1
+            return notion_error(429, "rate_limited", "You have been rate limited.", {"Retry-After": f"{bucket.wait_time():.2f}"})
+
+        if rng.random() < failure_rate:
+            stats['failed'] += 1
+            return notion_error(502, "service_unavailable", "Notion is unavailable.")
+
+        payload = await request.json()
+        children = payload.get('children', [])
+        if too_many_children(children):
+            stats['invalid'] += 1
+            return notion_error(400, "validation_error", f"body.children.length should be ≤ `{CHILDREN_LIMIT}`.")
+
+        if rich_text_too_long(children):
+            stats['invalid'] += 1
+            return notion_error(400, "validation_error", f"text.content.length should be ≤ `{RICH_TEXT_LIMIT}`.")
+
+        await asyncio.sleep(latency)
+        page_id = str(uuid.uuid4())
+        app.state.pages[page_id] = payload
+        stats['created'] += 1
+        return {"object": "page", "id": page_id, "parent": payload.get('parent'), "properties": payload.get('properties')}
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests-per-second', type=float, default=3.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.requests_per_second, args.requests_per_second, args.failure_rate, args.latency),
+        host='127.0.0.1',
+        port=args.port
+    )
@@ -0,0 +1,99 @@
+"""
+publishes pages to the fake Notion server, with the shared async client and with unthrottled concurrent posts
+
+    python -m benchmarks.notion_benchmark --pages 30 --failure-rate 0.05
+    python -m benchmarks.notion_benchmark --pages 80 --requests-per-second 10 --attempt-timeout 1
+
+page creation is not retried after a timeout or a server error, it may have created the page, 
+so with --failure-rate the shared client reports those pages as failed rather than risk duplicates
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+import uvicorn
+
+from SolwayAPI.api.v1.core.utils.notion_api_helpers import (
+    NOTION_RETRYABLE_ERRORS,
+    NotionClient,
+    get_title_property
+)
+from SolwayAPI.api.v1.core.utils.retry_helpers import RetryPolicy
+
+from .fake_notion_server import create_app
+
+
+async def serve(app, port:int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+async def publish_with_client(base_url:str, pages:int, requests_per_second:float, attempt_timeout:float) -> tuple:
+    client = NotionClient(
+        api_key='fake',
+        base_url=base_url,
+        version='2022-06-28',
+        requests_per_second=requests_per_second,
+        max_connections=10,
+        timeout=attempt_timeout,
+        retry_policy=RetryPolicy(
+            max_attempts=8, base_delay=0.5, max_delay=10, attempt_timeout=attempt_timeout, deadline=None, retry_on=NOTION_RETRYABLE_ERRORS
+        )
+    )
+    try:
+        results = await asyncio.gather(*[
+            client.create_page('parent', f"page {i}") for i in range(pages)
+        ], return_exceptions=True)
+    finally:
+        await client.aclose()
+    return sum(not isinstance(result, Exception) for result in results), pages
+
+
+async def publish_unthrottled(base_url:str, pages:int) -> tuple:
+    """ the previous behaviour without blocking the loop, every page posted at once and never retried """
+    headers = {"Authorization": "Bearer fake", "Notion-Version": "2022-06-28"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers) as client:
+        responses = await asyncio.gather(*[
+            client.post('/pages', json={"parent": {"type": "page_id", "page_id": "parent"}, "properties": get_title_property(f"page {i}")})
+            for i in range(pages)
+        ])
+    return sum(response.is_success for response in responses), pages
+
+
+async def main(args):
+    for name in ('unthrottled', 'shared client'):
+        app = create_app(args.requests_per_second, args.requests_per_second, args.failure_rate, args.latency)
+        server = await serve(app, args.port)
+        base_url = f"http://127.0.0.1:{args.port}/v1"
+
+        start = time.perf_counter()
+        if name == 'unthrottled':
+            created, pages = await publish_unthrottled(base_url, args.pages)
+        else:
+            created, pages = await publish_with_client(base_url, args.pages, args.requests_per_second, args.attempt_timeout)
+        elapsed = time.perf_counter() - start
+
+        stats = app.state.stats
+        print(
+            f"{name:>14}: {created}/{pages} pages in {elapsed:6.2f} s, "
+            f"{stats['requests']} requests, {stats['throttled']} throttled, {stats['failed']} failed"
+        )
+        server.should_exit = True
+        await asyncio.sleep(0.2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests-per-second', type=float, default=3.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--attempt-timeout', type=float, default=30, help="bound on each http call, the wait for the rate limit is not part of it")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
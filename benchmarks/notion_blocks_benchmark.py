@@ -0,0 +1,74 @@
+"""
+micro-benchmark of markdown to notion blocks, through rendered HTML and BeautifulSoup versus the markdown-it tokens
+
+    python -m benchmarks.notion_blocks_benchmark --sections 40
+"""
+import random
+import argparse
+import timeit
+
+from SolwayAPI.api.v1.core.utils.notion_helpers import (
+    NOTION_MAX_CHILDREN,
+    NOTION_MAX_DEPTH,
+    NOTION_RICH_TEXT_LIMIT,
+    html_to_notion_blocks,
+    markdown_to_html,
+    markdown_to_notion_blocks
+)
+
+
+def make_skill_output(num_sections:int, seed:int=0) -> str:
+    """ synthetic skill output, shaped like the keypoints and summarization generations """
+    rng = random.Random(seed)
+    vocabulary = [
+        "climate", "adaptation", "council", "infrastructure", "stormwater", "the", "of", "and", "policy",
+        "resilience", "2024", "Kelowna", "housing", "transportation", "emissions", "reduce", "community", "plan",
+    ]
+
+    def sentence(words:int) -> str:
+        text = [rng.choice(vocabulary) for _ in range(words)]
+        text[rng.randrange(words)] = f"**{rng.choice(vocabulary)}**"
+        text[rng.randrange(words)] = f"*{rng.choice(vocabulary)}*"
+        return ' '.join(text).capitalize() + '.'
+
+    sections = []
+    for i in range(num_sections):
+        items = '\n'.join(
+            f"- {sentence(12)}\n  - {sentence(8)} see [page {i}](https://example.com/{i})" for _ in range(4)
+        )
+        sections.append(f"## Section {i}\n\n{' '.join(sentence(20) for _ in range(6))}\n\n{items}\n\n1. {sentence(10)}\n2. `{rng.choice(vocabulary)}`\n")
+    return '\n'.join(sections)
+
+
+def html_path(markdown:str) -> list:
+    return html_to_notion_blocks(markdown_to_html(markdown))
+
+
+def token_path(markdown:str) -> list:
+    return markdown_to_notion_blocks(markdown)
+
+
+def check_limits(blocks:list, depth:int=1) -> None:
+    """ asserts the blocks respect the rich text, children and nesting limits of the notion API """
+    assert not blocks or depth <= NOTION_MAX_DEPTH
+    assert depth == 1 or len(blocks) <= NOTION_MAX_CHILDREN
+    for block in blocks:
+        body = block[block['type']]
+        assert all(len(item['text']['content']) <= NOTION_RICH_TEXT_LIMIT for item in body.get('rich_text', []))
+        check_limits(body.get('children', []), depth + 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sections', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=10)
+    args = parser.parse_args()
+
+    markdown = make_skill_output(args.sections)
+    check_limits(token_path(markdown))
+    print(f"skill output: {len(markdown)} characters, {args.sections} sections")
+
+    for name, fn in [("html + soup", html_path), ("tokens", token_path)]:
+        best = min(timeit.repeat(lambda: fn(markdown), number=args.number, repeat=args.repeat)) / args.number
+        print(f"{name:>12}: {best*1000:8.2f} ms per output, {len(fn(markdown))} top level blocks")
@@ -0,0 +1,170 @@
+"""
+wall clock time per stage of the phased pipeline against the stage graph, on simulated stage latencies
+
+    python -m benchmarks.pipeline_benchmark --documents 12
+    python -m benchmarks.pipeline_benchmark --documents 40 --skills-latency 20 --index-latency 4
+
+phased is the previous orchestration, context, then each document indexed in turn, then every document's skills, then RAG
+each phase downloads and parses its documents again, as it read them from blob storage itself
+graph is execute_pipeline's shape, every document is parsed once and moves through index and skills on its own,
+with at most PIPELINE_DOCUMENT_CONCURRENCY parsed documents and INDEX_CONCURRENCY index writes at a time
+both report through the pipeline's StageTimer, so the stage spans can be compared directly
+"""
+import json
+import random
+import asyncio
+import argparse
+
+from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.core.utils.pipeline_helpers import StageTimer
+
+
+class SimulatedStages:
+    """ each stage sleeps for its latency, download and parse scale with the document's pages """
+
+    def __init__(self, args):
+        self.args = args
+
+
+    async def context(self):
+        await asyncio.sleep(self.args.context_latency)
+
+
+    async def download(self, pages:int):
+        await asyncio.sleep(self.args.download_latency + pages * self.args.download_per_page)
+
+
+    async def parse(self, pages:int):
+        await asyncio.sleep(pages * self.args.parse_per_page)
+
+
+    async def index(self, pages:int):
+        await asyncio.sleep(self.args.index_latency)
+
+
+    async def commit(self):
+        await asyncio.sleep(self.args.commit_latency)
+
+
+    async def skills(self, pages:int):
+        await asyncio.sleep(self.args.skills_latency)
+
+
+    async def rag(self):
+        await asyncio.sleep(self.args.rag_latency)
+
+
+async def run_phased(documents:dict, stages:SimulatedStages) -> dict:
+    timer = StageTimer()
+
+    with timer.time('context'):
+        await stages.context()
+
+    for filename, pages in documents.items():
+        with timer.time('index'), timer.time('parse', filename):
+            await stages.download(pages)
+            await stages.parse(pages)
+        with timer.time('index'), timer.time('index', filename):
+            await stages.index(pages)
+            await stages.commit()
+
+    async def skills_document(filename:str, pages:int):
+        with timer.time('skills'), timer.time('skills', filename):
+            await stages.download(pages)
+            await stages.parse(pages)
+            await stages.skills(pages)
+
+    await asyncio.gather(*[skills_document(filename, pages) for filename, pages in documents.items()])
+
+    with timer.time('rag'):
+        await stages.rag()
+
+    return timer.report()
+
+
+async def run_graph(documents:dict, stages:SimulatedStages) -> dict:
+    timer = StageTimer()
+    parse_semaphore = asyncio.Semaphore(settings.PIPELINE_DOCUMENT_CONCURRENCY)
+    index_semaphore = asyncio.Semaphore(settings.INDEX_CONCURRENCY)
+
+    async def context_stage():
+        with timer.time('context'):
+            await stages.context()
+
+    async def parse_document(filename:str, pages:int):
+        await parse_semaphore.acquire()
+        with timer.time('parse', filename):
+            await stages.download(pages)
+            await stages.parse(pages)
+
+    async def index_document(filename:str, pages:int, parsed:asyncio.Task):
+        await parsed
+        async with index_semaphore:
+            with timer.time('index', filename):
+                await stages.index(pages)
+
+    async def skills_document(filename:str, pages:int, parsed:asyncio.Task, context_done:asyncio.Task):
+        await asyncio.gather(parsed, context_done)
+        with timer.time('skills', filename):
+            await stages.skills(pages)
+
+    async def release_document(tasks:list):
+        await asyncio.gather(*tasks)
+        parse_semaphore.release()
+
+    async def index_stage(index_tasks:list):
+        await asyncio.gather(*index_tasks)
+        with timer.time('index'), timer.time('index_commit'):
+            await stages.commit()
+
+    async def rag_stage(index_done:asyncio.Task, context_done:asyncio.Task):
+        await asyncio.gather(index_done, context_done)
+        with timer.time('rag'):
+            await stages.rag()
+
+    async with asyncio.TaskGroup() as task_group:
+        context_done = task_group.create_task(context_stage())
+        index_tasks = []
+        for filename, pages in documents.items():
+            parsed = task_group.create_task(parse_document(filename, pages))
+            index_tasks.append(task_group.create_task(index_document(filename, pages, parsed)))
+            skills_done = task_group.create_task(skills_document(filename, pages, parsed, context_done))
+            task_group.create_task(release_document([parsed, index_tasks[-1], skills_done]))
+
+        index_done = task_group.create_task(index_stage(index_tasks))
+        task_group.create_task(rag_stage(index_done, context_done))
+
+    return timer.report()
+
+
+def make_documents(num_documents:int, min_pages:int, max_pages:int, seed:int=0) -> dict:
+    rng = random.Random(seed)
+    return {f"project/document_{idx}.pdf": rng.randint(min_pages, max_pages) for idx in range(num_documents)}
+
+
+async def run(args) -> None:
+    documents = make_documents(args.documents, args.min_pages, args.max_pages)
+    stages = SimulatedStages(args)
+    print(f"{len(documents)} documents, {sum(documents.values())} pages")
+
+    for name, orchestration in (('phased', run_phased), ('graph', run_graph)):
+        report = await orchestration(documents, stages)
+        print(f"{name:>7}: {report['total']:7.2f} s total, stages {json.dumps(report['stages'])}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=12)
+    parser.add_argument('--min-pages', type=int, default=10)
+    parser.add_argument('--max-pages', type=int, default=120)
+    parser.add_argument('--context-latency', type=float, default=3.0)
+    parser.add_argument('--download-latency', type=float, default=0.1)
+    parser.add_argument('--download-per-page', type=float, default=0.002)
+    parser.add_argument('--parse-per-page', type=float, default=0.01)
+    parser.add_argument('--index-latency', type=float, default=1.5, help="chunking and embedding one document")
+    parser.add_argument('--commit-latency', type=float, default=0.3, help="writing to the index manifest")
+    parser.add_argument('--skills-latency', type=float, default=5.0, help="every requested skill of one document")
+    parser.add_argument('--rag-latency', type=float, default=4.0)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
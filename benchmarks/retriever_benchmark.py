@@ -0,0 +1,75 @@
+"""
+compares the per question list comprehension retriever with the vectorized Retriever
+
+    python -m benchmarks.retriever_benchmark --chunks 100000 --questions 50
+"""
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from SolwayAPI.api.v1.resources.rag import Retriever
+
+
+class LegacyRetriever:
+    """ the previous implementation, three dict copies of the index and one cosine similarity per chunk """
+
+    def __init__(self, index):
+        self.chunks2idx = {idx:chunk for idx, chunk in enumerate(index['textstore'])}
+        self.embs2idx = {idx:emb for idx, emb in enumerate(index['vectorstore'])}
+        self.vector_store = {idx:np.array(emb) for idx, emb in self.embs2idx.items()}
+
+    def cosine_similarity(self, a, b):
+        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+    def top_k(self, query_embeddings, top_n):
+        results = []
+        for q_emb in query_embeddings:
+            similarities = [self.cosine_similarity(q_emb, chunk) for chunk in self.embs2idx.values()]
+            results.append(np.argsort(similarities)[::-1][:top_n])
+        return results
+
+
+def build(cls, index):
+    """ returns the instance and the memory allocated while building it """
+    tracemalloc.start()
+    instance = cls(index)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return instance, allocated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--top-n', type=int, default=30)
+    parser.add_argument('--legacy-lists', action='store_true', help="feed the legacy retriever float lists, as index.json did")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.questions, args.dim), dtype=np.float32)
+    textstore = [{"text": f"chunk {i}", "title": "doc.pdf", "page_number": i} for i in range(args.chunks)]
+
+    legacy_vectors = vectors.tolist() if args.legacy_lists else list(vectors)
+    legacy, legacy_bytes = build(LegacyRetriever, {"textstore": textstore, "vectorstore": legacy_vectors})
+    retriever, retriever_bytes = build(Retriever, {"textstore": textstore, "vectorstore": vectors})
+
+    start = time.perf_counter()
+    legacy_top = legacy.top_k(queries, args.top_n)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    top = retriever.top_k(queries, args.top_n)
+    seconds = time.perf_counter() - start
+
+    agreement = np.mean([len(set(a) & set(b)) / args.top_n for a, b in zip(legacy_top, top)])
+
+    print(f"{args.chunks} chunks x {args.questions} questions, dim {args.dim}, top {args.top_n}")
+    print(f"legacy     : {legacy_seconds:8.3f} s   {legacy_bytes / 2**20:8.1f} MiB allocated building the retriever")
+    print(f"vectorized : {seconds:8.3f} s   {retriever_bytes / 2**20:8.1f} MiB allocated building the retriever")
+    print(f"speedup    : {legacy_seconds / seconds:8.1f} x")
+    print(f"top-{args.top_n} agreement with legacy: {agreement:.3f}")
@@ -0,0 +1,56 @@
+"""
+micro-benchmark of per page versus batched token counting
+
+    python -m benchmarks.tokenizer_benchmark --pages 600
+"""
+import random
+import argparse
+import timeit
+
+import tiktoken
+
+from SolwayAPI.api.v1.core.utils.tokenizer_helpers import (
+    DEFAULT_ENCODING,
+    count_tokens,
+    count_tokens_batch,
+    get_encoding
+)
+
+
+def make_pages(num_pages:int, words_per_page:int, seed:int=0) -> list:
+    """ synthetic pages of municipal-plan sized text """
+    rng = random.Random(seed)
+    vocabulary = [
+        "climate", "adaptation", "council", "infrastructure", "stormwater", "the", "of", "and", "policy",
+        "resilience", "2024", "Kelowna", "housing", "transportation", "emissions", "reduce", "community", "plan",
+    ]
+    return [' '.join(rng.choice(vocabulary) for _ in range(words_per_page)) for _ in range(num_pages)]
+
+
+def uncached_per_page(pages:list) -> list:
+    """ the previous behaviour, an encoder lookup for every page, in the same encoding as the cached paths """
+    return [len(tiktoken.get_encoding(DEFAULT_ENCODING).encode(page)) for page in pages]
+
+
+def cached_per_page(pages:list) -> list:
+    return [count_tokens(page) for page in pages]
+
+
+def batched(pages:list) -> list:
+    return count_tokens_batch(pages)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=600)
+    parser.add_argument('--words', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages, args.words)
+    get_encoding()
+    assert uncached_per_page(pages) == cached_per_page(pages) == batched(pages)
+
+    for name, fn in [("uncached per page", uncached_per_page), ("cached per page", cached_per_page), ("batched", batched)]:
+        best = min(timeit.repeat(lambda: fn(pages), number=1, repeat=args.repeat))
+        print(f"{name:>18}: {best*1000:8.1f} ms for {args.pages} pages ({best/args.pages*1e6:6.1f} us / page)")
@@ -0,0 +1,89 @@
+import uuid
+
+from types import SimpleNamespace
+
+import pytest
+
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+
+class FakeDownloader:
+
+    def __init__(self, data:bytes, etag:str):
+        self.data = data
+        self.properties = SimpleNamespace(etag=etag)
+
+
+    async def readall(self) -> bytes:
+        return self.data
+
+
+class FakeBlobClient:
+    """ the subset of the aio BlobClient the app uses, over an in-memory {name: (data, etag)} store """
+
+    def __init__(self, store:dict, name:str):
+        self.store = store
+        self.name = name
+
+
+    async def download_blob(self, **kwargs) -> FakeDownloader:
+        if self.name not in self.store:
+            raise ResourceNotFoundError(f"{self.name} not found")
+        return FakeDownloader(*self.store[self.name])
+
+
+    async def upload_blob(self, data, overwrite:bool=False, etag:str=None, match_condition=None, **kwargs) -> dict:
+        if self.name in self.store and not overwrite:
+            raise ResourceExistsError(f"{self.name} exists")
+        if etag and self.store.get(self.name, (None, None))[1] != etag:
+            raise ResourceModifiedError(f"{self.name} was modified")
+        etag = uuid.uuid4().hex
+        self.store[self.name] = (data.encode('utf-8') if isinstance(data, str) else data, etag)
+        return {"etag": etag}
+
+
+    async def delete_blob(self) -> None:
+        if self.store.pop(self.name, None) is None:
+            raise ResourceNotFoundError(f"{self.name} not found")
+
+
+    async def exists(self) -> bool:
+        return self.name in self.store
+
+
+    async def get_blob_properties(self):
+        if self.name not in self.store:
+            raise ResourceNotFoundError(f"{self.name} not found")
+        return SimpleNamespace(etag=self.store[self.name][1])
+
+
+class FakeContainerClient:
+
+    def __init__(self, store:dict):
+        self.store = store
+
+
+    async def list_blobs(self, name_starts_with:str=''):
+        for name, (_, etag) in sorted(self.store.items()):
+            if name.startswith(name_starts_with):
+                yield SimpleNamespace(name=name, etag=etag, content_settings=SimpleNamespace(content_md5=None))
+
+
+class FakeBlobService:
+    """ an in-memory stand in for the aio BlobServiceClient, shared by every client it hands out """
+
+    def __init__(self):
+        self.store = {}
+
+
+    def get_blob_client(self, container:str, blob:str) -> FakeBlobClient:
+        return FakeBlobClient(self.store, blob)
+
+
+    def get_container_client(self, container:str) -> FakeContainerClient:
+        return FakeContainerClient(self.store)
+
+
+@pytest.fixture
+def blob_service() -> FakeBlobService:
+    return FakeBlobService()
@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from SolwayAPI.api.v1.core.config import settings
+from SolwayAPI.api.v1.resources import artifacts
+
+
+PROJECT = "client/project"
+
+
+@pytest.fixture(autouse=True)
+def small_ann_threshold(monkeypatch):
+    monkeypatch.setattr(settings, 'ANN_THRESHOLD', 1)
+
+
+def write_file(blob_service, file_name:str, count:int, seed:int) -> dict:
+    vectors = np.random.default_rng(seed).standard_normal((count, 8)).astype(np.float32)
+    chunks = [{"title": file_name, "page_number": idx, "text": f"{file_name} {idx}"} for idx in range(count)]
+    return asyncio.run(artifacts.write_index_segment(PROJECT, [file_name], chunks, vectors, blob_service))
+
+
+def load_ann(blob_service) -> dict:
+    return asyncio.run(artifacts.load_index(PROJECT, blob_service))['ann']
+
+
+def test_ann_index_is_searched_while_it_matches_the_manifest(blob_service):
+    asyncio.run(artifacts.commit_index(PROJECT, [write_file(blob_service, "a.pdf", 30, 0)], blob_service))
+    asyncio.run(artifacts.commit_index(PROJECT, [write_file(blob_service, "b.pdf", 5, 1)], blob_service))
+
+    index = asyncio.run(artifacts.load_index(PROJECT, blob_service))
+    assert index['ann'] is not None
+    assert len(index['ann']) == len(index['vectorstore']) == 35
+
+
+def test_replaced_segments_are_searched_exactly_until_the_ann_index_is_rebuilt(blob_service):
+    """ a replacement that shrinks the index and moves a file after the others, committed before the ann rebuild """
+    a, b = write_file(blob_service, "a.pdf", 30, 0), write_file(blob_service, "b.pdf", 5, 1)
+    asyncio.run(artifacts.commit_index(PROJECT, [a, b], blob_service))
+    manifest = asyncio.run(artifacts.commit_index_segments(
+        PROJECT, [write_file(blob_service, "a.pdf", 10, 2)], blob_service, replace=["a.pdf"]
+    ))
+    assert load_ann(blob_service) is None
+
+    asyncio.run(artifacts.update_ann_index(PROJECT, manifest, blob_service))
+    assert len(load_ann(blob_service)) == 15
+
+
+def test_ann_index_without_segments_is_searched_exactly(blob_service):
+    """ an ann index written before the segments it was filed from were recorded """
+    asyncio.run(artifacts.commit_index(PROJECT, [write_file(blob_service, "a.pdf", 30, 0)], blob_service))
+    ann = asyncio.run(artifacts.load_ann_index(PROJECT, blob_service))
+    ann.segments = None
+    asyncio.run(artifacts.upload_blob_bytes(
+        artifacts.get_index_path(PROJECT, settings.INDEX_ANN_NAME), ann.to_bytes(), True, blob_service
+    ))
+    assert load_ann(blob_service) is None
@@ -0,0 +1,64 @@
+import asyncio
+import types
+
+import numpy as np
+import pytest
+
+from SolwayAPI.api.v1.core.utils.task_helpers import limit_semaphore
+from SolwayAPI.api.v1.resources import artifacts, rag
+
+
+@pytest.mark.parametrize("concurrency, permits", [(0, 1), (-3, 1), (None, 5), (2, 2)])
+def test_limit_semaphore_permits(concurrency, permits):
+    semaphore = limit_semaphore(concurrency, 5)
+    assert semaphore._value == permits
+
+
+@pytest.mark.parametrize("concurrency", [0, None])
+def test_index_record_with_no_concurrency_indexes_every_file(monkeypatch, concurrency):
+    async def load_index_filenames(project_folder_name, blob_client):
+        return []
+
+    async def index_file(project_folder_name, name, chunker, batchsize, semaphore, vo_client, blob_client, document_store):
+        async with semaphore:
+            return {"files": [name]}
+
+    async def commit_index(project_folder_name, segments, blob_client):
+        return {"segments": segments}
+
+    monkeypatch.setattr(artifacts, 'load_index_filenames', load_index_filenames)
+    monkeypatch.setattr(artifacts, 'get_semantic_chunker', lambda: None)
+    monkeypatch.setattr(artifacts, 'index_file', index_file)
+    monkeypatch.setattr(artifacts, 'commit_index', commit_index)
+
+    result = asyncio.run(asyncio.wait_for(artifacts.create_index_record(
+        project_folder_name="client/project",
+        file_name=["client/project/a.pdf", "client/project/b.pdf"],
+        concurrency=concurrency,
+        vo_client=None,
+        blob_client=None,
+        document_store=None
+    ), timeout=5))
+    assert result == {"files": ["client/project/a.pdf", "client/project/b.pdf"]}
+
+
+@pytest.mark.parametrize("concurrency", [0, None])
+def test_retriever_with_no_concurrency_answers_every_question(monkeypatch, concurrency):
+    async def make_voyage_embed_request(vo_client, queries):
+        return [[1.0, 0.0] for _ in queries]
+
+    async def make_open_ai_request(oai_client, prompt, user_message, completion_cache=None):
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=f"answer to {prompt}"))])
+
+    monkeypatch.setattr(rag, 'make_voyage_embed_request', make_voyage_embed_request)
+    monkeypatch.setattr(rag, 'make_open_ai_request', make_open_ai_request)
+
+    retriever = rag.Retriever({
+        "textstore": [{"text": "chunk", "title": "a.pdf", "page_number": 1}],
+        "vectorstore": np.array([[1.0, 0.0]], dtype=np.float32),
+    })
+    answers = asyncio.run(asyncio.wait_for(
+        retriever(None, None, ("Q: ", ""), ["one?", "two?"], top_n=1, concurrency=concurrency), 
+        timeout=5
+    ))
+    assert answers == {"one?": "answer to Q: one?", "two?": "answer to Q: two?"}
@@ -0,0 +1,156 @@
+import json
+import asyncio
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from SolwayAPI.api.v1.core.utils.job_helpers import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    new_job_record
+)
+from SolwayAPI.api.v1.resources import jobs, pipe
+
+
+PARAMS = {
+    "project_folder_name": "client/project",
+    "research_plan_name": "client/project/plan.pdf",
+    "project_notion_page_id": "",
+    "skills": ["summarization"],
+    "overwrite": False,
+    "bypass_cache": False,
+    "context_mode": "concurrent",
+}
+
+
+class ContextExtractionError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def without_clients(monkeypatch):
+    monkeypatch.setattr(jobs, 'get_openai_client', lambda: None)
+    monkeypatch.setattr(jobs, 'get_voyage_client', lambda: None)
+
+
+def read_checkpoint(blob_service, job:jobs.PipelineJob) -> dict:
+    return json.loads(blob_service.store[job.path][0])
+
+
+def test_failed_job_error_names_the_failing_stage_error(monkeypatch, blob_service):
+    """ runs execute_pipeline on a project without documents whose context extraction fails """
+
+    async def list_project_files(project_folder_name, research_plan_name, blob_client):
+        return {}
+
+    async def load_manifest(project_folder_name, blob_client):
+        return pipe.PipelineManifest(project_folder_name, blob_client)
+
+    async def load_index_filenames(project_folder_name, blob_client):
+        return []
+
+    async def generate_context(**kwargs):
+        raise ContextExtractionError("the research plan has no research questions")
+
+    monkeypatch.setattr(pipe, 'list_project_files', list_project_files)
+    monkeypatch.setattr(pipe.PipelineManifest, 'load', load_manifest)
+    monkeypatch.setattr(pipe, 'load_index_filenames', load_index_filenames)
+    monkeypatch.setattr(pipe, 'get_semantic_chunker', lambda: None)
+    monkeypatch.setattr(pipe, 'generate_context', generate_context)
+
+    job = jobs.PipelineJob(new_job_record('job', PARAMS), blob_service)
+    asyncio.run(jobs.run_pipeline_job(job))
+
+    assert job.record['status'] == JOB_FAILED
+    assert job.record['error'] == "ContextExtractionError: the research plan has no research questions"
+
+
+@pytest.fixture
+def pipeline_runs(monkeypatch) -> list:
+    runs = []
+
+    async def execute_pipeline(progress, **kwargs):
+        runs.append(progress.job_id)
+        return {"pipe_completion_state": True}
+
+    monkeypatch.setattr(jobs, 'execute_pipeline', execute_pipeline)
+    return runs
+
+
+def stop_host_with(blob_service, status:str, idle_for:float=3600) -> jobs.PipelineJob:
+    """ a host that queued a job, and took it to status, then was recycled idle_for seconds ago before the job finished """
+
+    async def run():
+        queue = jobs.PipelineJobQueue(workers=0)
+        job = jobs.PipelineJob(new_job_record('job', PARAMS), blob_service)
+        await job.save()
+        await queue.submit(job)
+        await job.set_status(status)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(run())
+    record = read_checkpoint(blob_service, job)
+    record['updated_at'] = (datetime.now(timezone.utc) - timedelta(seconds=idle_for)).isoformat()
+    blob_service.store[job.path] = (json.dumps(record).encode('utf-8'), "aged")
+    return job
+
+
+def start_host(blob_service, wait:float=0.2):
+    """ a new host whose workers run for wait seconds """
+
+    async def run():
+        queue = jobs.PipelineJobQueue(workers=1)
+        await queue.start(blob_service)
+        await asyncio.sleep(wait)
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("status", [JOB_QUEUED, JOB_RUNNING])
+def test_jobs_of_a_recycled_host_are_recovered_once_stale(blob_service, pipeline_runs, status):
+    job = stop_host_with(blob_service, status)
+    assert job.pending_path in blob_service.store
+
+    start_host(blob_service)
+
+    assert pipeline_runs == ['job']
+    assert read_checkpoint(blob_service, job)['status'] == JOB_SUCCEEDED
+    assert job.pending_path not in blob_service.store
+
+
+def test_recently_checkpointed_jobs_are_left_to_their_worker(blob_service, pipeline_runs):
+    """ the job may still be alive on another instance """
+    job = stop_host_with(blob_service, JOB_RUNNING, idle_for=10)
+    start_host(blob_service)
+
+    assert pipeline_runs == []
+    assert read_checkpoint(blob_service, job)['status'] == JOB_RUNNING
+    assert job.pending_path in blob_service.store
+
+
+def test_finished_jobs_are_not_recovered(blob_service, pipeline_runs):
+    job = stop_host_with(blob_service, JOB_FAILED)
+    start_host(blob_service)
+
+    assert pipeline_runs == []
+    assert read_checkpoint(blob_service, job)['status'] == JOB_FAILED
+    assert job.pending_path not in blob_service.store
+
+
+def test_a_stale_job_is_recovered_by_one_host_only(blob_service, pipeline_runs):
+    stop_host_with(blob_service, JOB_RUNNING)
+
+    async def run():
+        queues = [jobs.PipelineJobQueue(workers=1), jobs.PipelineJobQueue(workers=1)]
+        await asyncio.gather(*[queue.recover(blob_service) for queue in queues])
+        await asyncio.gather(*[queue.start() for queue in queues])
+        await asyncio.sleep(0.2)
+        await asyncio.gather(*[queue.stop() for queue in queues])
+
+    asyncio.run(run())
+    assert pipeline_runs == ['job']
@@ -0,0 +1,71 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.fake_notion_server import create_app
+from SolwayAPI.api.v1.core.utils.notion_api_helpers import (
+    NOTION_RETRYABLE_ERRORS,
+    NotionClient,
+    NotionRequestError
+)
+from SolwayAPI.api.v1.core.utils.retry_helpers import RetryPolicy
+
+
+def publish(app, pages:int, requests_per_second:float) -> tuple:
+    """ creates pages through the fake Notion server app, returns the results and the seconds it took """
+
+    async def run():
+        client = NotionClient(
+            api_key='fake',
+            base_url='http://notion.test/v1',
+            version='2022-06-28',
+            requests_per_second=requests_per_second,
+            max_connections=10,
+            timeout=5,
+            retry_policy=RetryPolicy(
+                max_attempts=8, base_delay=0.05, max_delay=0.5, attempt_timeout=5, deadline=None, retry_on=NOTION_RETRYABLE_ERRORS
+            ),
+            transport=httpx.ASGITransport(app=app)
+        )
+        try:
+            return await asyncio.gather(*[
+                client.create_page('parent', f"page {i}") for i in range(pages)
+            ], return_exceptions=True)
+        finally:
+            await client.aclose()
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    return results, time.perf_counter() - start
+
+
+def test_requests_are_paced_to_the_rate_limit():
+    """ a burst of pages is spread over time rather than throttled by notion """
+    app = create_app(requests_per_second=12, burst=10, latency=0)
+    results, elapsed = publish(app, pages=20, requests_per_second=10)
+
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert app.state.stats['throttled'] == 0
+    assert elapsed >= 0.9
+
+
+def test_throttled_page_creation_is_retried():
+    """ a 429 means the page was not created, so it is retried after notion's Retry-After """
+    app = create_app(requests_per_second=4, burst=2, latency=0)
+    results, _ = publish(app, pages=6, requests_per_second=100)
+
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert app.state.stats['throttled'] > 0
+    assert app.state.stats['created'] == len(app.state.pages) == 6
+
+
+def test_failed_page_creation_is_not_retried():
+    """ a 502 may have created the page, posting it again could duplicate it """
+    app = create_app(failure_rate=1.0, latency=0)
+    results, _ = publish(app, pages=1, requests_per_second=10)
+
+    assert isinstance(results[0], NotionRequestError)
+    assert results[0].status_code == 502
+    assert app.state.stats['requests'] == 1
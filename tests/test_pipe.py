@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from SolwayAPI.api.v1.resources import pipe
+
+
+class FakeProject:
+    """ a project without documents whose index is at index_etag, research answers were generated from answered_etag """
+
+    def __init__(self, monkeypatch, index_etag:str, answered_etag:str):
+        self.index_etag = index_etag
+        self.manifest = pipe.PipelineManifest("client/project", None)
+        self.manifest.record['rag'] = {"index_etag": answered_etag, "notion_pages": ["old-answer"]}
+        self.rag_runs = 0
+        self.archived = []
+
+        async def list_project_files(project_folder_name, research_plan_name, blob_client):
+            return {}
+
+        async def load_manifest(project_folder_name, blob_client):
+            return self.manifest
+
+        async def load_index_filenames(project_folder_name, blob_client):
+            return []
+
+        async def get_index_etag(project_folder_name, blob_client):
+            return self.index_etag
+
+        async def blob_exists(blob_name, service_client):
+            return True
+
+        async def generate_context(**kwargs):
+            return {}
+
+        async def retrieval_aug_gen(**kwargs):
+            self.rag_runs += 1
+            return {"created_notion_pages": [["new-answer-part-1", "new-answer-part-2"]]}
+
+        async def archive_notion_pages(page_ids):
+            self.archived.extend(page_ids)
+
+        async def save():
+            pass
+
+        monkeypatch.setattr(pipe, 'list_project_files', list_project_files)
+        monkeypatch.setattr(pipe.PipelineManifest, 'load', load_manifest)
+        monkeypatch.setattr(pipe, 'load_index_filenames', load_index_filenames)
+        monkeypatch.setattr(pipe, 'get_semantic_chunker', lambda: None)
+        monkeypatch.setattr(pipe, 'get_index_etag', get_index_etag)
+        monkeypatch.setattr(pipe, 'blob_exists', blob_exists)
+        monkeypatch.setattr(pipe, 'generate_context', generate_context)
+        monkeypatch.setattr(pipe, 'retrieval_aug_gen', retrieval_aug_gen)
+        monkeypatch.setattr(pipe, 'archive_notion_pages', archive_notion_pages)
+        monkeypatch.setattr(self.manifest, 'save', save)
+
+
+    def run(self, overwrite:bool=False) -> dict:
+        return asyncio.run(pipe.execute_pipeline(
+            project_folder_name="client/project",
+            research_plan_name="client/project/plan.pdf",
+            project_notion_page_id="project-page",
+            skills=["summarization"],
+            overwrite=overwrite,
+            bypass_cache=False,
+            context_mode="concurrent",
+            oai_client=None,
+            vo_client=None,
+            blob_client=None
+        ))
+
+
+def test_answers_of_the_current_index_are_not_generated_again(monkeypatch):
+    project = FakeProject(monkeypatch, index_etag="etag-1", answered_etag="etag-1")
+    project.run()
+    assert project.rag_runs == 0
+    assert project.archived == []
+
+
+@pytest.mark.parametrize("answered_etag", ["etag-1", None])
+def test_answers_of_an_older_index_are_generated_again(monkeypatch, answered_etag):
+    """ an index committed by a run that stopped before RAG, or a manifest from before answers were versioned """
+    project = FakeProject(monkeypatch, index_etag="etag-2", answered_etag=answered_etag)
+    project.run()
+    assert project.rag_runs == 1
+    assert project.archived == ["old-answer"]
+    assert project.manifest.record['rag']['index_etag'] == "etag-2"
+    assert project.manifest.record['rag']['notion_pages'] == ["new-answer-part-1", "new-answer-part-2"]
+
+
+def test_overwrite_generates_the_answers_again(monkeypatch):
+    project = FakeProject(monkeypatch, index_etag="etag-1", answered_etag="etag-1")
+    project.run(overwrite=True)
+    assert project.rag_runs == 1
@@ -0,0 +1,55 @@
+import json
+import asyncio
+
+import pytest
+
+from SolwayAPI.api.v1.resources import skillchain
+from SolwayAPI.api.v1.resources.skillchain import SkillChain, stream_skills
+
+
+CONTEXT = {"agent_internals": {"consultancy": {"marker": "$", "replacement": "Solway"}}}
+DOCUMENT = {"1": {"textIN": "the first page", "numTokens": 3}}
+
+
+class QuotesError(Exception):
+    pass
+
+
+@pytest.fixture
+def failing_quotes(monkeypatch):
+    """ every skill completes except quotes, which fails """
+
+    async def create_skill_completion(self, prompt:str, **kwargs) -> str:
+        if 'Quote' in prompt:
+            raise QuotesError("quotes could not be generated")
+        return "generated"
+
+    monkeypatch.setattr(SkillChain, 'create_skill_completion', create_skill_completion)
+
+
+def test_failing_skill_raises_its_own_error(failing_quotes):
+    with pytest.raises(QuotesError):
+        asyncio.run(SkillChain()(oai_client=None, skills=["keypoints", "quotes"], context=CONTEXT, document=DOCUMENT))
+
+
+def test_stream_error_event_names_the_failing_skill_error(failing_quotes, monkeypatch):
+    async def load_skill_inputs(filename, project_folder_name, document_store):
+        return CONTEXT, DOCUMENT
+
+    monkeypatch.setattr(skillchain, 'load_skill_inputs', load_skill_inputs)
+
+    async def run():
+        response = await stream_skills(
+            skills=["keypoints", "quotes"],
+            filename="client/project/document.pdf",
+            project_folder_name="client/project",
+            oai_client=None,
+            blob_client=None,
+            document_store=None
+        )
+        return [event async for event in response.body_iterator if event.startswith('event:')]
+
+    events = asyncio.run(run())
+    event, data = events[-1].split('\n')[:2]
+    assert event == "event: error"
+    assert json.loads(data.removeprefix('data: ')) == {"detail": "quotes could not be generated"}
@@ -0,0 +1,72 @@
+import time
+import asyncio
+
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from SolwayAPI.api.v1.core.utils import skillchain_helpers
+from SolwayAPI.api.v1.core.utils.cache_helpers import CompletionCache
+from SolwayAPI.api.v1.core.utils.rate_limit_helpers import AIMDConcurrencyLimiter, OpenAIRateLimiter
+from SolwayAPI.api.v1.core.utils.retry_helpers import RetryPolicy
+
+
+class SlowCompletions:
+    """ answers every chat completion after latency seconds """
+
+    def __init__(self, latency:float):
+        self.latency = latency
+        self.calls = 0
+
+
+    async def create(self, model:str, messages:list, **kwargs) -> ChatCompletion:
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        return ChatCompletion.model_validate({
+            "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": '{"answer": 1}'}}],
+        })
+
+
+def saturate_limiter(monkeypatch, concurrency:int, attempt_timeout:float) -> None:
+    limiter = OpenAIRateLimiter(
+        requests_per_minute=10000,
+        tokens_per_minute=10000000,
+        concurrency=AIMDConcurrencyLimiter(initial=concurrency, maximum=concurrency)
+    )
+    monkeypatch.setattr(skillchain_helpers, 'get_openai_rate_limiter', lambda: limiter)
+    monkeypatch.setattr(skillchain_helpers, 'llm_retry_policy', RetryPolicy(
+        max_attempts=1,
+        attempt_timeout=attempt_timeout,
+        deadline=attempt_timeout
+    ))
+
+
+def test_queueing_for_the_limiter_does_not_time_out_requests(monkeypatch):
+    """ 12 calls through 2 slots wait far longer than the attempt timeout, each request itself fits in it """
+    saturate_limiter(monkeypatch, concurrency=2, attempt_timeout=0.5)
+    completions = SlowCompletions(latency=0.3)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    async def run():
+        return await asyncio.gather(*[
+            skillchain_helpers.make_open_ai_request(client, "system", f"message {idx}", completion_cache=CompletionCache(bypass=True))
+            for idx in range(12)
+        ], return_exceptions=True)
+
+    responses = asyncio.run(run())
+    assert not [response for response in responses if isinstance(response, BaseException)]
+    assert completions.calls == 12
+
+
+def test_queueing_for_the_limiter_does_not_time_out_json_requests(monkeypatch):
+    saturate_limiter(monkeypatch, concurrency=2, attempt_timeout=0.5)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SlowCompletions(latency=0.3)))
+
+    async def run():
+        return await asyncio.gather(*[
+            skillchain_helpers.make_open_ai_json_request(client, "system", f"message {idx}", completion_cache=CompletionCache(bypass=True))
+            for idx in range(8)
+        ])
+
+    assert asyncio.run(run()) == [{"answer": 1}] * 8